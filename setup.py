@@ -23,6 +23,9 @@ setup(
         'Intended Audience :: Developers',
     ),
     description="Local resource allocation with shared/distributed locks",
+    entry_points={
+        'console_scripts': ['resource_locker_bench=resource_locker.bench:main'],
+    },
     include_package_data=True,
     install_requires=requirements,
     license='Apache 2.0',
@@ -1,10 +1,22 @@
 from ._version import __version__
 from resource_locker.core.lock import Lock
+from resource_locker.core.async_lock import AsyncLock
+from resource_locker.core.batch import LockBatch
 from resource_locker.core.exceptions import RequirementNotMet
 from resource_locker.core.requirement import Requirement
 from resource_locker.core.potential import Potential
+from resource_locker.core.prioritiser import RandomPrioritiser
+from resource_locker.core.prioritiser import HistoryPrioritiser
+from resource_locker.core.instrumentation import Instrumentation
+from resource_locker.core.instrumentation import LoggingInstrumentation
+from resource_locker.core.instrumentation import TraceInstrumentation
 from resource_locker.factories.redis import RedisLockFactory
 from resource_locker.factories.native import NativeLockFactory
+from resource_locker.factories.file import FileLockFactory
+from resource_locker.factories.sharded import ShardedRedisLockFactory
+from resource_locker.factories.sharded import QuorumRedisLockFactory
+from resource_locker.factories.async_redis import AsyncRedisLockFactory
+from resource_locker.factories.async_native import AsyncNativeLockFactory
 
 P = Potential
 R = Requirement
@@ -0,0 +1,3 @@
+from .bench import Scenario
+from .bench import run
+from .bench import main
@@ -0,0 +1,290 @@
+import argparse
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import random
+import sys
+import threading
+import time
+import uuid
+
+from resource_locker import connections
+from resource_locker.core.lock import Lock
+from resource_locker.core.prioritiser import HistoryPrioritiser
+from resource_locker.core.prioritiser import RandomPrioritiser
+from resource_locker.core.requirement import Requirement
+from resource_locker.factories.file import FileLockFactory
+from resource_locker.factories.native import NativeLockFactory
+from resource_locker.factories.redis import RedisLockFactory
+from resource_locker.reporter import RedisReporter
+
+"""Lock acquisition benchmarks
+
+Each client repeatedly locks `need` of a shared pool of resources, holds
+them, and lets them go. We measure acquisitions per second, time to
+acquire, lock server commands per acquisition, and how evenly the
+acquisitions were shared between clients.
+
+With `skew`, half of the acquisitions instead lock a single resource, picked
+with Zipf-like popularity, so that some resources of the pool are much
+busier than others.
+
+    python -m resource_locker.bench --clients 4,16 --need 1,2 --json results.json
+"""
+
+factories = ('native', 'redis', 'fake', 'file')
+# factories whose locks are visible to other processes
+shared_factories = ('redis', 'file')
+prioritisers = ('random', 'history')
+
+# failed attempts are expected under contention; only errors are of interest
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.ERROR)
+
+
+class Scenario:
+    def __init__(
+            self,
+            pool=8,
+            need=1,
+            clients=4,
+            acquisitions=20,
+            hold=0.01,
+            processes=False,
+            factory='redis',
+            lock_options=None,
+            skew=0,
+            prioritiser='random',
+    ):
+        if factory not in factories:
+            raise ValueError(f'factory {repr(factory)} not supported')
+        if prioritiser not in prioritisers:
+            raise ValueError(f'prioritiser {repr(prioritiser)} not supported')
+        if processes and factory not in shared_factories:
+            raise ValueError(f'{factory} locks cannot be shared between processes')
+        self.pool = pool
+        self.need = need
+        self.clients = clients
+        self.acquisitions = acquisitions
+        self.hold = hold
+        self.processes = processes
+        self.factory = factory
+        self.lock_options = lock_options or {}
+        self.skew = skew
+        self.prioritiser = prioritiser
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _fake_factory():
+    try:
+        import fakeredis
+    except ImportError:
+        raise RuntimeError('the fake lock server needs fakeredis[lua]')
+    return RedisLockFactory(client=fakeredis.FakeStrictRedis())
+
+
+def new_factory(name):
+    if name == 'native':
+        return NativeLockFactory()
+    if name == 'fake':
+        return _fake_factory()
+    if name == 'file':
+        return FileLockFactory()
+    return RedisLockFactory(client=connections.get_client('locks'))
+
+
+def _prioritiser(scenario):
+    if scenario.prioritiser == 'history':
+        return dict(prioritiser=HistoryPrioritiser(ttl=0.5), reporter_class=RedisReporter)
+    return dict(prioritiser=RandomPrioritiser())
+
+
+def _requirement(scenario, keys):
+    if scenario.skew and random.random() < 0.5:
+        popularity = [1 / (rank + 1) ** scenario.skew for rank in range(len(keys))]
+        return Requirement(*random.choices(keys, popularity))
+    return Requirement(*keys, need=scenario.need)
+
+
+def _client(scenario, keys, factory, results, prioritiser=None):
+    """Locks and unlocks for one client, adding its times to acquire to `results`"""
+    waits = []
+    options = dict(prioritiser or _prioritiser(scenario), **scenario.lock_options)
+    for _ in range(scenario.acquisitions):
+        lock = Lock(
+            _requirement(scenario, keys),
+            lock_factory=factory,
+            logger=logger,
+            **options,
+        )
+        with lock:
+            time.sleep(scenario.hold)
+        waits.append(lock.acquire_timer.duration)
+    results.append(waits)
+
+
+def _process_client(scenario, keys, results):
+    waits = []
+    _client(scenario, keys, new_factory(scenario.factory), waits)
+    results.put(waits[0])
+
+
+def _commands_processed(factory):
+    if not isinstance(factory, RedisLockFactory):
+        return None
+    try:
+        return int(factory.client.info('stats')['total_commands_processed'])
+    except Exception:
+        return None
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+def fairness(counts):
+    """Jain's fairness index: 1 when shared equally, 1/n when one client has everything"""
+    return sum(counts) ** 2 / (len(counts) * sum(c ** 2 for c in counts)) if any(counts) else None
+
+
+def run(scenario):
+    """Runs one scenario, returning its results as a dict"""
+    factory = new_factory(scenario.factory)
+    run_id = uuid.uuid4().hex[:8]
+    keys = [f'bench-{run_id}-{i}' for i in range(scenario.pool)]
+    prioritiser = _prioritiser(scenario)
+    before = _commands_processed(factory)
+
+    start = time.perf_counter()
+    if scenario.processes:
+        results = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(target=_process_client, args=(scenario, keys, results))
+            for _ in range(scenario.clients)
+        ]
+    else:
+        results = []
+        clients = [
+            threading.Thread(target=_client, args=(scenario, keys, factory, results, prioritiser))
+            for _ in range(scenario.clients)
+        ]
+    for client in clients:
+        client.start()
+    if scenario.processes:
+        results = [results.get() for _ in clients]
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+
+    after = _commands_processed(factory)
+    waits = list(itertools.chain.from_iterable(results))
+    total = len(waits)
+    # time spent by each client waiting; equal shares of the pool mean equal waits
+    per_client = [sum(w) for w in results]
+    return dict(
+        scenario=scenario.as_dict(),
+        acquisitions=total,
+        elapsed=elapsed,
+        acquisitions_per_second=total / elapsed,
+        time_to_acquire=dict(
+            mean=sum(waits) / total,
+            p50=percentile(waits, 50),
+            p95=percentile(waits, 95),
+            p99=percentile(waits, 99),
+        ),
+        commands_per_acquisition=(after - before - 1) / total if before is not None and after else None,
+        fairness=fairness(per_client),
+    )
+
+
+def _number(value, spec):
+    return 'n/a' if value is None else format(value, spec)
+
+
+def summary(result):
+    """One line describing a result"""
+    scenario = result['scenario']
+    return (
+        f'{scenario["factory"]:>6} {scenario["prioritiser"]} '
+        f'pool={scenario["pool"]} need={scenario["need"]} clients={scenario["clients"]}: '
+        f'{result["acquisitions_per_second"]:.1f}/s, '
+        f'p50 {result["time_to_acquire"]["p50"] * 1000:.1f}ms, '
+        f'p99 {result["time_to_acquire"]["p99"] * 1000:.1f}ms, '
+        f'fairness {_number(result["fairness"], ".3f")}, '
+        f'commands/acquisition {_number(result["commands_per_acquisition"], ".1f")}'
+    )
+
+
+def _ints(text):
+    return [int(v) for v in text.split(',')]
+
+
+def _option(text):
+    key, _, value = text.partition('=')
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return key, value
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m resource_locker.bench',
+        description='Measures lock acquisition throughput and latency; comma separated values run every combination',
+    )
+    parser.add_argument('--pool', type=_ints, default=[8], help='resources in the pool')
+    parser.add_argument('--need', type=_ints, default=[1], help='resources locked at a time')
+    parser.add_argument('--clients', type=_ints, default=[4], help='concurrent clients')
+    parser.add_argument('--acquisitions', type=int, default=20, help='acquisitions per client')
+    parser.add_argument('--hold', type=float, default=0.01, help='seconds each acquisition is held')
+    parser.add_argument('--processes', action='store_true', help='run clients as processes rather than threads')
+    parser.add_argument(
+        '--skew', type=float, default=0,
+        help='popularity skew; half the acquisitions lock one resource, ranked by popularity ** -skew',
+    )
+    parser.add_argument('--prioritiser', choices=prioritisers, nargs='+', default=['random'])
+    parser.add_argument('--factory', choices=factories, nargs='+', default=['redis'])
+    parser.add_argument('--redis-url', help='lock server, see resource_locker.connections')
+    parser.add_argument(
+        '--option', type=_option, action='append', default=[], metavar='KEY=VALUE',
+        help='Lock option, with a JSON value e.g. wake_on_release=true',
+    )
+    parser.add_argument('--json', metavar='PATH', help='write results as JSON, - for stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.redis_url:
+        connections.configure(url=args.redis_url)
+    results = []
+    combinations = itertools.product(args.factory, args.prioritiser, args.pool, args.need, args.clients)
+    for factory, prioritiser, pool, need, clients in combinations:
+        scenario = Scenario(
+            pool=pool,
+            need=need,
+            clients=clients,
+            acquisitions=args.acquisitions,
+            hold=args.hold,
+            processes=args.processes,
+            factory=factory,
+            lock_options=dict(args.option),
+            skew=args.skew,
+            prioritiser=prioritiser,
+        )
+        result = run(scenario)
+        results.append(result)
+        if args.json != '-':
+            print(summary(result))
+    if args.json == '-':
+        json.dump(results, sys.stdout, indent=2)
+    elif args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    return 0
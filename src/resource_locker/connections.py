@@ -0,0 +1,102 @@
+import os
+import threading
+
+from redis import BlockingConnectionPool
+from redis import ConnectionPool
+from redis import StrictRedis
+from redis.asyncio import BlockingConnectionPool as AsyncBlockingConnectionPool
+from redis.asyncio import ConnectionPool as AsyncConnectionPool
+from redis.asyncio import StrictRedis as AsyncStrictRedis
+
+"""Process-wide redis connection pools
+
+Lock factories, reporters and queries share one pool per role (database),
+instead of each opening their own connections. Pools are dropped in a
+child process after a fork, so that parent and child never share sockets.
+
+Configure once, before locking:
+
+    connections.configure(url='redis://locks.example:6379', max_connections=50)
+
+With max_connections, a thread finding all of a pool's connections in use
+waits up to pool_timeout seconds for one, then raises ConnectionError.
+
+Asyncio clients take the same settings, but get a pool of their own: their
+connections belong to the event loop they are made in.
+"""
+
+settings = dict(
+    url='redis://localhost:6379',
+    dbs=dict(locks=0, reports=1),
+    pool_options=dict(
+        max_connections=None,
+        socket_keepalive=True,
+        health_check_interval=30,
+    ),
+    pool_timeout=20,
+)
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def _forget_pools():
+    global _pid
+    _pools.clear()
+    _pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pools)
+
+
+def configure(url=None, locks_db=None, reports_db=None, pool_timeout=None, **pool_options):
+    """Changes connection settings; pools already handed out keep their settings
+
+    The shared RedisLockFactory, and reporters' background aggregators, move to the new pools.
+    """
+    with _pools_lock:
+        if url is not None:
+            settings['url'] = url
+        if pool_timeout is not None:
+            settings['pool_timeout'] = pool_timeout
+        if locks_db is not None:
+            settings['dbs']['locks'] = locks_db
+        if reports_db is not None:
+            settings['dbs']['reports'] = reports_db
+        settings['pool_options'].update(pool_options)
+        for pool in _pools.values():
+            pool.disconnect(inuse_connections=False)
+        _pools.clear()
+
+
+def _new_pool(role, pool_class, blocking_pool_class):
+    options = {k: v for k, v in settings['pool_options'].items() if v is not None}
+    if options.get('max_connections'):
+        # wait for a connection to be returned, rather than fail at once
+        pool_class = blocking_pool_class
+        options['timeout'] = settings['pool_timeout']
+    return pool_class.from_url(settings['url'], db=settings['dbs'][role], **options)
+
+
+def get_pool(role='locks'):
+    """The shared pool for a role: 'locks' or 'reports'"""
+    with _pools_lock:
+        if _pid != os.getpid():
+            _forget_pools()
+        if role not in _pools:
+            _pools[role] = _new_pool(role, ConnectionPool, BlockingConnectionPool)
+        return _pools[role]
+
+
+def get_client(role='locks'):
+    """A client using the shared pool for a role"""
+    return StrictRedis(connection_pool=get_pool(role))
+
+
+def get_async_client(role='locks'):
+    """A new asyncio client for a role, owning a pool with the current settings; close it with `aclose`"""
+    with _pools_lock:
+        pool = _new_pool(role, AsyncConnectionPool, AsyncBlockingConnectionPool)
+    return AsyncStrictRedis.from_pool(pool)
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack
+
+import retrying
+
+from .exceptions import RequirementNotMet
+from .lock import Lock
+from resource_locker.factories.async_redis import AsyncRedisLockFactory
+from resource_locker.reporter import DummyReporter
+
+
+class AsyncLock(Lock):
+    """A Lock for use within an asyncio event loop
+
+    Takes the same requirements and options as Lock, with an asynchronous lock factory; by default the
+    running event loop's shared AsyncRedisLockFactory, so it must then be made within the loop.
+    Retries wait with asyncio.sleep, and reporters are run in the loop's default executor.
+    Fair queueing is not supported.
+    """
+    def __init__(self, *requirements, lock_factory=None, **params):
+        super().__init__(*requirements, lock_factory=lock_factory or AsyncRedisLockFactory.shared(), **params)
+
+    async def _report(self, *calls):
+        """Sends a batch of (method, args, tags) reporter calls"""
+        if not calls or isinstance(self.reporter_class(), DummyReporter):
+            return
+        with self._span('report'):
+            await asyncio.get_running_loop().run_in_executor(None, self._send_reports, calls)
+
+    async def _acquire_one(self, potential):
+        if self._is_settled(potential):
+            return
+        lock = self.lock_factory.new_lock(potential.key, **self.options)
+        self.logger.info('getting %s, timeout %s', potential.key, self.timeout)
+        await self._report(('lock_requested', (), potential.tags))
+        with self._span('acquire_one', key=potential.key) as span:
+            acquired = await lock.acquire(**self._acquire_kwargs())
+            span.set('acquired' if acquired else 'failed')
+        if not acquired:
+            await self._report(('lock_failed', (), potential.tags))
+        self._settle_one(potential, lock, acquired)
+
+    async def _acquire_many(self, requirement, potentials):
+        pending, need = self._pending(requirement, potentials)
+        if need <= 0 or not pending:
+            return
+        with self._span('acquire_many', keys=len(pending), need=need) as span:
+            obtained = dict(await self.lock_factory.acquire_many([p.key for p in pending], need, **self.options))
+            span.set('acquired' if obtained else 'failed', obtained=len(obtained))
+        calls = []
+        for potential in self._settle_many(pending, obtained):
+            calls.append(('lock_requested', (), potential.tags))
+            if potential.is_rejected:
+                calls.append(('lock_failed', (), potential.tags))
+        await self._report(*calls)
+
+    async def _acquire_all(self):
+        for requirement in self._requirements:
+            if requirement.validate().is_fulfilled:
+                continue
+            with self._span('get_lock_list', keys=len(requirement.potentials)) as span:
+                known_locked = await self.lock_factory.locked_among([p.key for p in requirement.potentials])
+                span.set(locked=len(known_locked))
+            potentials = self._candidates(requirement, known_locked)
+            if self._acquire_many_enabled:
+                await self._acquire_many(requirement, potentials)
+            for potential in potentials:
+                if requirement.validate() and requirement.is_fulfilled:
+                    break
+                await self._acquire_one(potential=potential)
+            # this will 'never' be False
+            complete = requirement.validate() and requirement.is_fulfilled
+            assert complete
+        return self._requirements
+
+    async def _release_locks(self, locks):
+        for partial in locks:
+            try:
+                await partial.release()
+            except Exception:
+                self.logger.exception('partial lock release failed, lock state may be affected:')
+
+    async def _release_all(self):
+        with self._span('release_all', locks=len(self._obtained)):
+            await self._release_locks(self._obtained)
+        self._obtained.clear()
+        self._held.clear()
+        for r in self._requirements:
+            r.reset()
+
+    async def _acquire_or_release(self):
+        self._attempts += 1
+        with self._span('attempt', attempt=self._attempts):
+            if not self._requirements:
+                return self._requirements
+            async with AsyncExitStack() as stack:
+                guards = self._guards()
+                with self._span('lock_of_locks', guards=len(guards)):
+                    for guard in guards:
+                        await stack.enter_async_context(guard)
+                try:
+                    return await self._acquire_all()
+                except Exception as e:
+                    unkept = self._partial_release() if isinstance(e, RequirementNotMet) else None
+                    if unkept is None:
+                        self.logger.warning('lock acquisition failed, releasing all partial locks')
+                        await self._release_all()
+                    else:
+                        await self._release_locks(unkept)
+                    raise
+
+    async def _ttl_aware(self, wait):
+        """As Lock._ttl_aware, in seconds"""
+        try:
+            lapse = self._until_lapse(await self.lock_factory.get_lock_states(sorted(self._unique_keys, key=str)))
+        except Exception:
+            self.logger.exception('lock states unavailable, backing off:')
+            return wait
+        return wait if lapse is None else min(wait, lapse)
+
+    async def _retry(self, listener):
+        """As retrying.Retrying.call, sleeping (or listening for releases) without blocking the loop"""
+        retryer = retrying.Retrying(**self._retry_options())
+        start = time.monotonic()
+        attempt_number = 1
+        while True:
+            try:
+                return await self._acquire_or_release()
+            except Exception as e:
+                delay = (time.monotonic() - start) * 1000
+                if not self.options['retry_on_exception'](e) or retryer.stop(attempt_number, delay):
+                    raise
+                with self._span('retry_wait', attempt=attempt_number):
+                    wait = retryer.wait(attempt_number, delay) / 1000
+                    if self.options['ttl_aware_wait'] and self._unique_keys:
+                        wait = await self._ttl_aware(wait)
+                    if listener:
+                        await listener.wait(wait)
+                    else:
+                        await asyncio.sleep(wait)
+                attempt_number += 1
+
+    async def acquire(self):
+        """Acquire the Lock as configured"""
+        self._holding_since = None
+        self._attempts = 0
+        with self._span('acquire', keys=len(self._unique_keys)) as span:
+            with self.acquire_timer:
+                async with AsyncExitStack() as stack:
+                    listener = None
+                    if self.options['wake_on_release'] and self._unique_keys:
+                        listener = await stack.enter_async_context(
+                            self.lock_factory.release_listener(sorted(self._unique_keys, key=str))
+                        )
+                    try:
+                        success = await self._retry(listener)
+                    except Exception:
+                        await self._release_all()
+                        raise
+                    finally:
+                        span.set(attempts=self._attempts)
+            await self._report(*[
+                ('lock_success', (self.acquire_timer.duration,), p.tags) for p in self._all_fulfilled_iter()
+            ])
+        self.release_timer.start()
+        return success
+
+    async def release(self):
+        """Release the Lock"""
+        self.release_timer.stop()
+        with self._span('release', keys=len(self._obtained)):
+            await self._report(*[
+                ('lock_released', (self.release_timer.duration,), p.tags) for p in self._all_fulfilled_iter()
+            ])
+            await self._release_all()
+
+    def __enter__(self):
+        raise TypeError('AsyncLock must be used with `async with`')
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def __aenter__(self):
+        return await self.acquire()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
@@ -0,0 +1,163 @@
+import logging
+from contextlib import ExitStack
+
+from .lock import Lock
+from .lock import guard_keys
+from resource_locker.factories.redis import RedisLockFactory
+from resource_locker.reporter import Timer
+
+"""Acquiring many independent Locks at once
+
+A scheduler with many requests to place would otherwise acquire a Lock for
+each in turn, each taking the lock of locks, listing locked keys and taking
+its keys separately. A LockBatch does each of these once for all of its
+pending requests: it assigns free keys to requests, then takes every
+assigned request's keys in one batched operation.
+
+Assignment is greedy: heavier requests first, then those needing fewest
+keys (to satisfy as many as possible), each taking the free candidates that
+the fewest other requests want. It is not guaranteed to be optimal.
+"""
+
+
+class Request:
+    """A Lock in a batch, with its weight"""
+    __slots__ = ('lock', 'weight', 'order', 'acquired')
+
+    def __init__(self, lock, weight, order):
+        self.lock = lock
+        self.weight = weight
+        self.order = order
+        self.acquired = False
+
+    @property
+    def size(self):
+        return sum(r.need for r in self.lock._requirements)
+
+    def candidates(self):
+        return {str(p.key) for r in self.lock._requirements for p in r.potentials}
+
+
+def assign(requests, known_locked, prioritiser=None):
+    """Chooses, for as many requests as it can, potentials to fulfil all their requirements
+
+    Returns {request: [(requirement, potentials), ...]}, for the requests that can be fulfilled with keys
+    that are neither known to be locked nor chosen for another request.
+    """
+    demand = {}
+    for request in requests:
+        for key in request.candidates():
+            demand[key] = demand.get(key, 0) + 1
+    taken = set(known_locked)
+    assignment = {}
+    for request in sorted(requests, key=lambda r: (-r.weight, r.size, r.order)):
+        chosen = []
+        tentative = set()
+        for requirement in request.lock._requirements:
+            # sorted is stable, so the prioritiser's order breaks ties
+            free = sorted(
+                (p for p in requirement.prioritised_potentials(known_locked, prioritiser)
+                 if str(p.key) not in taken and str(p.key) not in tentative),
+                key=lambda p: demand[str(p.key)],
+            )[:requirement.need]
+            if len(free) < requirement.need:
+                break
+            tentative.update(str(p.key) for p in free)
+            chosen.append((requirement, free))
+        else:
+            taken.update(tentative)
+            assignment[request] = chosen
+    return assignment
+
+
+class LockBatch:
+    """Acquires many independent Locks together, e.g. once per scheduling tick
+
+    Requests are added with `add`, each a Lock over its requirements, taking the batch's lock options.
+    `acquire` tries all pending requests at once, and may be called again to retry those left unmet.
+    """
+    def __init__(self, lock_factory=None, reporter_class=None, **params):
+        self.lock_factory = lock_factory or RedisLockFactory.shared()
+        self.reporter_class = reporter_class
+        self.params = params
+        self.logger = params.get('logger', logging.getLogger(__name__))
+        self.requests = []
+
+    def add(self, *requirements, weight=1):
+        """Adds a request, returning its Lock; heavier requests are assigned keys first"""
+        lock = Lock(
+            *requirements, block=False, lock_factory=self.lock_factory, reporter_class=self.reporter_class,
+            **self.params,
+        )
+        self.requests.append(Request(lock, weight, len(self.requests)))
+        return lock
+
+    @property
+    def pending(self):
+        return [request for request in self.requests if not request.acquired]
+
+    def _guards(self, pending):
+        options = pending[0].lock.options
+        keys = guard_keys(
+            options['concurrency'], set().union(*(r.candidates() for r in pending)), options['lock_of_locks_stripes'],
+        )
+        return [self.lock_factory.new_lock(key, expire=60) for key in keys]
+
+    def acquire(self):
+        """Tries to acquire every pending request, returning per request its requirements if held, else None"""
+        pending = self.pending
+        if pending:
+            for request in pending:
+                request.lock.acquire_timer = Timer().start()
+            with ExitStack() as stack:
+                for guard in self._guards(pending):
+                    stack.enter_context(guard)
+                known_locked = self.lock_factory.locked_among(sorted(set().union(*(r.candidates() for r in pending))))
+                assignment = assign(pending, known_locked, pending[0].lock.options['prioritiser'])
+                self._commit(assignment)
+        return [request.lock._requirements if request.acquired else None for request in self.requests]
+
+    def _commit(self, assignment):
+        """Takes the assigned keys of all requests in one operation, and settles each request's outcome"""
+        requests = list(assignment)
+        if not requests:
+            return
+        groups = [[p.key for _, potentials in assignment[request] for p in potentials] for request in requests]
+        results = self.lock_factory.acquire_groups(groups, **requests[0].lock.options)
+        for request, keys, obtained in zip(requests, groups, results):
+            lock = request.lock
+            obtained = dict(obtained)
+            won = len(obtained) == len(keys)
+            calls = []
+            for requirement, potentials in assignment[request]:
+                for potential in potentials:
+                    calls.append(('lock_requested', (), potential.tags))
+                    if not won:
+                        calls.append(('lock_failed', (), potential.tags))
+            lock._report(*calls)
+            if not won:
+                # taken by someone else since the lock list was read
+                self.logger.info('batched request for %s lost a race', [str(k) for k in lock._unique_keys])
+                continue
+            for requirement, potentials in assignment[request]:
+                for potential in potentials:
+                    lock._settle_one(potential, obtained[potential.key], True)
+                requirement.validate()
+            request.acquired = True
+            lock.acquire_timer.stop()
+            lock._report_acquired()
+            lock.release_timer.start()
+
+    def release(self):
+        """Releases every request held"""
+        for request in self.requests:
+            if request.acquired:
+                request.lock.release()
+                request.acquired = False
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
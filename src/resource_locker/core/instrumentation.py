@@ -0,0 +1,128 @@
+import collections
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+"""Timing of the phases of locking
+
+A Lock given an `instrumentation` opens a span for each phase: the whole
+acquisition, each attempt, waiting for the locks of locks, listing locked
+keys, taking keys, reporting, sleeping between attempts, and releasing.
+Spans are timed with perf_counter_ns and nest, each knowing its parent.
+Without an instrumentation, no spans are made at all.
+"""
+
+_current = contextvars.ContextVar('resource_locker_span', default=None)
+
+
+class Instrumentation:
+    """Receives spans as they start and end; ignores them, unless overridden"""
+    def span_started(self, span):
+        pass
+
+    def span_ended(self, span):
+        pass
+
+
+class Span:
+    """A timed phase, with attributes and an outcome: 'ok', as set, or the name of the exception raised"""
+    __slots__ = ('instrumentation', 'name', 'attributes', 'outcome', 'parent', 'start_ns', 'end_ns', '_token')
+
+    def __init__(self, instrumentation, name, attributes):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.outcome = None
+        self.parent = None
+        self.start_ns = None
+        self.end_ns = None
+        self._token = None
+
+    def set(self, outcome=None, **attributes):
+        if outcome is not None:
+            self.outcome = outcome
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ns(self):
+        return None if self.end_ns is None else self.end_ns - self.start_ns
+
+    def __enter__(self):
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        self.start_ns = time.perf_counter_ns()
+        self.instrumentation.span_started(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.end_ns = time.perf_counter_ns()
+        _current.reset(self._token)
+        if exc_type is not None and self.outcome is None:
+            self.outcome = exc_type.__name__
+        self.outcome = self.outcome or 'ok'
+        self.instrumentation.span_ended(self)
+
+
+class NoSpan:
+    """Stands in for a span when there is no instrumentation"""
+    __slots__ = ()
+
+    def set(self, outcome=None, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+no_span = NoSpan()
+
+
+class LoggingInstrumentation(Instrumentation):
+    """Logs each span as it ends, its fields also given as the record's `span` attribute"""
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+    def span_ended(self, span):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        fields = dict(
+            name=span.name,
+            outcome=span.outcome,
+            duration_ms=span.duration_ns / 1e6,
+            parent=span.parent.name if span.parent else None,
+            **span.attributes,
+        )
+        self.logger.log(self.level, '%s %s in %.3fms %s', span.name, span.outcome, fields['duration_ms'],
+                        span.attributes, extra={'span': fields})
+
+
+class TraceInstrumentation(Instrumentation):
+    """Keeps the last `max_events` spans as Trace Event Format events, as read by Perfetto or chrome://tracing"""
+    def __init__(self, max_events=100000):
+        self._events = collections.deque(maxlen=max_events)
+
+    def span_ended(self, span):
+        self._events.append(dict(
+            name=span.name,
+            cat='resource_locker',
+            ph='X',
+            ts=span.start_ns / 1000,
+            dur=span.duration_ns / 1000,
+            pid=os.getpid(),
+            tid=threading.get_ident(),
+            args=dict(span.attributes, outcome=span.outcome),
+        ))
+
+    def events(self):
+        return list(self._events)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(dict(traceEvents=self.events(), displayTimeUnit='ms'), f, default=str)
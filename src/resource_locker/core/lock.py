@@ -1,8 +1,15 @@
 import logging
+import time
+import uuid
+import zlib
+from contextlib import ExitStack
+from contextlib import contextmanager
 
 import retrying
 
 from .exceptions import RequirementNotMet
+from .instrumentation import Span
+from .instrumentation import no_span
 from .requirement import Requirement
 from resource_locker.factories.meta import LockFactoryMeta
 from resource_locker.factories.redis import RedisLockFactory
@@ -11,8 +18,23 @@ from resource_locker.reporter import Timer
 from resource_locker.reporter import DummyReporter
 
 
+def guard_keys(concurrency, keys, stripes, lock_of_locks_key='lock_of_locks'):
+    """Keys of the locks of locks needed to take `keys`, in acquisition order"""
+    if concurrency == 'global':
+        return [lock_of_locks_key]
+    if concurrency == 'striped':
+        return [
+            f'{lock_of_locks_key}:{stripe}'
+            for stripe in sorted({zlib.crc32(str(key).encode()) % stripes for key in keys})
+        ]
+    return []
+
+
 class Lock:
     lock_of_locks_key = 'lock_of_locks'
+    concurrency_modes = {'global', 'striped', 'ordered'}
+    # seconds allowed, after a lease's ttl runs out, for it to lapse
+    lapse_margin = 0.01
 
     def __init__(self, *requirements, block=True, lock_factory=None, reporter_class=None, **params):
         self.options = dict(
@@ -21,6 +43,13 @@ class Lock:
             auto_renewal=True,
             expire=120,
             timeout=None,
+            # how concurrent acquisitions are kept apart:
+            # global: one lock of locks for all clients
+            # striped: lock of locks stripes, chosen by the requested keys, taken in order
+            # ordered: no lock of locks; blocking acquisition takes keys in sorted order
+            # clients using different modes are not kept apart from each other
+            concurrency='global',
+            lock_of_locks_stripes=64,
             # retry configuration (see https://pypi.python.org/pypi/retrying)
             stop_max_delay=300000,  # 300 * 1000 milliseconds = 5 minutes
             wait_exponential_max=5000,
@@ -28,6 +57,25 @@ class Lock:
             wait_random_min=100,
             wait_random_max=1000,
             retry_on_exception=lambda x:  isinstance(x, RequirementNotMet),
+            # retry as soon as a wanted key is released, the backoff becoming an upper bound on waiting
+            wake_on_release=False,
+            # retry as soon as the first lease among the wanted keys lapses, if that is sooner than the backoff;
+            # costs a look up of the keys' leases per retry, worthwhile when holders' leases are short and not renewed
+            ttl_aware_wait=False,
+            # seconds for which locks already won may be kept while retrying for the rest, 0 to release them all
+            # between attempts; only locks ordered (by key) before every key still wanted are kept, so that
+            # clients waiting while holding locks cannot deadlock
+            hold_while_waiting=0,
+            # reclaim locks (between attempts) from holders that are gone: those whose process exited on this host,
+            # or those elsewhere that missed this many heartbeats; 0 never to reclaim, see the factory's `reclaim`
+            reclaim_after=0,
+            # serve waiters first come first served, per pool of resources; waiting tickets lapse after fair_ttl
+            fair=False,
+            fair_ttl=30,
+            # orders each requirement's candidates, see resource_locker.core.prioritiser
+            prioritiser=None,
+            # receives timed spans for each phase of locking, see resource_locker.core.instrumentation
+            instrumentation=None,
         )
         self.options.update(params)
 
@@ -36,12 +84,28 @@ class Lock:
             self.options['stop_max_attempt_number'] = 0
 
         self.timeout = self.options['timeout']
+        self.concurrency = self.options['concurrency']
+        if self.concurrency not in self.concurrency_modes:
+            raise ValueError(
+                f'concurrency must be one of {sorted(self.concurrency_modes)}, got {repr(self.concurrency)}'
+            )
         self.logger = self.options['logger']
+        self.instrumentation = self.options['instrumentation']
 
         self.reporter_class = reporter_class or DummyReporter
-        self.lock_factory = lock_factory or RedisLockFactory()
+        self.lock_factory = lock_factory or RedisLockFactory.shared()
+        if self.options['fair'] and not self.lock_factory.supports_fair_queue:
+            raise ValueError(f'{type(self.lock_factory).__name__} does not support fair queueing')
 
+        # a factory that can take several keys in one operation is used for non-blocking requirements
+        self._acquire_many_enabled = self.lock_factory.supports_acquire_many and not self.timeout
         self._obtained = []
+        # key: lock, for the locks in _obtained
+        self._held = {}
+        self._holding_since = None
+        self._ticket = None
+        self._attempts = 0
+        self._waiting = None
         self._unique_keys = set()
         self._lol = self.lock_factory.new_lock(self.lock_of_locks_key, expire=60, auto_renewal=bool(self.timeout))
         self._requirements = []
@@ -51,6 +115,12 @@ class Lock:
         self.acquire_timer = Timer()
         self.release_timer = Timer()
 
+    def _span(self, name, **attributes):
+        """A span timing a phase of locking, if instrumented"""
+        if self.instrumentation is None:
+            return no_span
+        return Span(self.instrumentation, name, attributes)
+
     def add_requirement(self, req):
         if not isinstance(req, Requirement):
             req = Requirement(req, need=self.options.get('need'))
@@ -61,37 +131,122 @@ class Lock:
             self._unique_keys.add(p.key)
         self._requirements.append(req)
 
+    def _guard_keys(self):
+        """Keys of the locks of locks needed for this Lock, in acquisition order"""
+        return guard_keys(
+            self.concurrency, self._unique_keys, self.options['lock_of_locks_stripes'], self.lock_of_locks_key,
+        )
+
+    def _guards(self):
+        if self.concurrency == 'global':
+            return [self._lol]
+        return [
+            self.lock_factory.new_lock(key, expire=60, auto_renewal=bool(self.timeout))
+            for key in self._guard_keys()
+        ]
+
     def _all_fulfilled_iter(self):
         for r in self._requirements:
             for p in r.fulfilled:
                 yield p
 
-    def _acquire_one(self, potential):
+    def _is_settled(self, potential):
         if potential.is_fulfilled or potential.is_rejected:
             self.logger.info(
                 'potential %s is already %s',
                 potential,
                 'fulfilled' if potential.is_fulfilled else 'rejected'
             )
-            return
-        lock = self.lock_factory.new_lock(potential.key, **self.options)
+            return True
+        return False
+
+    def _acquire_kwargs(self):
         acq_kwargs = dict(blocking=bool(self.timeout))
         if self.timeout:
             acq_kwargs.update(dict(timeout=self.timeout))
-        self.logger.info('getting %s, timeout %s', potential.key, self.timeout)
-        reporter = self.reporter_class(**potential.tags)
-        reporter.lock_requested()
-        if lock.acquire(**acq_kwargs):
+        return acq_kwargs
+
+    def _settle_one(self, potential, lock, acquired):
+        if acquired:
             potential.fulfill()
             self._obtained.append(lock)
+            self._held[potential.key] = lock
         else:
-            reporter.lock_failed()
             potential.reject()
             self.logger.warning('didnt get lock %s', potential.key)
 
+    def _acquire_one(self, potential):
+        if self._is_settled(potential):
+            return
+        lock = self.lock_factory.new_lock(potential.key, **self.options)
+        self.logger.info('getting %s, timeout %s', potential.key, self.timeout)
+        with self._span('report'):
+            reporter = self.reporter_class(**potential.tags)
+            reporter.lock_requested()
+        with self._span('acquire_one', key=potential.key) as span:
+            acquired = lock.acquire(**self._acquire_kwargs())
+            span.set('acquired' if acquired else 'failed')
+        if not acquired:
+            with self._span('report'):
+                reporter.lock_failed()
+        self._settle_one(potential, lock, acquired)
+
+    def _pending(self, requirement, potentials):
+        """Potentials yet to be tried, and how many more of them are needed"""
+        pending = [p for p in potentials if not (p.is_fulfilled or p.is_rejected)]
+        need = requirement.need - requirement.count()[0]
+        if need > 0 and pending:
+            self.logger.info('getting %s of %s', need, [p.key for p in pending])
+        return pending, need
+
+    def _settle_many(self, pending, obtained):
+        """Applies the outcome of acquire_many, returning the examined potentials"""
+        # potentials beyond the last obtained key were never examined
+        examined = pending
+        if obtained:
+            examined = pending[:max(i for i, p in enumerate(pending) if p.key in obtained) + 1]
+        for potential in examined:
+            self._settle_one(potential, obtained.get(potential.key), potential.key in obtained)
+        return examined
+
+    def _acquire_many(self, requirement, potentials):
+        pending, need = self._pending(requirement, potentials)
+        if need <= 0 or not pending:
+            return
+        with self._span('acquire_many', keys=len(pending), need=need) as span:
+            obtained = dict(self.lock_factory.acquire_many([p.key for p in pending], need, **self.options))
+            span.set('acquired' if obtained else 'failed', obtained=len(obtained))
+        calls = []
+        for potential in self._settle_many(pending, obtained):
+            calls.append(('lock_requested', (), potential.tags))
+            if potential.is_rejected:
+                calls.append(('lock_failed', (), potential.tags))
+        self._report(*calls)
+
+    def _candidates(self, requirement, known_locked):
+        potentials = requirement.prioritised_potentials(known_locked, self.options['prioritiser'])
+        if self.timeout and self.concurrency == 'ordered':
+            # blocking on keys in a global order prevents deadlock without a lock of locks
+            potentials.sort(key=lambda p: str(p.key))
+        return potentials
+
     def _acquire_all(self):
         for requirement in self._requirements:
-            for potential in requirement.prioritised_potentials(self.lock_factory.get_lock_list()):
+            if requirement.validate().is_fulfilled:
+                # met by locks kept from an earlier attempt
+                continue
+            with self._span('get_lock_list', keys=len(requirement.potentials)) as span:
+                known_locked = self.lock_factory.locked_among([p.key for p in requirement.potentials])
+                span.set(locked=len(known_locked))
+            if known_locked and self.options['reclaim_after'] and self.lock_factory.supports_reclaim:
+                with self._span('reclaim', keys=len(known_locked)) as span:
+                    reclaimed = set(self.lock_factory.reclaim(known_locked, missed=self.options['reclaim_after']))
+                    span.set(reclaimed=len(reclaimed))
+                known_locked = [key for key in known_locked if key not in reclaimed]
+            potentials = self._candidates(requirement, known_locked)
+            if self._acquire_many_enabled:
+                self._acquire_many(requirement, potentials)
+            for potential in potentials:
                 if requirement.validate() and requirement.is_fulfilled:
                     break
                 self._acquire_one(potential=potential)
@@ -100,32 +255,154 @@ class Lock:
             assert complete
         return self._requirements
 
-    def _release_all(self):
-        for partial in self._obtained:
+    def _release_locks(self, locks):
+        for partial in locks:
             try:
                 partial.release()
             except Exception:
                 self.logger.exception('partial lock release failed, lock state may be affected:')
+
+    def _release_all(self):
+        with self._span('release_all', locks=len(self._obtained)):
+            self._release_locks(self._obtained)
         self._obtained.clear()
+        self._held.clear()
         for r in self._requirements:
             r.reset()
 
+    def _kept_keys(self):
+        """Keys of the locks held that come before every key still wanted, in the global (str) order"""
+        wanted = [
+            str(p.key)
+            for r in self._requirements if not r.is_fulfilled
+            for p in r.potentials if not p.is_fulfilled
+        ]
+        if not wanted:
+            return set()
+        first_wanted = min(wanted)
+        return {key for key in self._held if str(key) < first_wanted}
+
+    def _partial_release(self):
+        """Keeps what locks may be held while retrying, returning the others, or None if all must go"""
+        budget = self.options['hold_while_waiting']
+        if not budget:
+            return None
+        now = time.monotonic()
+        if self._holding_since is None:
+            self._holding_since = now
+        elif now - self._holding_since > budget:
+            return None
+        keep = self._kept_keys()
+        if not keep:
+            return None
+        unkept = [lock for key, lock in self._held.items() if key not in keep]
+        self._held = {key: lock for key, lock in self._held.items() if key in keep}
+        self._obtained = list(self._held.values())
+        for r in self._requirements:
+            r.reset(keep=keep)
+        self.logger.info('lock acquisition failed, keeping %s while retrying', sorted(keep, key=str))
+        return unkept
+
+    @contextmanager
+    def _queued(self):
+        """Holds a place in the queue of each requirement's pool while acquiring"""
+        self._ticket = (uuid.uuid4().hex, time.time())
+        try:
+            yield
+        finally:
+            self._leave_queues()
+
+    def _leave_queues(self):
+        if self._ticket is None:
+            return
+        for r in self._requirements:
+            self.lock_factory.dequeue(r.signature, self._ticket[0])
+        self._ticket = None
+
+    def _check_queues(self):
+        """Raises unless each requirement's pool has enough free for it, after the needs of earlier tickets"""
+        ticket, score = self._ticket
+        # every queue is visited, so that the ticket joins and stays alive in all of them
+        ahead = [
+            self.lock_factory.queued_ahead(r.signature, ticket, score, r.need, self.options['fair_ttl'])
+            for r in self._requirements
+        ]
+        if not any(ahead):
+            return
+        locked = set(self.lock_factory.locked_among(sorted(self._unique_keys, key=str))) - set(self._held)
+        for r, need in zip(self._requirements, ahead):
+            free = sum(1 for p in r.potentials if p.key not in locked)
+            if free - need < r.need:
+                raise RequirementNotMet('queued behind earlier requests')
+
     def _acquire_or_release(self):
-        # simultaneous locking
-        # alternatively, try ordered locking
-        if not self._requirements:
-            return self._requirements
-        with self._lol:
+        # simultaneous locking under the lock(s) of locks, or ordered locking without
+        self._end_wait()
+        self._attempts += 1
+        with self._span('attempt', attempt=self._attempts):
+            if not self._requirements:
+                return self._requirements
+            with ExitStack() as stack:
+                guards = self._guards()
+                with self._span('lock_of_locks', guards=len(guards)):
+                    for guard in guards:
+                        stack.enter_context(guard)
+                try:
+                    # checked under the lock(s) of locks, and left on success, so that no holder also counts as queued
+                    if self._ticket:
+                        self._check_queues()
+                    acquired = self._acquire_all()
+                    self._leave_queues()
+                    return acquired
+                except Exception as e:
+                    unkept = self._partial_release() if isinstance(e, RequirementNotMet) else None
+                    if unkept is None:
+                        self.logger.warning('lock acquisition failed, releasing all partial locks')
+                        self._release_all()
+                    else:
+                        self._release_locks(unkept)
+                    raise
+
+    def _timed_wait(self, backoff):
+        """Times each retry wait, as a span lasting until the next attempt"""
+        def wait(attempt_number, delay_since_first_attempt_ms):
+            self._waiting = self._span('retry_wait', attempt=attempt_number)
+            self._waiting.__enter__()
+            return backoff(attempt_number, delay_since_first_attempt_ms)
+        return wait
+
+    def _end_wait(self):
+        waiting, self._waiting = self._waiting, None
+        if waiting is not None:
+            waiting.__exit__(None, None, None)
+
+    def _until_lapse(self, states):
+        """Seconds until the first of the given LockStates' leases lapses, if any will"""
+        ttls = [state.ttl for state in states.values() if state.ttl is not None]
+        return max(min(ttls), 0) + self.lapse_margin if ttls else None
+
+    def _ttl_aware(self, backoff):
+        """Shortens a retry wait to end as the first lease among the wanted keys lapses"""
+        def wait(attempt_number, delay_since_first_attempt_ms):
+            delay = backoff(attempt_number, delay_since_first_attempt_ms)
             try:
-                return self._acquire_all()
+                lapse = self._until_lapse(self.lock_factory.get_lock_states(sorted(self._unique_keys, key=str)))
             except Exception:
-                self.logger.warning('lock acquisition failed, releasing all partial locks')
-                self._release_all()
-                raise
+                self.logger.exception('lock states unavailable, backing off:')
+                return delay
+            return delay if lapse is None else min(delay, lapse * 1000)
+        return wait
 
-    def acquire(self):
-        """Acquire the Lock as configured"""
-        opts = {k: v for k, v in self.options.items() if k in {
+    @staticmethod
+    def _wake_or_wait(backoff, listener):
+        """Replaces a retry wait with waiting for a relevant release, for no longer than the backoff"""
+        def wait(attempt_number, delay_since_first_attempt_ms):
+            listener.wait(backoff(attempt_number, delay_since_first_attempt_ms) / 1000)
+            return 0
+        return wait
+
+    def _retry_options(self):
+        return {k: v for k, v in self.options.items() if k in {
             'stop_max_delay',
             'stop_max_attempt_number',
             'wait_exponential_max',
@@ -136,19 +413,72 @@ class Lock:
             'retry_on_exception',
             'wrap_exception',
         }}
-        with self.acquire_timer:
-            success = retrying.Retrying(**opts).call(self._acquire_or_release)
-        for p in self._all_fulfilled_iter():
-            self.reporter_class(**p.tags).lock_success(self.acquire_timer.duration)
+
+    def _send_reports(self, calls):
+        """Makes (method, args, tags) reporter calls, in one batch if the reporter has `batch`"""
+        reporter = self.reporter_class()
+        if not hasattr(reporter, 'batch'):
+            # reporters without batching take the tags when made, and may predate some reports
+            for method, args, tags in calls:
+                report = getattr(self.reporter_class(**tags), method, None)
+                if report is not None:
+                    report(*args)
+            return
+        with reporter.batch():
+            for method, args, tags in calls:
+                getattr(reporter, method)(*args, **tags)
+
+    def _report(self, *calls):
+        if calls:
+            with self._span('report'):
+                self._send_reports(calls)
+
+    def _report_acquired(self):
+        calls = [('lock_success', (self.acquire_timer.duration,), p.tags) for p in self._all_fulfilled_iter()]
+        if self.options['fair']:
+            calls.extend(('lock_queued', (self.acquire_timer.duration,), dict(need=r.need)) for r in self._requirements)
+        self._report(*calls)
+
+    def acquire(self):
+        """Acquire the Lock as configured"""
+        retryer = retrying.Retrying(**self._retry_options())
+        # the hold while waiting budget is for the whole acquisition
+        self._holding_since = None
+        self._attempts = 0
+        with self._span('acquire', keys=len(self._unique_keys)) as span:
+            with self.acquire_timer, ExitStack() as stack:
+                if self.options['ttl_aware_wait'] and self._unique_keys:
+                    retryer.wait = self._ttl_aware(retryer.wait)
+                if self.options['wake_on_release'] and self._unique_keys:
+                    listener = stack.enter_context(
+                        self.lock_factory.release_listener(sorted(self._unique_keys, key=str))
+                    )
+                    retryer.wait = self._wake_or_wait(retryer.wait, listener)
+                if self.instrumentation is not None:
+                    retryer.wait = self._timed_wait(retryer.wait)
+                if self.options['fair']:
+                    stack.enter_context(self._queued())
+                try:
+                    success = retryer.call(self._acquire_or_release)
+                except Exception:
+                    # locks kept for another attempt that will not come
+                    self._release_all()
+                    raise
+                finally:
+                    self._end_wait()
+                    span.set(attempts=self._attempts)
+            self._report_acquired()
         self.release_timer.start()
         return success
 
     def release(self):
         """Release the Lock"""
         self.release_timer.stop()
-        for p in self._all_fulfilled_iter():
-            self.reporter_class(**p.tags).lock_released(self.release_timer.duration)
-        self._release_all()
+        with self._span('release', keys=len(self._obtained)):
+            self._report(*[
+                ('lock_released', (self.release_timer.duration,), p.tags) for p in self._all_fulfilled_iter()
+            ])
+            self._release_all()
 
     def __enter__(self):
         return self.acquire()
@@ -1,8 +1,16 @@
+import weakref
+
+
 class Potential:
+    __slots__ = ('item', '_state', '_key', '_tags', '_owners')
+
     def __init__(self, item, key_gen=None, tag_gen=None, tags=None, **more_tags):
         self.item = item
         self._state = None
         self._key = item if key_gen is None else key_gen(item)
+        # (weak reference to requirement, position) of each requirement this belongs to, kept informed of our state;
+        # a potential shared between requirements does not keep them alive
+        self._owners = []
 
         self._tags = dict(key=self._key)
         if tags:
@@ -27,14 +35,24 @@ class Potential:
     def is_rejected(self):
         return self._state is False
 
-    def fulfill(self):
-        self._state = True
+    def _set_state(self, state):
+        previous, self._state = self._state, state
+        if previous is not state:
+            for owner, position in self._owners:
+                requirement = owner()
+                if requirement is not None:
+                    requirement._potential_changed(position, previous, state)
         return self
 
+    def _add_owner(self, requirement, position):
+        self._owners = [(owner, at) for owner, at in self._owners if owner() is not None]
+        self._owners.append((weakref.ref(requirement), position))
+
+    def fulfill(self):
+        return self._set_state(True)
+
     def reject(self):
-        self._state = False
-        return self
+        return self._set_state(False)
 
     def reset(self):
-        self._state = None
-        return self
+        return self._set_state(None)
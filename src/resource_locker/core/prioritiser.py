@@ -0,0 +1,102 @@
+import logging
+import random
+import threading
+import time
+
+from resource_locker.reporter import Aspects
+from resource_locker.reporter import Query
+
+"""Strategies for the order in which a requirement's potentials are tried
+
+A prioritiser's `prioritise(potentials, known_locked)` returns the potentials
+in the order to try them. Potentials known to be locked go last either way.
+"""
+
+
+class RandomPrioritiser:
+    """Free potentials in random order, spreading clients across the pool"""
+    def prioritise(self, potentials, known_locked):
+        known_locked = set(known_locked)
+        part1 = []
+        part2 = []
+        for p in potentials:
+            if p.key in known_locked:
+                part2.append(p)
+            else:
+                part1.append(p)
+        random.shuffle(part1)
+        return part1 + part2
+
+
+class HistoryPrioritiser(RandomPrioritiser):
+    """Prefers potentials that have historically been free, going by reported lock statistics
+
+    Each potential is scored by its recent contention (failed / requested acquisitions),
+    and by how long it is usually held (release wait / releases); lowest scores are tried first,
+    ties in random order. Statistics are read with `Query`, for the value of the `tag` in each
+    potential's tags, at most once every `ttl` seconds. Recent counts weigh more than older ones:
+    on each refresh, those seen before are scaled by `decay`.
+
+    Locks must report with a RedisReporter or BackgroundReporter for there to be any history.
+    If the statistics cannot be read, potentials are ordered randomly.
+    """
+    def __init__(self, query=None, tag='key', ttl=10, decay=0.5, logger=None):
+        self.query = query
+        self.tag = tag
+        self.ttl = ttl
+        self.decay = decay
+        self.logger = logger or logging.getLogger(__name__)
+        # tag value: [requests, fails, releases, release wait] decayed over refreshes
+        self._recent = {}
+        # tag value: (totals last read, read at)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def _query(self):
+        if self.query is None:
+            self.query = Query()
+        return self.query
+
+    def _refresh(self, values):
+        now = time.monotonic()
+        stale = [v for v in values if v not in self._totals or self._totals[v][1] + self.ttl <= now]
+        if not stale:
+            return
+        aspects = self._query().all_aspects_of(self.tag, stale)
+        for value in stale:
+            found = aspects[value]
+            totals = [found.get(a, 0) for a in (
+                Aspects.lock_request_count,
+                Aspects.lock_acquire_fail_count,
+                Aspects.lock_release_count,
+                Aspects.lock_release_wait,
+            )]
+            previous, _ = self._totals.get(value, ([0] * len(totals), None))
+            recent = self._recent.get(value, [0] * len(totals))
+            self._recent[value] = [
+                r * self.decay + (t - p) for r, t, p in zip(recent, totals, previous)
+            ]
+            self._totals[value] = totals, now
+
+    def score(self, value):
+        """Lower is better: the chance of finding it locked, by how long it usually stays locked"""
+        requests, fails, releases, release_wait = self._recent.get(value, (0, 0, 0, 0))
+        contention = fails / requests if requests else 0
+        hold = release_wait / releases if releases else 0
+        return contention * hold, contention
+
+    def prioritise(self, potentials, known_locked):
+        ordered = super().prioritise(potentials, known_locked)
+        known_locked = set(known_locked)
+        free = [p for p in ordered if p.key not in known_locked]
+        values = {p: str(p.tags.get(self.tag)) for p in free}
+        try:
+            with self._lock:
+                self._refresh(list(set(values.values())))
+                scores = {p: self.score(value) for p, value in values.items()}
+        except Exception:
+            self.logger.exception('lock history unavailable, prioritising randomly')
+            return ordered
+        # the sort is stable, so equal scores keep their random order
+        free.sort(key=scores.get)
+        return free + ordered[len(free):]
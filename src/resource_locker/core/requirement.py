@@ -1,7 +1,11 @@
 from .exceptions import RequirementNotMet
 from .potential import Potential
+from .prioritiser import RandomPrioritiser
 
-import random
+import bisect
+import hashlib
+
+default_prioritiser = RandomPrioritiser()
 
 
 class Requirement:
@@ -12,15 +16,20 @@ class Requirement:
         self.need = self.options['need']
         self._potentials = []
         self._state = None
+        # positions of fulfilled potentials, in order, and the number rejected; kept up to date by the potentials
+        self._fulfilled_at = []
+        self._rejected_count = 0
 
         for p in potentials:
             self.add_potential(p)
 
     def __getitem__(self, item):
-        return self.fulfilled[item].item
+        if isinstance(item, slice):
+            return [p.item for p in self.fulfilled[item]]
+        return self._potentials[self._fulfilled_at[item]].item
 
     def __len__(self):
-        return len(self.fulfilled)
+        return len(self._fulfilled_at)
 
     def __iter__(self):
         return (item.item for item in self.fulfilled)
@@ -33,9 +42,23 @@ class Requirement:
                 'tags',
             }}
             p = Potential(p, **opts)
+        position = len(self._potentials)
         self._potentials.append(p)
+        p._add_owner(self, position)
+        if p._state is not None:
+            self._potential_changed(position, None, p._state)
         return self
 
+    def _potential_changed(self, position, previous, state):
+        if previous is True:
+            del self._fulfilled_at[bisect.bisect_left(self._fulfilled_at, position)]
+        elif previous is False:
+            self._rejected_count -= 1
+        if state is True:
+            bisect.insort(self._fulfilled_at, position)
+        elif state is False:
+            self._rejected_count += 1
+
     @property
     def is_fulfilled(self):
         return self._state is True
@@ -48,35 +71,24 @@ class Requirement:
     def potentials(self):
         return self._potentials
 
-    def prioritised_potentials(self, known_locked):
+    @property
+    def signature(self):
+        """Identifies the pool of resources this requirement draws from"""
+        return hashlib.sha1('\n'.join(sorted(str(p.key) for p in self._potentials)).encode()).hexdigest()
+
+    def prioritised_potentials(self, known_locked, prioritiser=None):
         """Sort potentials to improve probability of successful lock
 
-        currently: [untried, known_locked]
+        by default: [untried (shuffled), known_locked]
         """
-        known_locked = set(known_locked)
-        part1 = []
-        part2 = []
-        for p in self.potentials:
-            if p.key in known_locked:
-                part2.append(p)
-            else:
-                part1.append(p)
-        random.shuffle(part1)
-        return part1 + part2
+        return (prioritiser or default_prioritiser).prioritise(self.potentials, known_locked)
 
     @property
     def fulfilled(self):
-        return [p for p in self._potentials if p.is_fulfilled]
+        return [self._potentials[i] for i in self._fulfilled_at]
 
     def count(self):
-        fulfilled = 0
-        rejected = 0
-        for potential in self._potentials:
-            if potential.is_fulfilled:
-                fulfilled += 1
-            if potential.is_rejected:
-                rejected += 1
-        return fulfilled, rejected
+        return len(self._fulfilled_at), self._rejected_count
 
     def validate(self):
         fulfilled, rejected = self.count()
@@ -90,8 +102,10 @@ class Requirement:
                 raise RequirementNotMet(f'{remaining} potentials, (need {self.need})')
         return self
 
-    def reset(self):
+    def reset(self, keep=()):
+        """Resets all potentials, other than the fulfilled ones with keys in `keep`"""
         self._state = None
         for p in self.potentials:
-            p.reset()
+            if not (p.is_fulfilled and p.key in keep):
+                p.reset()
         return self
@@ -0,0 +1,106 @@
+import asyncio
+
+from .meta import AsyncLockFactoryMeta
+from .meta import AsyncReleaseListener
+
+
+class _Entry:
+    """A key's asyncio.Lock, and the number of acquisitions waiting on it"""
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiters = 0
+
+
+class AsyncNativeLock:
+    """An asyncio.Lock with the acquire options of a lock server"""
+    def __init__(self, factory, key):
+        self.factory = factory
+        self.key = key
+        self._entry = None
+
+    async def acquire(self, blocking=True, timeout=None):
+        entry = self.factory.all_locks.setdefault(self.key, _Entry())
+        if not blocking:
+            # a released lock still goes to its queued waiters first, so acquiring it then would wait;
+            # nothing can happen between the check and the acquisition, as neither suspends
+            if entry.lock.locked() or entry.waiters:
+                return False
+        entry.waiters += 1
+        try:
+            await asyncio.wait_for(entry.lock.acquire(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            entry.waiters -= 1
+            self.factory.prune(self.key)
+        self._entry = entry
+        return True
+
+    async def release(self):
+        self._entry.lock.release()
+        self.factory.prune(self.key)
+        for listener in self.factory.listeners.get(self.key, ()):
+            listener.released.set()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
+
+
+class AsyncNativeReleaseListener(AsyncReleaseListener):
+    def __init__(self, factory, keys):
+        super().__init__(keys)
+        self.factory = factory
+        self.released = asyncio.Event()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.released.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.released.clear()
+        return True
+
+    async def close(self):
+        for key in self.keys:
+            self.factory.listeners[key].discard(self)
+
+    async def __aenter__(self):
+        for key in self.keys:
+            self.factory.listeners.setdefault(key, set()).add(self)
+        return self
+
+
+class AsyncNativeLockFactory(AsyncLockFactoryMeta):
+    """Locks local to an event loop"""
+    supports_keyed_lookup = True
+
+    def __init__(self):
+        # key: _Entry, for keys locked or waited on
+        self.all_locks = {}
+        self.listeners = {}
+
+    def prune(self, key):
+        """Forgets a key neither locked nor waited on"""
+        entry = self.all_locks.get(key)
+        if entry is not None and not entry.lock.locked() and not entry.waiters:
+            del self.all_locks[key]
+
+    def new_lock(self, key, **params):
+        return AsyncNativeLock(self, key)
+
+    def release_listener(self, keys):
+        return AsyncNativeReleaseListener(self, keys)
+
+    async def get_lock_list(self, keys=None):
+        locked = [key for key, entry in self.all_locks.items() if entry.lock.locked()]
+        if keys is not None:
+            keys = set(keys)
+            return [key for key in locked if key in keys]
+        return locked
+
+    async def clear_all(self):
+        self.all_locks.clear()
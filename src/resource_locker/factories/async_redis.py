@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+import weakref
+from base64 import b64encode
+from os import urandom
+
+import redis_lock
+
+from resource_locker import connections
+from .meta import AsyncLockFactoryMeta
+from .meta import AsyncReleaseListener
+from .redis import ACQUIRE_MANY_SCRIPT
+from .redis import PRUNE_KEYS_SCRIPT
+from .redis import PRUNE_SCRIPT
+from .redis import RELEASE_SCRIPT
+from .redis import RedisLockFactory
+
+
+class AsyncRedisLock:
+    """A lock compatible with RedisLock, for use within an event loop"""
+    def __init__(self, factory, key, expire=None, id=None, auto_renewal=False, signal_expire=1000):
+        if auto_renewal and not expire:
+            raise ValueError('Expire may not be None when auto_renewal is set')
+        self.factory = factory
+        self.key = key
+        self.id = id or b64encode(urandom(18)).decode('ascii')
+        self._name = f'lock:{key}'
+        self._signal = f'lock-signal:{key}'
+        self._expire = int(expire) if expire else None
+        self._signal_expire = signal_expire
+        self._renewal_interval = self._expire * 2 / 3 if auto_renewal else None
+        self._renewal = None
+
+    async def acquire(self, blocking=True, timeout=None):
+        client = self.factory.client
+        deadline = time.monotonic() + timeout if timeout else None
+        while not await client.set(self._name, self.id, nx=True, ex=self._expire):
+            if not blocking:
+                return False
+            wait = self._expire or 0
+            if deadline:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    return False
+            await client.blpop([self._signal], timeout=wait)
+        await self.factory.index(self.key, self._expire)
+        self.start_renewal()
+        return True
+
+    async def extend(self, expire=None):
+        expire = expire or self._expire
+        error = await self.factory.extend_script(keys=(self._name, self._signal), args=(self.id, expire))
+        if error == 1:
+            raise redis_lock.NotAcquired(f'Lock({self._name}) is not acquired or it already expired.')
+        elif error == 2:
+            raise redis_lock.NotExpirable(f'Lock({self._name}) has no assigned expiration time')
+        await self.factory.index(self.key, expire)
+
+    def start_renewal(self):
+        if self._renewal_interval is not None:
+            self._renewal = asyncio.ensure_future(self._renew())
+            self._renewal.add_done_callback(self._renewal_done)
+
+    def _renewal_done(self, task):
+        # renewal only ends when cancelled on release; otherwise the lock is left to expire
+        if not task.cancelled() and task.exception() is not None:
+            self.factory.logger.error('renewal of %s failed', self._name, exc_info=task.exception())
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(self._renewal_interval)
+            await self.extend()
+
+    async def release(self):
+        if self._renewal is not None:
+            self._renewal.cancel()
+            self._renewal = None
+        error = await self.factory.release_script(
+            keys=(
+                self._name, self._signal, self.factory.index_key, self.factory.channel(self.key),
+                self.factory.heartbeat_key,
+            ),
+            args=(self.id, self._signal_expire, self.key),
+        )
+        if error == 1:
+            raise redis_lock.NotAcquired(f'Lock({self._name}) is not acquired or it already expired.')
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
+
+
+class AsyncRedisReleaseListener(AsyncReleaseListener):
+    """Wakes on release notifications published by RedisLock and AsyncRedisLock"""
+    def __init__(self, factory, keys):
+        super().__init__(keys)
+        self.factory = factory
+        self.pubsub = factory.client.pubsub(ignore_subscribe_messages=True)
+
+    async def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if await self.pubsub.get_message(timeout=remaining):
+                return True
+
+    async def close(self):
+        await self.pubsub.aclose()
+
+    async def __aenter__(self):
+        await self.pubsub.subscribe(*[self.factory.channel(key) for key in self.keys])
+        return self
+
+
+class AsyncRedisLockFactory(AsyncLockFactoryMeta):
+    """As RedisLockFactory, over an asyncio redis client; locks from either may be mixed"""
+    supports_acquire_many = True
+    supports_keyed_lookup = True
+    index_key = RedisLockFactory.index_key
+    heartbeat_key = RedisLockFactory.heartbeat_key
+    channel = staticmethod(RedisLockFactory.channel)
+    _expiry = staticmethod(RedisLockFactory._expiry)
+    _states = staticmethod(RedisLockFactory._states)
+    # event loop: (pool, factory), as RedisLockFactory._shared per loop
+    _shared = weakref.WeakKeyDictionary()
+
+    def __init__(self, client=None):
+        self.client = client or connections.get_async_client('locks')
+        self.logger = logging.getLogger(__name__)
+        self.acquire_many_script = self.client.register_script(ACQUIRE_MANY_SCRIPT)
+        self.release_script = self.client.register_script(RELEASE_SCRIPT)
+        self.extend_script = self.client.register_script(redis_lock.EXTEND_SCRIPT)
+        self.reset_all_script = self.client.register_script(redis_lock.RESET_ALL_SCRIPT)
+        self.prune_script = self.client.register_script(PRUNE_SCRIPT)
+        self.prune_keys_script = self.client.register_script(PRUNE_KEYS_SCRIPT)
+
+    @classmethod
+    def shared(cls):
+        """The running event loop's factory, used by AsyncLock unless told otherwise"""
+        loop = asyncio.get_running_loop()
+        # a fork or connections.configure gives the locks role a new pool, and the loop a new factory
+        pool = connections.get_pool('locks')
+        if loop not in cls._shared or cls._shared[loop][0] is not pool:
+            cls._shared[loop] = (pool, cls())
+        return cls._shared[loop][1]
+
+    async def aclose(self):
+        """Closes the factory's client; the shared factory is replaced when next asked for"""
+        for loop, (_, factory) in list(self._shared.items()):
+            if factory is self:
+                del self._shared[loop]
+        await self.client.aclose()
+
+    async def index(self, key, expire):
+        """Records a live lock, its expected expiry and its heartbeat"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(self.index_key, {key: self._expiry(expire)})
+        pipe.hset(self.heartbeat_key, key, time.time())
+        await pipe.execute()
+
+    def new_lock(self, key, **params):
+        opts = {k: v for k, v in params.items() if k in {'expire', 'auto_renewal', 'id'}}
+        return AsyncRedisLock(self, key, **opts)
+
+    async def acquire_many(self, keys, need, **params):
+        """Takes the first `need` free keys in a single round trip"""
+        if not keys:
+            return []
+        params = dict(params, id=b64encode(urandom(18)).decode('ascii'))
+        expire = int(params.get('expire') or 0)
+        indices = await self.acquire_many_script(
+            keys=[self.index_key, self.heartbeat_key] + [f'lock:{key}' for key in keys],
+            args=[need, expire, params['id'], self._expiry(expire), time.time()],
+        )
+        obtained = []
+        for i in indices:
+            key = keys[i - 1]
+            lock = self.new_lock(key, **params)
+            lock.start_renewal()
+            obtained.append((key, lock))
+        return obtained
+
+    def release_listener(self, keys):
+        return AsyncRedisReleaseListener(self, keys)
+
+    async def get_lock_list(self, keys=None):
+        """Gets a list of live locks to optimise acquisition attempts"""
+        now = time.time()
+        if keys is not None:
+            keys = [str(key) for key in keys]
+            if not keys:
+                return []
+            live = await self.prune_keys_script(keys=[self.index_key, self.heartbeat_key], args=[now, *keys])
+            return [k.decode('utf8') for k in live]
+        live = await self.prune_script(keys=[self.index_key, self.heartbeat_key], args=[now])
+        return [k.decode('utf8') for k in live]
+
+    async def get_lock_states(self, keys):
+        """As RedisLockFactory.get_lock_states"""
+        keys = [str(key) for key in keys]
+        if not keys:
+            return {}
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.pttl(f'lock:{key}')
+        pipe.hmget(self.heartbeat_key, keys)
+        *ttls, heartbeats = await pipe.execute()
+        return self._states(keys, ttls, heartbeats)
+
+    async def clear_all(self):
+        """Clears all locks"""
+        self.logger.critical('caution: clearing all locks; collision safety is voided')
+        await self.reset_all_script()
+        await self.client.delete(self.index_key, self.heartbeat_key)
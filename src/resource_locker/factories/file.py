@@ -0,0 +1,238 @@
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from base64 import b64encode
+from contextlib import ExitStack
+from contextlib import contextmanager
+from urllib.parse import quote
+from urllib.parse import unquote
+
+try:
+    import fcntl
+except ImportError:  # not on windows
+    fcntl = None
+
+from .meta import LockFactoryMeta
+from .meta import LockState
+from .renewal import LeaseRenewer
+
+"""Locks shared by the processes of one host, without a lock server
+
+Each held lock is a lease file in a shared directory, recording the holder and
+when the lease expires. Reading and writing lease files is serialised by fcntl
+byte-range locks on a table file; each key maps to one byte (stripe), so
+unrelated keys are rarely serialised with each other. Threads of one process
+are kept apart by matching thread locks.
+
+The kernel drops the byte-range locks of crashed processes, and leases whose
+holder is dead, or whose expiry has passed, are taken over or pruned.
+"""
+
+hostname = socket.gethostname()
+
+# fcntl locks belong to a process, so its threads are kept apart by these, per (table, stripe)
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def _thread_lock(table, stripe):
+    with _thread_locks_lock:
+        return _thread_locks.setdefault((table, stripe), threading.Lock())
+
+
+def _alive(record):
+    if record.get('expires') is not None and record['expires'] < time.time():
+        return False
+    if record.get('host') == hostname:
+        try:
+            os.kill(record['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+    return True
+
+
+class FileLock:
+    """A lease on a key, held in a FileLockFactory's directory"""
+    def __init__(self, factory, key, expire=None, auto_renewal=False, id=None):
+        if auto_renewal and not expire:
+            raise ValueError('Expire may not be None when auto_renewal is set')
+        self.factory = factory
+        self.key = str(key)
+        self.id = id or b64encode(os.urandom(18)).decode('ascii')
+        self.expire = int(expire) if expire else None
+        self.renewal_interval = self.expire * 2 / 3 if auto_renewal else None
+
+    def _record(self):
+        now = time.time()
+        return dict(
+            id=self.id,
+            host=hostname,
+            pid=os.getpid(),
+            expires=now + self.expire if self.expire else None,
+            heartbeat=now,
+        )
+
+    def held(self):
+        """Registers a lease taken for this lock"""
+        if self.renewal_interval is not None:
+            self.factory.renewer.register(self)
+        return self
+
+    def acquire(self, blocking=True, timeout=None):
+        deadline = time.monotonic() + timeout if timeout else None
+        poll = 0.001
+        while True:
+            with self.factory.stripes([self.key]):
+                if not self.factory.read(self.key):
+                    self.factory.write(self.key, self._record())
+                    self.held()
+                    return True
+            if not blocking or (deadline and time.monotonic() > deadline):
+                return False
+            time.sleep(poll)
+            poll = min(poll * 2, 0.1)
+
+    def extend(self, expire=None):
+        self.expire = int(expire or self.expire)
+        with self.factory.stripes([self.key]):
+            if (self.factory.read(self.key) or {}).get('id') != self.id:
+                raise RuntimeError(f'{self.key} is not acquired or it already expired')
+            self.factory.write(self.key, self._record())
+
+    def release(self):
+        self.factory.renewer.deregister(self)
+        with self.factory.stripes([self.key]):
+            if (self.factory.read(self.key) or {}).get('id') != self.id:
+                raise RuntimeError(f'{self.key} is not acquired or it already expired')
+            self.factory.remove(self.key)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class FileLockFactory(LockFactoryMeta):
+    """Locks shared between processes on one host, through a directory"""
+    supports_acquire_many = True
+    supports_keyed_lookup = True
+
+    def __init__(self, path=None, stripes=4096):
+        if fcntl is None:
+            raise RuntimeError('FileLockFactory needs fcntl')
+        self.path = path or os.path.join(tempfile.gettempdir(), 'resource_locker')
+        self.held_path = os.path.join(self.path, 'held')
+        os.makedirs(self.held_path, exist_ok=True)
+        self.stripe_count = stripes
+        self.table_path = os.path.realpath(os.path.join(self.path, 'table'))
+        # never closed: closing any descriptor of the table would drop all of this process's fcntl locks on it
+        self.table = os.open(self.table_path, os.O_RDWR | os.O_CREAT, 0o666)
+        self.logger = logging.getLogger(__name__)
+        self.renewer = LeaseRenewer(self)
+
+    def _file(self, key):
+        return os.path.join(self.held_path, quote(str(key), safe=''))
+
+    @contextmanager
+    def stripes(self, keys):
+        """Serialises access to the leases of `keys`, taking their stripes in order"""
+        with ExitStack() as stack:
+            for stripe in sorted({zlib.crc32(str(key).encode()) % self.stripe_count for key in keys}):
+                stack.enter_context(_thread_lock(self.table_path, stripe))
+                fcntl.lockf(self.table, fcntl.LOCK_EX, 1, stripe)
+                stack.callback(fcntl.lockf, self.table, fcntl.LOCK_UN, 1, stripe)
+            yield
+
+    def read(self, key):
+        """The live lease on a key, if any; must be called within its stripe"""
+        try:
+            with open(self._file(key)) as fh:
+                record = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+        return record if _alive(record) else None
+
+    def write(self, key, record):
+        temporary = f'{self._file(key)}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as fh:
+            json.dump(record, fh)
+        os.replace(temporary, self._file(key))
+
+    def remove(self, key):
+        try:
+            os.unlink(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def new_lock(self, key, **params):
+        opts = {k: v for k, v in params.items() if k in {'expire', 'auto_renewal', 'id'}}
+        return FileLock(self, key, **opts)
+
+    def acquire_many(self, keys, need, **params):
+        """Takes the first `need` free keys, holding all their stripes at once"""
+        params = dict(params, id=b64encode(os.urandom(18)).decode('ascii'))
+        obtained = []
+        with self.stripes(keys):
+            for key in keys:
+                if len(obtained) >= need:
+                    break
+                if not self.read(key):
+                    lock = self.new_lock(key, **params)
+                    self.write(lock.key, lock._record())
+                    obtained.append((key, lock))
+            if len(obtained) < need:
+                for _, lock in obtained:
+                    self.remove(lock.key)
+                return []
+        return [(key, lock.held()) for key, lock in obtained]
+
+    def renew_all(self, locks):
+        lost = []
+        for lock in locks:
+            try:
+                lock.extend()
+            except RuntimeError:
+                lost.append(lock)
+        return lost
+
+    def get_lock_list(self, keys=None):
+        """Gets live locks, from the leases present; dead leases are pruned on the way"""
+        if keys is None:
+            keys = [unquote(name) for name in os.listdir(self.held_path) if not name.endswith('.tmp')]
+        return [key for key in keys if self._live(key)]
+
+    def get_lock_states(self, keys):
+        states = {}
+        for key in keys:
+            with self.stripes([key]):
+                record = self.read(key)
+            if record:
+                now = time.time()
+                states[key] = LockState(
+                    record['expires'] - now if record.get('expires') is not None else None,
+                    now - record['heartbeat'] if record.get('heartbeat') is not None else None,
+                )
+        return states
+
+    def _live(self, key):
+        if not os.path.exists(self._file(key)):
+            return False
+        with self.stripes([key]):
+            if self.read(key):
+                return True
+            self.remove(key)
+            return False
+
+    def clear_all(self):
+        self.logger.critical('caution: clearing all locks; collision safety is voided')
+        for name in os.listdir(self.held_path):
+            os.unlink(os.path.join(self.held_path, name))
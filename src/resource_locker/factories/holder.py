@@ -0,0 +1,101 @@
+import os
+import re
+import socket
+from base64 import b64encode
+from collections import namedtuple
+
+"""Who holds a lock
+
+A lock's id names its holder: the host, the process id and start time, and
+how often the holder heartbeats (0 for not at all), after a random nonce.
+Waiters can then tell when a holder is gone, as long as they share its host:
+its process no longer exists, or the pid now belongs to a later process.
+
+The host is identified by its name, boot and pid namespace where these can be
+read, so that containers sharing a hostname are not mistaken for one another.
+"""
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _host():
+    parts = [re.sub(r'\s', '_', socket.gethostname())]
+    boot = _read('/proc/sys/kernel/random/boot_id')
+    if boot:
+        parts.append(boot[:8])
+    try:
+        parts.append(str(os.stat('/proc/self/ns/pid').st_ino))
+    except OSError:
+        pass
+    return '/'.join(parts)
+
+
+def started(pid):
+    """When a process started, in clock ticks since boot: None if there is no such process, 0 if unknown"""
+    if os.path.exists('/proc/self/stat'):
+        stat = _read(f'/proc/{pid}/stat')
+        if stat is None:
+            return None
+        try:
+            # the process name, in brackets, may contain spaces
+            return int(stat[stat.rindex(')') + 2:].split()[19])
+        except (ValueError, IndexError):
+            return 0
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except OSError:
+        pass
+    return 0
+
+
+class Holder(namedtuple('Holder', ['host', 'pid', 'started', 'beat'])):
+    """The identity of a lock's holder, as given in its lock id"""
+    _this = None
+
+    @classmethod
+    def this_process(cls, beat=0):
+        if cls._this is None or cls._this.pid != os.getpid():
+            pid = os.getpid()
+            cls._this = cls(_host(), pid, started(pid), 0)
+        return cls._this._replace(beat=beat or 0)
+
+    @classmethod
+    def parse(cls, lock_id):
+        """The holder named by a lock id, or None for ids that do not name one"""
+        if isinstance(lock_id, bytes):
+            lock_id = lock_id.decode('ascii', 'replace')
+        parts = str(lock_id).split(' ')
+        if len(parts) != 5:
+            return None
+        try:
+            return cls(parts[1], int(parts[2]), int(parts[3]), float(parts[4]))
+        except ValueError:
+            return None
+
+    def lock_id(self):
+        """A new lock id naming this holder"""
+        return ' '.join((b64encode(os.urandom(18)).decode('ascii'), self.host, str(self.pid), str(self.started),
+                         repr(float(self.beat))))
+
+    def is_gone(self):
+        """Whether the holder's process has provably exited: it was on this host, and its pid is free or reused"""
+        if self.host != Holder.this_process().host:
+            return False
+        now = started(self.pid)
+        if now is None:
+            return True
+        return bool(self.started and now and now != self.started)
+
+    def is_alive(self):
+        """Whether the holder's process provably still runs: it is on this host, and its pid was not reused"""
+        if self.host != Holder.this_process().host:
+            return False
+        return bool(self.started and started(self.pid) == self.started)
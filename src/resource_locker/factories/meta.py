@@ -1,15 +1,193 @@
 from abc import ABC, abstractmethod
+from collections import namedtuple
+
+import asyncio
+import time
+
+# the state of a held lock: seconds until its lease lapses and since its holder last took or renewed it;
+# either is None if there is no expiry, or if the factory cannot tell
+LockState = namedtuple('LockState', ['ttl', 'heartbeat_age'])
+
+
+class ReleaseListener:
+    """Waits for any of the given keys to be released
+
+    This default cannot observe releases, so it sleeps for the whole timeout
+    """
+    def __init__(self, keys):
+        self.keys = keys
+
+    def wait(self, timeout):
+        """Must return True if woken by a release before `timeout` seconds elapse"""
+        time.sleep(timeout)
+        return False
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncReleaseListener(ReleaseListener):
+    """Waits for any of the given keys to be released, within an event loop"""
+    async def wait(self, timeout):
+        await asyncio.sleep(timeout)
+        return False
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
 
 
 class LockFactoryMeta(ABC):
+    supports_acquire_many = False
+    supports_fair_queue = False
+    supports_reclaim = False
+    # whether get_lock_list takes candidate `keys`; factories written before it did list every lock
+    supports_keyed_lookup = False
+
     @abstractmethod
     def new_lock(self, key, **params):
         """Must return an object with a Lock-like interface"""
 
     @abstractmethod
-    def get_lock_list(self):
-        """Must return a list of string keys of existing locks"""
+    def get_lock_list(self, keys=None):
+        """Must return a list of string keys of existing locks
+
+        If candidate `keys` are given, only those of them that are locked need be returned.
+        They are only given if `supports_keyed_lookup` is set.
+        """
+
+    def locked_among(self, keys):
+        """Those of candidate `keys` that are locked"""
+        if self.supports_keyed_lookup:
+            return self.get_lock_list(keys=keys)
+        wanted = {str(key) for key in keys}
+        return [key for key in self.get_lock_list() if str(key) in wanted]
 
     @abstractmethod
     def clear_all(self):
         """Must clear all locks from the system (primarily for testing)"""
+
+    def get_lock_states(self, keys):
+        """Returns a LockState for each of `keys` that is locked, by key"""
+        return {key: LockState(None, None) for key in self.locked_among(keys)}
+
+    def acquire_many(self, keys, need, **params):
+        """May atomically acquire the first `need` free keys, in order, all-or-nothing
+
+        Must return a list of (key, lock) pairs for the obtained locks, empty if `need` could not be met.
+        Only used if `supports_acquire_many` is set.
+        """
+        raise NotImplementedError
+
+    def acquire_groups(self, groups, **params):
+        """Acquires each group of keys all-or-nothing, independently of the other groups
+
+        Returns a list of (key, lock) pairs per group, empty for groups that could not be had in full.
+        Factories may take all the groups in a single operation; by default they are taken one at a time.
+        """
+        results = []
+        for keys in groups:
+            if self.supports_acquire_many:
+                results.append(self.acquire_many(keys, len(keys), **params))
+                continue
+            obtained = []
+            for key in keys:
+                lock = self.new_lock(key, **params)
+                if not lock.acquire(blocking=False):
+                    for _, taken in obtained:
+                        taken.release()
+                    obtained = []
+                    break
+                obtained.append((key, lock))
+            results.append(obtained)
+        return results
+
+    def release_listener(self, keys):
+        """Returns a ReleaseListener, subscribed to releases of `keys` from the moment it is created"""
+        return ReleaseListener(keys)
+
+    def renew_all(self, locks):
+        """May extend the leases of the given locks, for a LeaseRenewer, returning those no longer held"""
+        raise NotImplementedError
+
+    def beat_all(self, locks):
+        """May record the heartbeats of the given locks, for a LeaseRenewer, returning those no longer held
+
+        Only used if the factory has a `heartbeat_interval`.
+        """
+        raise NotImplementedError
+
+    def reclaim(self, keys, missed=3):
+        """May release the locks of `keys` whose holders are gone, returning their keys
+
+        Only used if `supports_reclaim` is set.
+        """
+        raise NotImplementedError
+
+    def queued_ahead(self, queue, ticket, score, need, ttl):
+        """May join or refresh a ticket for `need` resources in a named queue, returning the total need of the
+        live tickets ahead of it
+
+        Tickets are ordered by score, and lapse unless refreshed within `ttl` seconds.
+        Only used if `supports_fair_queue` is set, as is `dequeue`.
+        """
+        raise NotImplementedError
+
+    def dequeue(self, queue, ticket):
+        """Must remove the ticket from the queue"""
+        raise NotImplementedError
+
+
+class AsyncLockFactoryMeta(ABC):
+    """As LockFactoryMeta, with coroutines for anything that talks to the lock server
+
+    Locks must also provide coroutines for `acquire` and `release`, and be async context managers
+    """
+    supports_acquire_many = False
+    supports_fair_queue = False
+    supports_keyed_lookup = False
+
+    @abstractmethod
+    def new_lock(self, key, **params):
+        """Must return an object with an async Lock-like interface"""
+
+    @abstractmethod
+    async def get_lock_list(self, keys=None):
+        """Must return a list of string keys of existing locks"""
+
+    async def locked_among(self, keys):
+        """As LockFactoryMeta.locked_among"""
+        if self.supports_keyed_lookup:
+            return await self.get_lock_list(keys=keys)
+        wanted = {str(key) for key in keys}
+        return [key for key in await self.get_lock_list() if str(key) in wanted]
+
+    @abstractmethod
+    async def clear_all(self):
+        """Must clear all locks from the system (primarily for testing)"""
+
+    async def get_lock_states(self, keys):
+        """As LockFactoryMeta.get_lock_states"""
+        return {key: LockState(None, None) for key in await self.locked_among(keys)}
+
+    async def acquire_many(self, keys, need, **params):
+        """As LockFactoryMeta.acquire_many"""
+        raise NotImplementedError
+
+    def release_listener(self, keys):
+        """Returns an AsyncReleaseListener, subscribed to releases of `keys` from the moment it is entered"""
+        return AsyncReleaseListener(keys)
+
+    async def aclose(self):
+        """May close any connections the factory holds; it is not used again"""
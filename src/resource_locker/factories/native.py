@@ -1,20 +1,182 @@
+from threading import Condition
 from threading import Lock
 
+import time
+import uuid
+
 from .meta import LockFactoryMeta
+from .meta import LockState
+from .meta import ReleaseListener
+from .renewal import LeaseRenewer
+
+
+class NativeLock:
+    """A lease on a key, held in a NativeLockFactory"""
+    def __init__(self, factory, key, expire=None, auto_renewal=False, id=None):
+        if auto_renewal and not expire:
+            raise ValueError('Expire may not be None when auto_renewal is set')
+        self.factory = factory
+        self.key = key
+        self.id = id or uuid.uuid4().hex
+        self.expire = expire or None
+        self.renewal_interval = self.expire * 2 / 3 if auto_renewal else None
+
+    def _lease(self):
+        now = time.monotonic()
+        return self.id, now + self.expire if self.expire else None, now
+
+    def acquire(self, blocking=True, timeout=None):
+        deadline = time.monotonic() + timeout if timeout else None
+        factory = self.factory
+        with factory.condition:
+            while True:
+                lease = factory.lease(self.key)
+                if lease is None:
+                    break
+                now = time.monotonic()
+                if not blocking or (deadline is not None and now >= deadline):
+                    return False
+                # a release notifies us, but a lapsing lease does not
+                waits = [t - now for t in (deadline, lease[1]) if t is not None]
+                factory.condition.wait(min(waits) if waits else None)
+            factory.held[self.key] = self._lease()
+        if self.renewal_interval is not None:
+            factory.renewer.register(self)
+        return True
+
+    def _check_held(self):
+        lease = self.factory.lease(self.key)
+        if lease is None or lease[0] != self.id:
+            raise RuntimeError(f'{self.key} is not acquired or it already expired')
+
+    def extend(self, expire=None):
+        self.expire = expire or self.expire
+        with self.factory.condition:
+            self._check_held()
+            self.factory.held[self.key] = self._lease()
+
+    def release(self):
+        self.factory.renewer.deregister(self)
+        with self.factory.condition:
+            self._check_held()
+            del self.factory.held[self.key]
+            self.factory.released(self.key)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class NativeReleaseListener(ReleaseListener):
+    def __init__(self, factory, keys):
+        super().__init__(keys)
+        self.factory = factory
+        self.woken = False
+        with factory.condition:
+            for key in keys:
+                factory.listeners.setdefault(key, set()).add(self)
+
+    def wait(self, timeout):
+        with self.factory.condition:
+            woken = self.factory.condition.wait_for(lambda: self.woken, timeout)
+            self.woken = False
+            return woken
+
+    def close(self):
+        with self.factory.condition:
+            for key in self.keys:
+                listeners = self.factory.listeners.get(key, set())
+                listeners.discard(self)
+                if not listeners:
+                    self.factory.listeners.pop(key, None)
 
 
 class NativeLockFactory(LockFactoryMeta):
-    """Demonstrates use of alternative lock implementations"""
+    """Locks local to a process, as leases that honour `expire`
+
+    Only held keys are stored, so memory and `get_lock_list` scale with the locks held, not the keys ever seen.
+    Leases past their expiry are dropped lazily, whenever their key is looked at.
+    """
+    supports_fair_queue = True
+    supports_keyed_lookup = True
+
     def __init__(self):
-        self.all_locks = {}
+        # key: (lock id, expires at, taken or renewed at), for held keys only
+        self.held = {}
+        # key: listeners waiting for its release
+        self.listeners = {}
+        self.condition = Condition()
+        self.renewer = LeaseRenewer(self)
+        # queue name: {ticket: [score, lapses at]}
+        self.queues = {}
+        self.queues_lock = Lock()
+
+    def lease(self, key):
+        """The live (id, expires at, heartbeat) lease on a key, if any; must be called under the condition"""
+        lease = self.held.get(key)
+        if lease is not None and lease[1] is not None and lease[1] <= time.monotonic():
+            del self.held[key]
+            return None
+        return lease
+
+    def released(self, key):
+        """Wakes the waiters for a key; must be called under the condition"""
+        for listener in self.listeners.get(key, ()):
+            listener.woken = True
+        self.condition.notify_all()
 
     def new_lock(self, key, **params):
-        # override the lock factory to use local locks instead! faster! wooooo!
-        # also somewhat validates backend-agnostic approach
-        return self.all_locks.setdefault(key, Lock())
+        opts = {k: v for k, v in params.items() if k in {'expire', 'auto_renewal', 'id'}}
+        return NativeLock(self, key, **opts)
 
-    def get_lock_list(self):
-        return list(self.all_locks.keys())
+    def release_listener(self, keys):
+        return NativeReleaseListener(self, keys)
+
+    def renew_all(self, locks):
+        lost = []
+        for lock in locks:
+            try:
+                lock.extend()
+            except RuntimeError:
+                lost.append(lock)
+        return lost
+
+    def get_lock_list(self, keys=None):
+        with self.condition:
+            if keys is not None:
+                return [key for key in keys if self.lease(key) is not None]
+            return [key for key in list(self.held) if self.lease(key) is not None]
+
+    def get_lock_states(self, keys):
+        with self.condition:
+            now = time.monotonic()
+            leases = [(key, self.lease(key)) for key in keys]
+        return {
+            key: LockState(lease[1] - now if lease[1] is not None else None, now - lease[2])
+            for key, lease in leases if lease is not None
+        }
 
     def clear_all(self):
-        self.all_locks.clear()
+        with self.condition:
+            for key in list(self.held):
+                del self.held[key]
+                self.released(key)
+
+    def queued_ahead(self, queue, ticket, score, need, ttl):
+        now = time.monotonic()
+        with self.queues_lock:
+            tickets = self.queues.setdefault(queue, {})
+            tickets.setdefault(ticket, [score, need, None])[2] = now + ttl
+            for lapsed in [t for t, (_, _, lapses) in tickets.items() if lapses < now]:
+                del tickets[lapsed]
+            return sum(n for t, (s, n, _) in tickets.items() if (s, t) < (score, ticket))
+
+    def dequeue(self, queue, ticket):
+        with self.queues_lock:
+            tickets = self.queues.get(queue, {})
+            tickets.pop(ticket, None)
+            if not tickets:
+                self.queues.pop(queue, None)
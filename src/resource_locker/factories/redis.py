@@ -1,27 +1,503 @@
 import logging
+import time
 
 import redis_lock
-from redis import StrictRedis
 
+from resource_locker import connections
+from .holder import Holder
 from .meta import LockFactoryMeta
+from .meta import LockState
+from .meta import ReleaseListener
+from .renewal import LeaseRenewer
+
+# Sets the first ARGV[1] free keys of KEYS[3:] to the id ARGV[3], with expiry ARGV[2] (0 for none),
+# and records them in the index KEYS[1] with score ARGV[4], and their heartbeat ARGV[5] in KEYS[2].
+# If fewer than ARGV[6] (by default, ARGV[1]) keys are free, any taken are handed back and nothing is returned.
+ACQUIRE_MANY_SCRIPT = b"""
+    local need = tonumber(ARGV[1])
+    local least = tonumber(ARGV[6] or ARGV[1])
+    local expire = tonumber(ARGV[2])
+    local acquired = {}
+    for i = 3, #KEYS do
+        if #acquired >= need then
+            break
+        end
+        local ok
+        if expire > 0 then
+            ok = redis.call("set", KEYS[i], ARGV[3], "nx", "ex", expire)
+        else
+            ok = redis.call("set", KEYS[i], ARGV[3], "nx")
+        end
+        if ok then
+            table.insert(acquired, i)
+        end
+    end
+    if #acquired < least then
+        for _, i in ipairs(acquired) do
+            local signal = "lock-signal:" .. string.sub(KEYS[i], 6)
+            redis.call("del", KEYS[i])
+            redis.call("del", signal)
+            redis.call("lpush", signal, 1)
+            redis.call("pexpire", signal, 1000)
+        end
+        return {}
+    end
+    for n, i in ipairs(acquired) do
+        redis.call("zadd", KEYS[1], ARGV[4], string.sub(KEYS[i], 6))
+        redis.call("hset", KEYS[2], string.sub(KEYS[i], 6), ARGV[5])
+        acquired[n] = i - 2
+    end
+    return acquired
+"""
+
+# Takes groups of the keys KEYS[3:], each all-or-nothing: ARGV[5:] are the sizes of the groups, in order.
+# Keys are set to the id ARGV[2] with expiry ARGV[1] (0 for none), and recorded in the index KEYS[1]
+# with score ARGV[3] and heartbeat ARGV[4] in KEYS[2]. Returns the positions of the groups taken.
+ACQUIRE_GROUPS_SCRIPT = b"""
+    local expire = tonumber(ARGV[1])
+    local taken = {}
+    local first = 3
+    for g = 5, #ARGV do
+        local last = first + tonumber(ARGV[g]) - 1
+        local free = true
+        for i = first, last do
+            if redis.call("exists", KEYS[i]) == 1 then
+                free = false
+                break
+            end
+        end
+        if free then
+            for i = first, last do
+                if expire > 0 then
+                    redis.call("set", KEYS[i], ARGV[2], "ex", expire)
+                else
+                    redis.call("set", KEYS[i], ARGV[2])
+                end
+                redis.call("zadd", KEYS[1], ARGV[3], string.sub(KEYS[i], 6))
+                redis.call("hset", KEYS[2], string.sub(KEYS[i], 6), ARGV[4])
+            end
+            table.insert(taken, g - 4)
+        end
+        first = last + 1
+    end
+    return taken
+"""
+
+# As redis_lock's unlock, also removing the lock ARGV[3] from the index KEYS[3] and heartbeats KEYS[5],
+# and announcing the release on the channel KEYS[4]
+RELEASE_SCRIPT = b"""
+    if redis.call("get", KEYS[1]) ~= ARGV[1] then
+        return 1
+    end
+    redis.call("del", KEYS[2])
+    redis.call("lpush", KEYS[2], 1)
+    redis.call("pexpire", KEYS[2], ARGV[2])
+    redis.call("del", KEYS[1])
+    redis.call("zrem", KEYS[3], ARGV[3])
+    redis.call("hdel", KEYS[5], ARGV[3])
+    redis.call("publish", KEYS[4], ARGV[3])
+    return 0
+"""
+
+
+# Joins or refreshes the ticket ARGV[1] for ARGV[4] resources in the queue KEYS[1] with score ARGV[2], alive for
+# ARGV[3] milliseconds, dropping lapsed tickets ahead of it. Returns the total need of the live tickets ahead of it.
+QUEUED_AHEAD_SCRIPT = b"""
+    redis.call("set", "lock-ticket:" .. ARGV[1], ARGV[4], "px", ARGV[3])
+    redis.call("zadd", KEYS[1], "nx", ARGV[2], ARGV[1])
+    local ahead = 0
+    for _, ticket in ipairs(redis.call("zrange", KEYS[1], 0, -1)) do
+        if ticket == ARGV[1] then
+            return ahead
+        end
+        local need = redis.call("get", "lock-ticket:" .. ticket)
+        if need then
+            ahead = ahead + tonumber(need)
+        else
+            redis.call("zrem", KEYS[1], ticket)
+        end
+    end
+    return ahead
+"""
+
+
+# Extends each lock KEYS[3:] still held with its id, to its expiry, and updates its score in the index KEYS[1]
+# and its heartbeat in KEYS[2]. ARGV[1] is the time now, followed by an (id, expire) pair per lock.
+# Returns the positions of locks no longer held.
+RENEW_SCRIPT = b"""
+    local lost = {}
+    for i = 3, #KEYS do
+        local n = i - 2
+        local expire = tonumber(ARGV[2 * n + 1])
+        if redis.call("get", KEYS[i]) == ARGV[2 * n] then
+            redis.call("expire", KEYS[i], expire)
+            redis.call("zadd", KEYS[1], tonumber(ARGV[1]) + expire, string.sub(KEYS[i], 6))
+            redis.call("hset", KEYS[2], string.sub(KEYS[i], 6), ARGV[1])
+        else
+            table.insert(lost, n)
+        end
+    end
+    return lost
+"""
+
+# Records the time ARGV[1] as the heartbeat in KEYS[1] of each lock KEYS[2:] still held with its id ARGV[2:],
+# without extending it. Returns the positions of locks no longer held.
+BEAT_SCRIPT = b"""
+    local lost = {}
+    for i = 2, #KEYS do
+        if redis.call("get", KEYS[i]) == ARGV[i] then
+            redis.call("hset", KEYS[1], string.sub(KEYS[i], 6), ARGV[1])
+        else
+            table.insert(lost, i - 1)
+        end
+    end
+    return lost
+"""
+
+# Releases locks on behalf of holders that are gone, as RELEASE_SCRIPT, but only those unchanged since they were
+# judged: KEYS[3:] are (lock, release channel) pairs, and ARGV[2:] (id, heartbeat) pairs, '' for no heartbeat.
+# KEYS[1] is the index, KEYS[2] the heartbeats and ARGV[1] the signal expiry. Returns the positions of locks released.
+RECLAIM_SCRIPT = b"""
+    local reclaimed = {}
+    for n = 1, (#KEYS - 2) / 2 do
+        local lock = KEYS[2 * n + 1]
+        local key = string.sub(lock, 6)
+        local beat = redis.call("hget", KEYS[2], key) or ""
+        if redis.call("get", lock) == ARGV[2 * n] and beat == ARGV[2 * n + 1] then
+            local signal = "lock-signal:" .. key
+            redis.call("del", lock)
+            redis.call("del", signal)
+            redis.call("lpush", signal, 1)
+            redis.call("pexpire", signal, ARGV[1])
+            redis.call("zrem", KEYS[1], key)
+            redis.call("hdel", KEYS[2], key)
+            redis.call("publish", KEYS[2 * n + 2], key)
+            table.insert(reclaimed, n)
+        end
+    end
+    return reclaimed
+"""
+
+# Drops locks that expired before ARGV[1] from the index KEYS[1] and heartbeats KEYS[2], returning those left
+PRUNE_SCRIPT = b"""
+    local expired = redis.call("zrangebyscore", KEYS[1], "-inf", ARGV[1])
+    for i = 1, #expired, 1000 do
+        local chunk = {unpack(expired, i, math.min(i + 999, #expired))}
+        redis.call("zrem", KEYS[1], unpack(chunk))
+        redis.call("hdel", KEYS[2], unpack(chunk))
+    end
+    return redis.call("zrange", KEYS[1], 0, -1)
+"""
+
+# As PRUNE_SCRIPT, for the candidate keys ARGV[2:] only: returns those live, dropping those expired
+PRUNE_KEYS_SCRIPT = b"""
+    local live = {}
+    for i = 2, #ARGV do
+        local score = redis.call("zscore", KEYS[1], ARGV[i])
+        if score then
+            if score == "inf" or tonumber(score) > tonumber(ARGV[1]) then
+                table.insert(live, ARGV[i])
+            else
+                redis.call("zrem", KEYS[1], ARGV[i])
+                redis.call("hdel", KEYS[2], ARGV[i])
+            end
+        end
+    end
+    return live
+"""
+
+
+class RedisLock(redis_lock.Lock):
+    """A redis_lock.Lock that keeps the factory's index of live locks up to date
+
+    Auto-renewal is left to the factory's LeaseRenewer rather than a thread per lock
+    """
+    def __init__(self, factory, key, **params):
+        super().__init__(factory.client, name=key, **params)
+        self.factory = factory
+        self.key = key
+
+    def acquire(self, blocking=True, timeout=None):
+        acquired = super().acquire(blocking=blocking, timeout=timeout)
+        if acquired:
+            self.factory.index(self.key, self._expire)
+        return acquired
+
+    def extend(self, expire=None):
+        super().extend(expire=expire)
+        self.factory.index(self.key, expire or self._expire)
+
+    @property
+    def renewal_interval(self):
+        return self._lock_renewal_interval
+
+    def _start_lock_renewer(self):
+        self.factory.renewer.register(self)
+
+    def _stop_lock_renewer(self):
+        self.factory.renewer.deregister(self)
+
+    def release(self):
+        if self._lock_renewal_interval is not None:
+            self._stop_lock_renewer()
+        error = self.factory.release_script(
+            keys=(
+                self._name, self._signal, self.factory.index_key, self.factory.channel(self.key),
+                self.factory.heartbeat_key,
+            ),
+            args=(self._id, self._signal_expire, self.key),
+        )
+        if error == 1:
+            raise redis_lock.NotAcquired(f'Lock({self._name}) is not acquired or it already expired.')
+
+
+class RedisReleaseListener(ReleaseListener):
+    """Wakes on release notifications published by RedisLock"""
+    def __init__(self, factory, keys):
+        super().__init__(keys)
+        self.pubsub = factory.client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(*[factory.channel(key) for key in keys])
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self.pubsub.get_message(timeout=remaining):
+                return True
+
+    def close(self):
+        self.pubsub.close()
 
 
 class RedisLockFactory(LockFactoryMeta):
-    def __init__(self, client=None):
-        self.client = client or StrictRedis()
+    """Locks in a redis server
+
+    Locks name their holder in their id (see resource_locker.factories.holder). Given a `heartbeat_interval`,
+    the heartbeats of auto-renewing locks are recorded that often, so that waiters can `reclaim` locks of holders
+    on other hosts that stopped, long before their leases run out; by default they are only recorded on renewal.
+    """
+    supports_acquire_many = True
+    supports_fair_queue = True
+    supports_reclaim = True
+    supports_keyed_lookup = True
+    index_key = 'lock-index'
+    heartbeat_key = 'lock-heartbeat'
+    signal_expire = 1000
+    _shared = None
+
+    def __init__(self, client=None, heartbeat_interval=None):
+        self.client = client or connections.get_client('locks')
+        self.heartbeat_interval = heartbeat_interval
         self.logger = logging.getLogger(__name__)
+        # key: (id, heartbeat) of a lock, and when it was first seen so, for reclaim
+        self._observed = {}
+        self.acquire_many_script = self.client.register_script(ACQUIRE_MANY_SCRIPT)
+        self.acquire_groups_script = self.client.register_script(ACQUIRE_GROUPS_SCRIPT)
+        self.release_script = self.client.register_script(RELEASE_SCRIPT)
+        self.queued_ahead_script = self.client.register_script(QUEUED_AHEAD_SCRIPT)
+        self.renew_script = self.client.register_script(RENEW_SCRIPT)
+        self.beat_script = self.client.register_script(BEAT_SCRIPT)
+        self.reclaim_script = self.client.register_script(RECLAIM_SCRIPT)
+        self.prune_script = self.client.register_script(PRUNE_SCRIPT)
+        self.prune_keys_script = self.client.register_script(PRUNE_KEYS_SCRIPT)
+        self.renewer = LeaseRenewer(self)
+
+    @classmethod
+    def shared(cls):
+        """The process-wide factory, used by Lock unless told otherwise"""
+        # a new pool, after a fork or connections.configure, needs a new factory
+        pool = connections.get_pool('locks')
+        if cls._shared is None or cls._shared[0] is not pool:
+            cls._shared = (pool, cls())
+        return cls._shared[1]
+
+    @staticmethod
+    def _expiry(expire):
+        """Index score for a lock taken now"""
+        return time.time() + int(expire) if expire else '+inf'
+
+    @staticmethod
+    def _states(keys, ttls, heartbeats):
+        """LockStates of the locked keys, from their PTTLs and heartbeat times"""
+        now = time.time()
+        return {
+            key: LockState(ttl / 1000 if ttl >= 0 else None, now - float(beat) if beat else None)
+            for key, ttl, beat in zip(keys, ttls, heartbeats)
+            # -2: not locked
+            if ttl != -2
+        }
+
+    @staticmethod
+    def channel(key):
+        """Pub/sub channel announcing releases of a lock"""
+        return f'lock-released:{key}'
+
+    def index(self, key, expire):
+        """Records a live lock, its expected expiry and its heartbeat"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(self.index_key, {key: self._expiry(expire)})
+        pipe.hset(self.heartbeat_key, key, time.time())
+        pipe.execute()
+
+    def _lock_id(self, auto_renewal):
+        """A new lock id, naming this process as holder"""
+        return Holder.this_process(self.heartbeat_interval if auto_renewal else 0).lock_id()
 
     def new_lock(self, key, **params):
         """Creates a new lock with a lock manager"""
-        opts = {k: v for k, v in params.items() if k in {'expire', 'auto_renewal'}}
-        return redis_lock.Lock(self.client, name=key, **opts)
+        opts = {k: v for k, v in params.items() if k in {'expire', 'auto_renewal', 'id'}}
+        opts.setdefault('id', self._lock_id(opts.get('auto_renewal')))
+        return RedisLock(self, key, **opts)
+
+    def acquire_many(self, keys, need, **params):
+        """Takes the first `need` free keys in a single round trip"""
+        return self.acquire_up_to(keys, need, least=need, **params)
+
+    def acquire_up_to(self, keys, need, least=0, **params):
+        """Takes up to `need` of the first free keys in a single round trip, or none if fewer than `least` are free"""
+        if not keys:
+            return []
+        # the id is shared by all the locks taken in this call; names differ so they remain independent
+        params = dict(params, id=self._lock_id(params.get('auto_renewal')))
+        expire = int(params.get('expire') or 0)
+        indices = self.acquire_many_script(
+            keys=[self.index_key, self.heartbeat_key] + [f'lock:{key}' for key in keys],
+            args=[need, expire, params['id'], self._expiry(expire), time.time(), least],
+        )
+        obtained = []
+        for i in indices:
+            key = keys[i - 1]
+            lock = self.new_lock(key, **params)
+            if lock._lock_renewal_interval is not None:
+                lock._start_lock_renewer()
+            obtained.append((key, lock))
+        return obtained
+
+    def acquire_groups(self, groups, **params):
+        """Takes each group of keys all-or-nothing, all in a single round trip"""
+        groups = [list(keys) for keys in groups]
+        if not any(groups):
+            return [[] for _ in groups]
+        params = dict(params, id=self._lock_id(params.get('auto_renewal')))
+        expire = int(params.get('expire') or 0)
+        taken = set(self.acquire_groups_script(
+            keys=[self.index_key, self.heartbeat_key] + [f'lock:{key}' for keys in groups for key in keys],
+            args=[expire, params['id'], self._expiry(expire), time.time()] + [len(keys) for keys in groups],
+        ))
+        results = []
+        for position, keys in enumerate(groups, 1):
+            obtained = []
+            if position in taken:
+                for key in keys:
+                    lock = self.new_lock(key, **params)
+                    if lock._lock_renewal_interval is not None:
+                        lock._start_lock_renewer()
+                    obtained.append((key, lock))
+            results.append(obtained)
+        return results
+
+    def renew_all(self, locks):
+        """Extends held locks in a single round trip, returning those that were lost"""
+        args = [time.time()]
+        for lock in locks:
+            args.extend((lock.id, lock._expire))
+        lost = self.renew_script(keys=[self.index_key, self.heartbeat_key] + [lock._name for lock in locks], args=args)
+        return [locks[i - 1] for i in lost]
+
+    def beat_all(self, locks):
+        """Records the heartbeats of held locks in a single round trip, returning those that were lost"""
+        lost = self.beat_script(
+            keys=[self.heartbeat_key] + [lock._name for lock in locks],
+            args=[time.time()] + [lock.id for lock in locks],
+        )
+        return [locks[i - 1] for i in lost]
+
+    def reclaim(self, keys, missed=3):
+        """Releases the locks of `keys` whose holders are gone, returning their keys
+
+        A holder on this host is gone only once its process has exited; one on another host, whose process cannot
+        be looked at, is gone if it heartbeats but its heartbeat has not changed for `missed` heartbeat intervals.
+        This is timed by this factory, as it sees a lock over repeated calls, so that clocks need not agree.
+        Locks whose ids do not name a holder are never reclaimed.
+        """
+        keys = [str(key) for key in keys]
+        if not keys:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        pipe.mget([f'lock:{key}' for key in keys])
+        pipe.hmget(self.heartbeat_key, keys)
+        ids, beats = pipe.execute()
+        now = time.monotonic()
+        stale = []
+        for key, lock_id, beat in zip(keys, ids, beats):
+            holder = Holder.parse(lock_id) if lock_id is not None else None
+            if holder is None:
+                self._observed.pop(key, None)
+                continue
+            seen = (lock_id, beat or b'')
+            if self._observed.get(key, (None,))[0] != seen:
+                self._observed[key] = (seen, now)
+            since = self._observed[key][1]
+            # a stalled heartbeat does not outweigh a process seen to be running
+            if holder.is_gone() or (holder.beat and now - since >= missed * holder.beat and not holder.is_alive()):
+                stale.append((key, holder, seen))
+        if not stale:
+            return []
+        keys_args = [self.index_key, self.heartbeat_key]
+        args = [self.signal_expire]
+        for key, _, seen in stale:
+            keys_args.extend((f'lock:{key}', self.channel(key)))
+            args.extend(seen)
+        reclaimed = []
+        for position in self.reclaim_script(keys=keys_args, args=args):
+            key, holder, _ = stale[position - 1]
+            self._observed.pop(key, None)
+            self.logger.warning('reclaimed %s from %s, which is gone', key, holder)
+            reclaimed.append(key)
+        return reclaimed
+
+    def release_listener(self, keys):
+        return RedisReleaseListener(self, keys)
+
+    def queued_ahead(self, queue, ticket, score, need, ttl):
+        return self.queued_ahead_script(keys=[f'lock-queue:{queue}'], args=[ticket, score, int(ttl * 1000), need])
+
+    def dequeue(self, queue, ticket):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrem(f'lock-queue:{queue}', ticket)
+        pipe.delete(f'lock-ticket:{ticket}')
+        pipe.execute()
+
+    def get_lock_list(self, keys=None):
+        """Gets a list of live locks to optimise acquisition attempts
+
+        Reads the index rather than scanning the keyspace; expired entries are pruned on the way
+        """
+        now = time.time()
+        if keys is not None:
+            keys = [str(key) for key in keys]
+            if not keys:
+                return []
+            live = self.prune_keys_script(keys=[self.index_key, self.heartbeat_key], args=[now, *keys])
+            return [k.decode('utf8') for k in live]
+        return [k.decode('utf8') for k in self.prune_script(keys=[self.index_key, self.heartbeat_key], args=[now])]
 
-    def get_lock_list(self):
-        """Gets a list of live locks to optimise acquisition attempts"""
-        prefix = 'lock:'
-        return [k.decode('utf8').split(':', 1)[1] for k in self.client.keys(f'{prefix}*')]
+    def get_lock_states(self, keys):
+        """Reads the remaining lease and heartbeat of each candidate in a single round trip"""
+        keys = [str(key) for key in keys]
+        if not keys:
+            return {}
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.pttl(f'lock:{key}')
+        pipe.hmget(self.heartbeat_key, keys)
+        *ttls, heartbeats = pipe.execute()
+        return self._states(keys, ttls, heartbeats)
 
     def clear_all(self):
         """Clears all locks"""
         self.logger.critical('caution: clearing all locks; collision safety is voided')
         redis_lock.reset_all(self.client)
+        self.client.delete(self.index_key, self.heartbeat_key)
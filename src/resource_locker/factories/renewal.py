@@ -0,0 +1,98 @@
+import logging
+import os
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseRenewer:
+    """Renews the leases of every auto-renewing lock held through a factory
+
+    One thread per factory (per process) renews all the locks at once, at the shortest renewal interval among them,
+    with the factory's `renew_all`. Locks must have `key`, `id` and `renewal_interval` attributes.
+    If the factory has a `heartbeat_interval`, the locks' heartbeats are also recorded that often between renewals,
+    with its `beat_all`, without extending their leases.
+    Locks that are garbage collected without release are forgotten, and left to expire.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.locks = weakref.WeakValueDictionary()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.pid = None
+
+    def register(self, lock):
+        with self.condition:
+            if self.pid != os.getpid():
+                # the locks and thread of a parent process are not ours to keep alive
+                self.locks.clear()
+                self.thread = None
+                self.pid = os.getpid()
+            self.locks[lock.key, lock.id] = lock
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='resource_locker-renewal', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def deregister(self, lock):
+        with self.condition:
+            self.locks.pop((lock.key, lock.id), None)
+
+    def _interval(self):
+        intervals = [lock.renewal_interval for lock in self.locks.values()]
+        return min(intervals) if intervals else None
+
+    def _run(self):
+        next_tick = None
+        next_renewal = None
+        while True:
+            with self.condition:
+                while True:
+                    interval = self._interval()
+                    now = time.monotonic()
+                    if interval is None:
+                        next_tick = next_renewal = None
+                        self.condition.wait()
+                        continue
+                    beat = getattr(self.factory, 'heartbeat_interval', None)
+                    tick = min(interval, beat) if beat else interval
+                    if next_renewal is None or next_renewal > now + interval:
+                        next_renewal = now + interval
+                    if next_tick is None or next_tick > now + tick:
+                        next_tick = now + tick
+                    if now >= next_tick:
+                        break
+                    self.condition.wait(next_tick - now)
+                locks = list(self.locks.values())
+                next_tick = now + tick
+                renewing = now >= next_renewal
+                if renewing:
+                    next_renewal = now + interval
+            if renewing:
+                self.renew(locks)
+            else:
+                self.beat(locks)
+
+    def renew(self, locks):
+        """Extends the given locks"""
+        self._keep(self.factory.renew_all, locks)
+
+    def beat(self, locks):
+        """Records the given locks' heartbeats"""
+        self._keep(self.factory.beat_all, locks)
+
+    def _keep(self, method, locks):
+        if not locks:
+            return
+        try:
+            lost = method(locks)
+        except Exception:
+            logger.exception('lock renewal failed, will retry')
+            return
+        for lock in lost:
+            with self.condition:
+                # a lock released during renewal is not lost
+                if self.locks.pop((lock.key, lock.id), None) is not None:
+                    logger.warning('%s expired or was taken before it could be renewed', lock.key)
@@ -0,0 +1,364 @@
+import bisect
+import hashlib
+import logging
+import os
+import random
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from os import urandom
+
+import redis_lock
+from redis import StrictRedis
+
+from .meta import LockFactoryMeta
+from .meta import LockState
+from .meta import ReleaseListener
+from .redis import RedisLockFactory
+from .renewal import LeaseRenewer
+
+"""Locks spread over several redis servers
+
+ShardedRedisLockFactory places each key on one of its servers by consistent
+hashing, so that load (and the impact of losing a server) is shared between
+them. QuorumRedisLockFactory instead takes each lock on a majority of its
+servers (as Redlock), so that locks survive the loss of a minority of them.
+"""
+
+
+def _name(client):
+    """Identifies a server by its connection settings, so that a ring is the same in every process"""
+    kwargs = client.connection_pool.connection_kwargs
+    where = kwargs.get('path') or f"{kwargs.get('host', 'localhost')}:{kwargs.get('port', 6379)}"
+    return f"{where}/{kwargs.get('db', 0)}"
+
+
+def _client(server):
+    return StrictRedis.from_url(server) if isinstance(server, str) else server
+
+
+class HashRing:
+    """Consistent hashing of keys onto named nodes
+
+    Each node is placed at `replicas` points on a ring, and a key belongs to the node at the first point
+    after its hash; adding or removing a node only moves the keys between its points and their predecessors,
+    about 1/n of them.
+    """
+    def __init__(self, nodes=(), replicas=128):
+        self.replicas = replicas
+        self._points = []
+        self._hashes = []
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def hash(value):
+        return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], 'big')
+
+    def add(self, node):
+        for i in range(self.replicas):
+            bisect.insort(self._points, (self.hash(f'{node}#{i}'), node))
+        self._hashes = [h for h, _ in self._points]
+
+    def remove(self, node):
+        self._points = [point for point in self._points if point[1] != node]
+        self._hashes = [h for h, _ in self._points]
+
+    def node(self, key):
+        return self._points[bisect.bisect(self._hashes, self.hash(key)) % len(self._points)][1]
+
+    def group(self, keys):
+        """Keys by node, in the order given"""
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.node(key), []).append(key)
+        return groups
+
+
+class FanOut:
+    """Runs a call against several servers at once"""
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+
+    def map(self, call, *iterables):
+        calls = list(zip(*iterables))
+        if len(calls) <= 1:
+            return [call(*args) for args in calls]
+        if self._pid != os.getpid():
+            # the threads of a parent process do not survive a fork
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='resource_locker-fan-out')
+            self._pid = os.getpid()
+        return list(self._executor.map(lambda args: call(*args), calls))
+
+
+class MultiReleaseListener(ReleaseListener):
+    """Waits on the listeners of several servers, taking turns"""
+    poll = 0.01
+
+    def __init__(self, keys, listeners):
+        super().__init__(keys)
+        self.listeners = listeners
+
+    def wait(self, timeout):
+        if len(self.listeners) == 1:
+            return self.listeners[0].wait(timeout)
+        deadline = time.monotonic() + timeout
+        while True:
+            for listener in self.listeners:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if listener.wait(min(self.poll, remaining)):
+                    return True
+
+    def close(self):
+        for listener in self.listeners:
+            listener.close()
+
+
+class ShardedRedisLockFactory(LockFactoryMeta):
+    """Spreads locks over several redis servers, each key living on one of them
+
+    `servers` are redis URLs or clients. Keys are placed by consistent hashing, so changing the servers
+    moves only a share of the keys; it must not be done while locks are held, as a key that moves could
+    then be locked twice. Multi-key operations go out to the servers involved in parallel.
+    With the default `global` concurrency, the lock of locks lives on one server; `striped` spreads them.
+    """
+    supports_acquire_many = True
+    supports_fair_queue = True
+    supports_reclaim = True
+    supports_keyed_lookup = True
+
+    def __init__(self, servers, replicas=128):
+        self.shards = {}
+        for server in servers:
+            client = _client(server)
+            self.shards[_name(client)] = RedisLockFactory(client=client)
+        self.ring = HashRing(self.shards, replicas=replicas)
+        self.fan_out = FanOut(len(self.shards))
+        self.logger = logging.getLogger(__name__)
+
+    def shard(self, key):
+        """The factory for the server holding a key"""
+        return self.shards[self.ring.node(key)]
+
+    def _each(self, call, keys=None):
+        """Calls `call(shard, shard_keys)` on every shard, or those holding `keys`, in parallel"""
+        groups = {name: None for name in self.shards} if keys is None else self.ring.group(keys)
+        return self.fan_out.map(call, [self.shards[name] for name in groups], groups.values())
+
+    def new_lock(self, key, **params):
+        return self.shard(key).new_lock(key, **params)
+
+    def acquire_many(self, keys, need, **params):
+        """Takes up to `need` keys from each shard at once, keeping the first `need` of those obtained
+
+        The surplus is released straight away; if `need` keys could not be had, all of them are
+        """
+        if not keys:
+            return []
+        groups = self.ring.group(keys)
+        if len(groups) == 1:
+            return self.shards[next(iter(groups))].acquire_many(keys, need, **params)
+        obtained = {}
+        for pairs in self.fan_out.map(
+                lambda name, shard_keys: self.shards[name].acquire_up_to(shard_keys, need, **params),
+                groups, groups.values(),
+        ):
+            obtained.update(pairs)
+        chosen = [key for key in keys if key in obtained][:need]
+        if len(chosen) < need:
+            chosen = []
+        kept = set(chosen)
+        surplus = [lock for key, lock in obtained.items() if key not in kept]
+        if surplus:
+            self.fan_out.map(self._release, surplus)
+        return [(key, obtained[key]) for key in chosen]
+
+    def _release(self, lock):
+        try:
+            lock.release()
+        except Exception:
+            self.logger.exception('surplus lock release failed:')
+
+    def release_listener(self, keys):
+        groups = self.ring.group(keys)
+        return MultiReleaseListener(keys, [self.shards[name].release_listener(ks) for name, ks in groups.items()])
+
+    def get_lock_list(self, keys=None):
+        """Gets the live locks of all the shards (or of those holding `keys`), merged"""
+        if keys is not None:
+            keys = [str(key) for key in keys]
+            locked = set()
+            for found in self._each(lambda shard, shard_keys: shard.get_lock_list(keys=shard_keys), keys):
+                locked.update(found)
+            return [key for key in keys if key in locked]
+        return [key for found in self._each(lambda shard, _: shard.get_lock_list()) for key in found]
+
+    def get_lock_states(self, keys):
+        states = {}
+        for found in self._each(lambda shard, shard_keys: shard.get_lock_states(shard_keys), keys):
+            states.update(found)
+        return states
+
+    def reclaim(self, keys, missed=3):
+        found = self._each(lambda shard, shard_keys: shard.reclaim(shard_keys, missed=missed), [str(k) for k in keys])
+        return [key for reclaimed in found for key in reclaimed]
+
+    def clear_all(self):
+        self._each(lambda shard, _: shard.clear_all())
+
+    def queued_ahead(self, queue, ticket, score, need, ttl):
+        return self.shard(queue).queued_ahead(queue, ticket, score, need, ttl)
+
+    def dequeue(self, queue, ticket):
+        return self.shard(queue).dequeue(queue, ticket)
+
+
+class QuorumLock:
+    """A lock held on a majority of a QuorumRedisLockFactory's servers
+
+    An acquisition counts only if a majority of the servers granted it within the validity of the lease,
+    allowing for clock drift; otherwise whatever was granted is handed back.
+    """
+    def __init__(self, factory, key, expire=None, auto_renewal=False, id=None):
+        if auto_renewal and not expire:
+            raise ValueError('Expire may not be None when auto_renewal is set')
+        self.factory = factory
+        self.key = key
+        self.id = id or b64encode(urandom(18)).decode('ascii')
+        self.expire = int(expire) if expire else None
+        self.renewal_interval = self.expire * 2 / 3 if auto_renewal else None
+        # renewal is done for all servers at once, by the factory
+        self.locks = [node.new_lock(key, expire=expire, id=self.id) for node in factory.nodes]
+
+    def _on_each(self, method, *args):
+        """Calls a method of the lock on each server, returning which succeeded"""
+        def call(lock):
+            try:
+                return getattr(lock, method)(*args) is not False
+            except Exception:
+                return False
+        return self.factory.fan_out.map(call, self.locks)
+
+    def _attempt(self):
+        start = time.monotonic()
+        granted = self._on_each('acquire', False)
+        elapsed = time.monotonic() - start
+        valid = self.expire is None or elapsed < self.expire * (1 - self.factory.drift)
+        if sum(granted) >= self.factory.quorum and valid:
+            return True
+        self.factory.fan_out.map(self._release_one, [lock for lock, ok in zip(self.locks, granted) if ok])
+        return False
+
+    @staticmethod
+    def _release_one(lock):
+        try:
+            lock.release()
+        except Exception:
+            pass
+
+    def acquire(self, blocking=True, timeout=None):
+        deadline = time.monotonic() + timeout if timeout else None
+        poll = 0.01
+        while not self._attempt():
+            if not blocking or (deadline and time.monotonic() > deadline):
+                return False
+            # randomised, so that competing clients do not keep splitting the servers between them
+            time.sleep(random.uniform(0, poll))
+            poll = min(poll * 2, 0.2)
+        if self.renewal_interval is not None:
+            self.factory.renewer.register(self)
+        return True
+
+    def extend(self, expire=None):
+        if sum(self._on_each('extend', expire)) < self.factory.quorum:
+            raise redis_lock.NotAcquired(f'Lock({self.key}) is not held on a majority of servers.')
+
+    def release(self):
+        self.factory.renewer.deregister(self)
+        if not any(self._on_each('release')):
+            raise redis_lock.NotAcquired(f'Lock({self.key}) is not acquired or it already expired.')
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class QuorumRedisLockFactory(LockFactoryMeta):
+    """Takes every lock on a majority of several independent redis servers (Redlock)
+
+    `servers` are redis URLs or clients, ideally of separate machines; locking goes on while a majority of
+    them are reachable. `drift` is the share of a lease allowed for clock drift between servers.
+    Release notifications are only listened for on the first server.
+    """
+    supports_keyed_lookup = True
+
+    def __init__(self, servers, drift=0.01):
+        self.nodes = [RedisLockFactory(client=_client(server)) for server in servers]
+        self.quorum = len(self.nodes) // 2 + 1
+        self.drift = drift
+        self.fan_out = FanOut(len(self.nodes))
+        self.renewer = LeaseRenewer(self)
+        self.logger = logging.getLogger(__name__)
+
+    def new_lock(self, key, **params):
+        opts = {k: v for k, v in params.items() if k in {'expire', 'auto_renewal', 'id'}}
+        return QuorumLock(self, key, **opts)
+
+    def renew_all(self, locks):
+        lost = []
+        for lock in locks:
+            try:
+                lock.extend()
+            except redis_lock.NotAcquired:
+                lost.append(lock)
+        return lost
+
+    def release_listener(self, keys):
+        return self.nodes[0].release_listener(keys)
+
+    def _all(self, call):
+        def safely(node):
+            try:
+                return call(node)
+            except Exception:
+                self.logger.warning('lock server unavailable', exc_info=True)
+                return None
+        return [result for result in self.fan_out.map(safely, self.nodes) if result is not None]
+
+    def get_lock_list(self, keys=None):
+        """Gets the keys locked on a majority of the servers"""
+        counts = {}
+        for found in self._all(lambda node: node.get_lock_list(keys=keys)):
+            for key in found:
+                counts[key] = counts.get(key, 0) + 1
+        locked = [key for key, count in counts.items() if count >= self.quorum]
+        if keys is not None:
+            locked = set(locked)
+            return [key for key in (str(key) for key in keys) if key in locked]
+        return sorted(locked)
+
+    def get_lock_states(self, keys):
+        """States of the keys locked on a majority; a lock lapses once fewer than a majority still hold it"""
+        found = {}
+        for states in self._all(lambda node: node.get_lock_states(keys)):
+            for key, state in states.items():
+                found.setdefault(key, []).append(state)
+        result = {}
+        for key, states in found.items():
+            if len(states) < self.quorum:
+                continue
+            # no expiry sorts last
+            ttls = sorted((s.ttl for s in states), key=lambda ttl: float('inf') if ttl is None else ttl, reverse=True)
+            ages = [s.heartbeat_age for s in states if s.heartbeat_age is not None]
+            result[key] = LockState(ttls[self.quorum - 1], min(ages) if ages else None)
+        return result
+
+    def clear_all(self):
+        self._all(lambda node: node.clear_all() or True)
@@ -1,6 +1,8 @@
 from .aspects import Aspects
 from .reporter import RedisReporter
 from .reporter import DummyReporter
+from .background import BackgroundReporter
+from .metrics import MetricsReporter
 from .reporter import safe
 from .timer import Timer
 from .query import Query
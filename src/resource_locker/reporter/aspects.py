@@ -5,6 +5,8 @@ class Aspects:
     lock_release_wait = 'lock_release_wait'
     lock_acquire_wait = 'lock_acquire_wait'
     lock_acquire_fail_count = 'lock_acquire_fail_count'
+    lock_queue_count = 'lock_queue_count'
+    lock_queue_wait = 'lock_queue_wait'
 
     @staticmethod
     def validate(*aspects):
@@ -0,0 +1,165 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from resource_locker import connections
+from .aspects import Aspects
+from .reporter import Increments
+from .reporter import RedisReporter
+
+"""Reporting off the lock path
+
+Reports are put on a bounded queue, drained by a background thread that
+merges them in memory and writes the totals on an interval, or sooner if
+enough distinct counters pile up. If the queue is full, reports are dropped
+rather than holding up the lock.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class Aggregator:
+    def __init__(self, client, flush_interval=1.0, flush_size=1000, queue_size=10000):
+        self.client = client
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._increments = Increments()
+        self._write_lock = threading.Lock()
+        self._worker = None
+
+    def start(self):
+        self._worker = threading.Thread(target=self._run, name='resource_locker-reporter', daemon=True)
+        self._worker.start()
+        return self
+
+    def put(self, tags, aspects, samples, series=(), at=None):
+        try:
+            self.queue.put_nowait((tags, aspects, samples, series, at))
+        except queue.Full:
+            self.dropped += 1
+
+    def _add(self, item):
+        try:
+            self._increments.add(*item)
+        except Exception:
+            logger.exception('invalid report')
+
+    def _drain(self):
+        """Merges queued reports, returning any flush requests found among them"""
+        requests = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return requests
+            if isinstance(item, threading.Event):
+                requests.append(item)
+            else:
+                self._add(item)
+
+    def _write(self):
+        with self._write_lock:
+            increments, self._increments = self._increments, Increments()
+            if self.dropped:
+                logger.warning('reporting queue full, %s reports dropped', self.dropped)
+                self.dropped = 0
+            if increments:
+                try:
+                    increments.write(self.client.pipeline(transaction=False)).execute()
+                except Exception:
+                    logger.exception('reporting failed')
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0, next_flush - time.monotonic()))
+            except queue.Empty:
+                item = None
+            requests = [item] if isinstance(item, threading.Event) else []
+            if item is not None and not requests:
+                self._add(item)
+            if requests or len(self._increments) >= self.flush_size or time.monotonic() >= next_flush:
+                requests += self._drain()
+                self._write()
+                next_flush = time.monotonic() + self.flush_interval
+                for request in requests:
+                    request.set()
+
+    def flush(self, timeout=None):
+        """Writes everything reported so far"""
+        if self._worker is not None and self._worker.is_alive():
+            request = threading.Event()
+            self.queue.put(request)
+            return request.wait(timeout)
+        self._drain()
+        self._write()
+        return True
+
+
+_aggregators = {}
+_aggregators_lock = threading.Lock()
+
+
+def _forget_aggregators():
+    # the workers of a parent process do not survive a fork, and its queued reports are its own to write
+    global _aggregators_lock
+    _aggregators.clear()
+    _aggregators_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_aggregators)
+
+
+def aggregator_for(client, **options):
+    """The aggregator shared by all reporters of one redis database"""
+    kwargs = client.connection_pool.connection_kwargs
+    ident = tuple(kwargs.get(k) for k in ('host', 'port', 'path', 'db'))
+    with _aggregators_lock:
+        if ident not in _aggregators:
+            _aggregators[ident] = Aggregator(client, **options).start()
+        aggregator = _aggregators[ident]
+        if aggregator.client.connection_pool is not client.connection_pool \
+                and client.connection_pool is connections.get_pool('reports'):
+            # connections were reconfigured since the aggregator started
+            aggregator.client = client
+        return aggregator
+
+
+@atexit.register
+def flush_all(timeout=5):
+    for aggregator in list(_aggregators.values()):
+        aggregator.flush(timeout)
+
+
+class BackgroundReporter(RedisReporter):
+    """A RedisReporter that hands reports to a background thread
+
+    Options for the shared aggregator (`flush_interval`, `flush_size`, `queue_size`) take effect
+    for the first reporter of each redis database.
+    """
+    def __init__(self, client=None, flush_interval=1.0, flush_size=1000, queue_size=10000, **kwargs):
+        super().__init__(client=client, **kwargs)
+        self.aggregator = aggregator_for(
+            self.client,
+            flush_interval=flush_interval,
+            flush_size=flush_size,
+            queue_size=queue_size,
+        )
+
+    def _increment_all(self, tags, aspects, samples=None):
+        samples = samples or {}
+        Aspects.validate(*list(aspects), *list(samples))
+        # bucketed as of now, not as of the write
+        self.aggregator.put(tags, aspects, samples, self.series, time.time() if self.series else None)
+        return len(tags) * len(aspects)
+
+    def flush(self, timeout=None):
+        """Writes everything reported so far, from all reporters of this redis database"""
+        return self.aggregator.flush(timeout)
@@ -0,0 +1,52 @@
+import math
+
+"""Log-scale histograms of durations
+
+Each doubling of duration is split into `resolution` buckets, from 1ms upwards,
+so percentiles are accurate to within ~20% however long the tail is.
+"""
+
+resolution = 4
+field_template = '{aspect}:{bucket}'
+
+
+def bucket(seconds):
+    """Index of the bucket a duration falls into"""
+    if seconds <= 0.001:
+        return 0
+    return math.ceil(resolution * math.log2(seconds * 1000))
+
+
+def upper_bound(index):
+    """Longest duration, in seconds, held by a bucket"""
+    return 2 ** (index / resolution) / 1000
+
+
+def field(aspect, seconds):
+    return field_template.format(aspect=aspect, bucket=bucket(seconds))
+
+
+def counts(fields, aspect):
+    """Picks one aspect's bucket counts out of stored histogram fields"""
+    prefix = field_template.format(aspect=aspect, bucket='')
+    return {
+        int(k[len(prefix):]): int(v) for k, v in fields.items() if k.startswith(prefix)
+    }
+
+
+def percentiles(bucket_counts, *ps):
+    """Estimates percentiles (0-100) from bucket counts as bucket upper bounds, None if empty"""
+    total = sum(bucket_counts.values())
+    result = {}
+    for p in ps:
+        if not total:
+            result[p] = None
+            continue
+        rank = max(1, math.ceil(total * p / 100))
+        seen = 0
+        for index in sorted(bucket_counts):
+            seen += bucket_counts[index]
+            if seen >= rank:
+                result[p] = upper_bound(index)
+                break
+    return result
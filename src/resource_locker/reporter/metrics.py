@@ -0,0 +1,231 @@
+import bisect
+import http.server
+import logging
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from .aspects import Aspects
+from .reporter import RedisReporter
+
+"""Lock metrics kept in process, for scraping
+
+Counts and durations are recorded per set of tags, in memory: each thread
+keeps its own shard, so recording takes no lock and makes no round trip.
+Shards are merged only when the metrics are exposed, in OpenMetrics text
+format, by an HTTP endpoint or a file dump (e.g. for a node exporter's
+textfile collector).
+
+Each distinct tag set is a series; beyond `max_series` of them, reports are
+counted against a single overflow series instead, so that memory and scrape
+size stay bounded however many resources are locked.
+"""
+
+logger = logging.getLogger(__name__)
+
+prefix = 'resource_locker_'
+content_type = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+# upper bounds of the duration histograms, in seconds
+default_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, float('inf'))
+overflow = (('overflow', 'true'),)
+
+
+def label_name(tag):
+    name = re.sub(r'[^a-zA-Z0-9_]', '_', str(tag))
+    return name if re.match(r'[a-zA-Z_]', name) else f'_{name}'
+
+
+def label_value(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value)
+
+
+def family(aspect):
+    """Metric family name and type of an aspect: counts are counters, waits are histograms in seconds"""
+    if aspect.endswith('_count'):
+        return prefix + aspect[:-len('_count')], 'counter'
+    return prefix + aspect + '_seconds', 'histogram'
+
+
+class Series:
+    """The totals of one tag set, in one shard"""
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        # aspect: [bucket counts..., sum, count]
+        self.histograms = {}
+
+
+class Registry:
+    """In-process lock metrics, shared by MetricsReporters
+
+    `labels` limits which tags become labels (all, by default). Histogram `buckets` are upper bounds,
+    in seconds; +Inf is added if missing.
+    """
+    def __init__(self, max_series=1000, buckets=default_buckets, labels=None):
+        self.max_series = max_series
+        self.buckets = tuple(sorted(set(buckets) | {float('inf')}))
+        self.labels = None if labels is None else set(labels)
+        self.overflowed = 0
+        self._series = set()
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _key(self, tags):
+        key = tuple(sorted(
+            (label_name(tag), str(value)) for tag, value in tags.items()
+            if self.labels is None or tag in self.labels
+        ))
+        if key in self._series:
+            return key
+        with self._lock:
+            if key not in self._series:
+                if len(self._series) >= self.max_series:
+                    self.overflowed += 1
+                    return overflow
+                self._series.add(key)
+        return key
+
+    def record(self, tags, aspects):
+        """Counts a report against its tag set"""
+        Aspects.validate(*list(aspects))
+        shard = self._shard()
+        key = self._key(tags)
+        series = shard.get(key)
+        if series is None:
+            series = shard[key] = Series()
+        for aspect, value in aspects.items():
+            if value is None:
+                continue
+            if aspect.endswith('_count'):
+                series.counters[aspect] = series.counters.get(aspect, 0) + value
+                continue
+            histogram = series.histograms.get(aspect)
+            if histogram is None:
+                histogram = series.histograms[aspect] = [0] * (len(self.buckets) + 2)
+            histogram[bisect.bisect_left(self.buckets, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+        return len(aspects)
+
+    def collect(self):
+        """Totals of all shards: {(labels, aspect): count, or [bucket counts..., sum, count]}"""
+        with self._lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            # copies are taken at once, as the shard's thread may be adding to it
+            for key, series in list(shard.items()):
+                for aspect, count in list(series.counters.items()):
+                    totals[key, aspect] = totals.get((key, aspect), 0) + count
+                for aspect, histogram in list(series.histograms.items()):
+                    merged = totals.setdefault((key, aspect), [0] * len(histogram))
+                    for i, value in enumerate(list(histogram)):
+                        merged[i] += value
+        return totals
+
+    def expose(self):
+        """The metrics, in OpenMetrics text format"""
+        families = {}
+        for (key, aspect), total in sorted(self.collect().items()):
+            families.setdefault(aspect, []).append((key, total))
+        lines = []
+        for aspect, found in sorted(families.items(), key=lambda item: family(item[0])):
+            name, kind = family(aspect)
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for key, total in found:
+                    lines.append(f'{name}_total{self._format(key)} {number(total)}')
+                continue
+            lines.append(f'# UNIT {name} seconds')
+            for key, histogram in found:
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{self._format(key, le=number(float(bound)))} {cumulative}')
+                lines.append(f'{name}_sum{self._format(key)} {number(histogram[-2])}')
+                lines.append(f'{name}_count{self._format(key)} {histogram[-1]}')
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _format(key, **extra):
+        labels = [*key, *extra.items()]
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{name}="{label_value(value)}"' for name, value in labels) + '}'
+
+    def dump(self, path):
+        """Writes the metrics to a file, replacing it at once so readers never see part of it"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.expose())
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def serve(self, port=9464, address=''):
+        """Serves the metrics over HTTP from a background thread, returning the server"""
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.expose().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        server = http.server.ThreadingHTTPServer((address, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='resource_locker-metrics', daemon=True).start()
+        return server
+
+    def clear(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+            self._series.clear()
+            self.overflowed = 0
+
+
+default_registry = Registry()
+
+
+class MetricsReporter(RedisReporter):
+    """Records lock usage in process, in a Registry (the default one unless given), rather than in redis"""
+    def __init__(self, registry=None, bombproof=True, logger=None, **tags):
+        super().__init__(client=True, bombproof=bombproof, logger=logger, **tags)
+        self.registry = registry or default_registry
+
+    @contextmanager
+    def batch(self):
+        # recording is in memory already
+        yield self
+
+    def _increment_all(self, tags, aspects, samples=None):
+        return self.registry.record(tags, aspects)
@@ -1,17 +1,111 @@
-from redis import StrictRedis
-
+from resource_locker import connections
 from .reporter import tags_collection
 from .reporter import key_template
 from .reporter import safe
 from .reporter import key_value_template
+from .reporter import histogram_template
 from .aspects import Aspects
+from . import histogram
+from . import series as time_series
 
 import json
+import time
+
+"""Reads the reports back
+
+Per-call lookups go to redis every time; the bulk and aggregate methods
+(`matrix`, `top`, `mean_wait`) are evaluated by scripts where the data
+lives, in one round trip (plus one to list all tags, for `matrix`), and
+their results are cached in process for `ttl` seconds, as dashboards tend
+to ask the same thing repeatedly.
+"""
+
+# ARGV: tag prefix, key-value separator, tags as stored (see safe)
+# returns {tag, {value, {aspect, total, ...}, ...}, ...}
+MATRIX_SCRIPT = b"""
+local matrix = {}
+for i = 3, #ARGV do
+    local tag = ARGV[i]
+    local values = {}
+    for _, value in ipairs(redis.call('smembers', ARGV[1] .. tag)) do
+        values[#values + 1] = value
+        values[#values + 1] = redis.call('hgetall', tag .. ARGV[2] .. value)
+    end
+    matrix[#matrix + 1] = tag
+    matrix[#matrix + 1] = values
+end
+return matrix
+"""
+
+# KEYS[1]: the values of the tag
+# ARGV: key-value prefix, aspect, how many (0 for all), and optionally the aspect to divide by
+# returns {value, score, ...}, highest first; scores are strings, as redis would truncate numbers
+TOP_SCRIPT = b"""
+local scored = {}
+for _, value in ipairs(redis.call('smembers', KEYS[1])) do
+    local found = redis.call('hmget', ARGV[1] .. value, ARGV[2], ARGV[4] or ARGV[2])
+    local score = tonumber(found[1] or 0)
+    if ARGV[4] then
+        local per = tonumber(found[2] or 0)
+        -- nothing to average over
+        score = per > 0 and score / per or nil
+    end
+    if score then
+        scored[#scored + 1] = {value, score}
+    end
+end
+table.sort(scored, function(a, b)
+    if a[2] ~= b[2] then
+        return a[2] > b[2]
+    end
+    return a[1] < b[1]
+end)
+local n = tonumber(ARGV[3])
+if n == 0 or n > #scored then
+    n = #scored
+end
+local top = {}
+for i = 1, n do
+    top[#top + 1] = scored[i][1]
+    top[#top + 1] = string.format('%.17g', scored[i][2])
+end
+return top
+"""
+
+
+def _decode(aspects):
+    return {k.decode(): json.loads(v) for k, v in aspects.items()}
+
+
+def _pairs(flat):
+    return list(zip(flat[::2], flat[1::2]))
 
 
 class Query:
-    def __init__(self):
-        self.client = StrictRedis(db=1)
+    """Reads what reporters recorded
+
+    `client` defaults to the shared reports connection. Results of the bulk and aggregate
+    methods are reused for `ttl` seconds; 0 reads afresh every time.
+    """
+    def __init__(self, client=None, ttl=1):
+        self.client = client or connections.get_client('reports')
+        self.ttl = ttl
+        self._cache = {}
+        self.matrix_script = self.client.register_script(MATRIX_SCRIPT)
+        self.top_script = self.client.register_script(TOP_SCRIPT)
+
+    def _cached(self, key, compute):
+        now = time.monotonic()
+        found = self._cache.get(key)
+        if found and found[0] > now:
+            return found[1]
+        result = compute()
+        if self.ttl:
+            self._cache[key] = (now + self.ttl, result)
+        return result
+
+    def clear_cache(self):
+        self._cache.clear()
 
     def all_tags(self):
         return sorted([s.decode() for s in self.client.smembers(tags_collection)])
@@ -20,11 +114,106 @@ class Query:
         return sorted([s.decode() for s in self.client.smembers(key_template.format(key=safe(tag)))])
 
     def all_aspects(self, tag, value):
-        return {
-            k.decode(): json.loads(v) for k, v in
-            self.client.hgetall(key_value_template.format(key=safe(tag), value=safe(value))).items()
-        }
+        return _decode(self.client.hgetall(key_value_template.format(key=safe(tag), value=safe(value))))
+
+    def all_aspects_of(self, tag, values):
+        """The aspects of many values of a tag, in one round trip"""
+        pipe = self.client.pipeline(transaction=False)
+        for value in values:
+            pipe.hgetall(key_value_template.format(key=safe(tag), value=safe(value)))
+        return {value: _decode(aspects) for value, aspects in zip(values, pipe.execute())}
 
     def aspect(self, tag, value, aspect):
         Aspects.validate(aspect)
         return json.loads(self.client.hget(key_value_template.format(key=safe(tag), value=safe(value)), aspect))
+
+    def percentiles(self, tag, value, aspect, percentiles=(50, 90, 99)):
+        """Estimated percentiles of an aspect's durations, in seconds"""
+        Aspects.validate(aspect)
+        fields = {
+            k.decode(): v for k, v in
+            self.client.hgetall(histogram_template.format(key=safe(tag), value=safe(value))).items()
+        }
+        return histogram.percentiles(histogram.counts(fields, aspect), *percentiles)
+
+    def wait_percentiles(self, tag, value, percentiles=(50, 90, 99)):
+        """Estimated percentiles of the time to acquire, hold and queue for locks, in seconds, in one round trip"""
+        fields = {
+            k.decode(): v for k, v in
+            self.client.hgetall(histogram_template.format(key=safe(tag), value=safe(value))).items()
+        }
+        return {
+            aspect: histogram.percentiles(histogram.counts(fields, aspect), *percentiles)
+            for aspect in (Aspects.lock_acquire_wait, Aspects.lock_release_wait, Aspects.lock_queue_wait)
+        }
+
+    def series(self, tag, value, aspect, start, end=None, width=60):
+        """An aspect's totals per bucket of `width` seconds, as (bucket start, total) pairs, for [start, end)
+
+        Times are unix times, `end` defaulting to now. Buckets with no reports, or since expired, total 0.
+        Reporters must have been recording time series at this width.
+        """
+        Aspects.validate(aspect)
+        end = time.time() if end is None else end
+        indices = list(time_series.buckets(start, end, width))
+        # one HMGET per hash, of the fields in range
+        wanted = {}
+        for index in indices:
+            store_key, offset = time_series.location(safe(tag), safe(value), width, index)
+            wanted.setdefault(store_key, []).append(time_series.field_template.format(aspect=aspect, offset=offset))
+        pipe = self.client.pipeline(transaction=False)
+        for store_key, fields in wanted.items():
+            pipe.hmget(store_key, fields)
+        totals = [0 if total is None else json.loads(total) for found in pipe.execute() for total in found]
+        return [(index * width, total) for index, total in zip(indices, totals)]
+
+    def matrix(self, tags=None):
+        """The aspects of every value of every tag (or of `tags`), as {tag: {value: aspects}}
+
+        One round trip for given tags; another lists all the tags first.
+        """
+        tags = None if tags is None else tuple(tags)
+
+        def compute():
+            names = self.all_tags() if tags is None else tags
+            flat = self.matrix_script(
+                args=[
+                    key_template.format(key=''), key_value_template.format(key='', value=''),
+                    *[safe(name) for name in names],
+                ],
+            )
+            return {
+                name: {
+                    value.decode(): {k.decode(): json.loads(v) for k, v in _pairs(aspects)}
+                    for value, aspects in _pairs(values)
+                }
+                for name, (_, values) in zip(names, _pairs(flat))
+            }
+        return self._cached(('matrix', tags), compute)
+
+    def top(self, tag, aspect, n=10, per=None):
+        """The `n` values of a tag with the highest total of an aspect (or of its ratio to `per`), highest first
+
+        Returns (value, score) pairs; with `per`, values where it is 0 are left out. `n` of 0 ranks them all.
+        """
+        Aspects.validate(aspect, *([per] if per else []))
+        tag = safe(tag)
+
+        def compute():
+            flat = self.top_script(
+                keys=[key_template.format(key=tag)],
+                args=[key_value_template.format(key=tag, value=''), aspect, n, *([per] if per else [])],
+            )
+            return [(value.decode(), json.loads(score)) for value, score in _pairs(flat)]
+        return self._cached(('top', tag, aspect, n, per), compute)
+
+    def most_contended(self, tag, n=10):
+        """The values of a tag that most often could not be locked"""
+        return self.top(tag, Aspects.lock_acquire_fail_count, n=n)
+
+    def mean_wait(self, tag, value=None):
+        """Mean time to acquire, in seconds: for one value of a tag, or {value: mean} for all that were acquired"""
+        means = dict(self.top(tag, Aspects.lock_acquire_wait, n=0, per=Aspects.lock_acquire_count))
+        if value is None:
+            return means
+        return means.get(safe(value))
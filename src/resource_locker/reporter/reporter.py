@@ -1,6 +1,10 @@
-from redis import StrictRedis
+from contextlib import contextmanager
+import time
 
+from resource_locker import connections
 from .aspects import Aspects
+from . import histogram
+from . import series as time_series
 
 import logging
 
@@ -15,6 +19,8 @@ We use ontological tags - they have values i.e. k-v pairs
 - store each unique v encountered for a given k
 - store each unique k-v encountered
   - store the timing info against this key
+  - store distributions of waits (to acquire, holding, queued) in a sibling histogram
+  - optionally, store the timing info in time buckets too (see series)
 where timing info is acquire time, release time, duration, count etc.
 
 """
@@ -22,44 +28,136 @@ where timing info is acquire time, release time, duration, count etc.
 tags_collection = '_TAGS'
 key_template = '_TAG_{key}'
 key_value_template = '{key}__{value}'
+histogram_template = '{key}__{value}__histogram'
 
 
 def safe(thing):
     return str(thing).strip().lower().replace('.', '-').replace(':', '-').replace('_', '-')
 
 
+class Increments:
+    """Increments to the stored reports, merged in memory until written"""
+    def __init__(self):
+        self.tags = set()
+        self.values = {}
+        self.counters = {}
+        self.samples = {}
+        # series hash: {field: increment}, and when each hash expires
+        self.series = {}
+        self.series_expiry = {}
+
+    def __len__(self):
+        return len(self.counters) + len(self.samples) + sum(len(fields) for fields in self.series.values())
+
+    def add(self, tags, aspects, samples=None, series=(), at=None):
+        """Merges a report; `series` are the (width, retention) resolutions to bucket it in, as of `at`
+
+        Aspects and samples given as None (a duration that was not measured) are left out.
+        """
+        samples = samples or {}
+        Aspects.validate(*list(aspects), *list(samples))
+        aspects = {aspect: incr for aspect, incr in aspects.items() if incr is not None}
+        if series and at is None:
+            at = time.time()
+        self.tags.update(tags.keys())
+        for key, value in tags.items():
+            value = safe(value)
+            key = safe(key)
+            self.values.setdefault(key, set()).add(value)
+            for aspect, incr in aspects.items():
+                self.counters[key, value, aspect] = self.counters.get((key, value, aspect), 0) + incr
+            for aspect, sample in samples.items():
+                if sample is None:
+                    continue
+                field = histogram.field(aspect, sample)
+                self.samples[key, value, field] = self.samples.get((key, value, field), 0) + 1
+            for width, retention in series:
+                index = time_series.bucket(at, width)
+                store_key, offset = time_series.location(key, value, width, index)
+                fields = self.series.setdefault(store_key, {})
+                self.series_expiry[store_key] = time_series.expires_at(width, index, retention)
+                for aspect, incr in aspects.items():
+                    field = time_series.field_template.format(aspect=aspect, offset=offset)
+                    fields[field] = fields.get(field, 0) + incr
+        return len(tags) * len(aspects)
+
+    def write(self, pipe):
+        """Queues the commands storing these increments"""
+        if self.tags:
+            pipe.sadd(tags_collection, *list(self.tags))
+        for key, values in self.values.items():
+            pipe.sadd(key_template.format(key=key), *list(values))
+        for (key, value, aspect), incr in self.counters.items():
+            store_key = key_value_template.format(key=key, value=value)
+            if isinstance(incr, float):
+                pipe.hincrbyfloat(store_key, aspect, incr)
+            else:
+                pipe.hincrby(store_key, aspect, incr)
+        for (key, value, field), count in self.samples.items():
+            pipe.hincrby(histogram_template.format(key=key, value=value), field, count)
+        for store_key, fields in self.series.items():
+            for field, incr in fields.items():
+                if isinstance(incr, float):
+                    pipe.hincrbyfloat(store_key, field, incr)
+                else:
+                    pipe.hincrby(store_key, field, incr)
+            pipe.expireat(store_key, int(self.series_expiry[store_key]))
+        return pipe
+
+
 class RedisReporter:
-    def __init__(self, client=None, bombproof=True, logger=None, **tags):
-        self.client = client or StrictRedis(db=1)
+    """Records lock usage in redis
+
+    With `series`, reports are also counted in time buckets: True for the default resolutions,
+    or a sequence of (bucket width, retention) pairs in seconds, see resource_locker.reporter.series
+    """
+    def __init__(self, client=None, bombproof=True, logger=None, series=None, **tags):
+        self.client = client or connections.get_client('reports')
+        self.series = time_series.resolutions(series)
         self.tags = tags
         self.logger = logger or logging.getLogger(__name__)
         self.bombproof = bombproof
+        self._batch = None
 
     def _clear_all(self):
         self.client.flushdb()
 
-    def _increment_all(self, tags, aspects):
-        Aspects.validate(*list(aspects))
-        self.client.sadd(tags_collection, *list(tags.keys()))
-        for key, value in tags.items():
-            value = safe(value)
-            key = safe(key)
-            lookup_key = key_template.format(key=key)
-            self.client.sadd(lookup_key, value)
-            store_key = key_value_template.format(key=key, value=value)
-            for aspect, incr in aspects.items():
-                if isinstance(incr, float):
-                    self.client.hincrbyfloat(store_key, aspect, incr)
-                else:
-                    self.client.hincrby(store_key, aspect, incr)
-        return len(tags) * len(aspects)
-
-    def report(self, tags, aspects):
+    @contextmanager
+    def batch(self):
+        """Sends all reports made within the context in a single round trip, on leaving it"""
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = Increments()
+        try:
+            yield self
+        finally:
+            increments, self._batch = self._batch, None
+            if increments:
+                try:
+                    self._write(increments)
+                except Exception:
+                    if not self.bombproof:
+                        raise
+                    self.logger.error('reporting failed')
+
+    def _write(self, increments):
+        increments.write(self.client.pipeline(transaction=False)).execute()
+
+    def _increment_all(self, tags, aspects, samples=None):
+        if self._batch is not None:
+            return self._batch.add(tags, aspects, samples, self.series)
+        increments = Increments()
+        count = increments.add(tags, aspects, samples, self.series)
+        self._write(increments)
+        return count
+
+    def report(self, tags, aspects, samples=None):
         try:
             request = {}
             request.update(self.tags)
             request.update(tags)
-            return self._increment_all(request, aspects)
+            return self._increment_all(request, aspects, samples)
         except Exception:
             if not self.bombproof:
                 raise
@@ -69,19 +167,35 @@ class RedisReporter:
     def lock_requested(self, **tags):
         self.report(tags, {Aspects.lock_request_count: 1})
 
-    def lock_success(self, wait: float=None, **tags):
-        self.report(tags, {Aspects.lock_acquire_count: 1, Aspects.lock_acquire_wait: wait})
+    def lock_success(self, wait: float = None, **tags):
+        self.report(
+            tags,
+            {Aspects.lock_acquire_count: 1, Aspects.lock_acquire_wait: wait},
+            samples={Aspects.lock_acquire_wait: wait},
+        )
 
     def lock_failed(self, **tags):
         self.report(tags, {Aspects.lock_acquire_fail_count: 1})
 
-    def lock_released(self, wait: float=None, **tags):
-        self.report(tags, {Aspects.lock_release_count: 1, Aspects.lock_release_wait: wait})
+    def lock_released(self, wait: float = None, **tags):
+        # the wait on release is the time the lock was held
+        self.report(
+            tags,
+            {Aspects.lock_release_count: 1, Aspects.lock_release_wait: wait},
+            samples={Aspects.lock_release_wait: wait},
+        )
+
+    def lock_queued(self, wait: float = None, **tags):
+        self.report(
+            tags,
+            {Aspects.lock_queue_count: 1, Aspects.lock_queue_wait: wait},
+            samples={Aspects.lock_queue_wait: wait},
+        )
 
 
 class DummyReporter(RedisReporter):
     def __init__(self, *args, **kwargs):
         super().__init__(client=True, *args, **kwargs)
 
-    def report(self, tags, aspects):
+    def report(self, tags, aspects, samples=None):
         return 0
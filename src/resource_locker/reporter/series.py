@@ -0,0 +1,49 @@
+import math
+
+"""Time series of reported aspects
+
+Each report also increments a fixed-width time bucket, at every configured
+resolution: fine buckets show recent detail, and are dropped sooner than the
+coarse buckets they roll up into. The buckets of one tag value are grouped
+in hashes of `chunk` consecutive buckets, which expire as a whole once their
+last bucket is `retention` seconds old. With a field per aspect and bucket,
+a chunk stays within redis' default hash-max-listpack-entries (128), so
+that it is stored compactly.
+"""
+
+# (bucket width, retention) in seconds: minutes for two days, hours for ninety
+default_resolutions = ((60, 2 * 86400), (3600, 90 * 86400))
+# 8 aspects by 15 buckets: 120 fields
+chunk = 15
+series_template = '{key}__{value}__series__{width}__{chunk}'
+field_template = '{aspect}:{offset}'
+
+
+def resolutions(series):
+    """Normalises a reporter's `series` option: True for the defaults, or (width, retention) pairs"""
+    if not series:
+        return ()
+    if series is True:
+        return default_resolutions
+    return tuple((int(width), int(retention)) for width, retention in series)
+
+
+def bucket(at, width):
+    """Index of the bucket of `width` seconds that a unix time falls into"""
+    return int(at // width)
+
+
+def location(key, value, width, index):
+    """The hash and field holding a bucket, less the aspect"""
+    return series_template.format(key=key, value=value, width=width, chunk=index // chunk), index % chunk
+
+
+def expires_at(width, index, retention):
+    """When the hash holding a bucket may go: once the last bucket it holds is `retention` seconds old"""
+    return (index // chunk + 1) * chunk * width + retention
+
+
+def buckets(start, end, width):
+    """Indices of the buckets covering [start, end)"""
+    first = bucket(start, width)
+    return range(first, max(first, math.ceil(end / width)))
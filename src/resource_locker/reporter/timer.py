@@ -7,11 +7,11 @@ class Timer:
         self._duration = None
 
     def start(self):
-        self._start = time.time()
+        self._start = time.perf_counter()
         return self
 
     def stop(self):
-        self._duration = time.time() - self._start if self.duration is None else self._duration
+        self._duration = time.perf_counter() - self._start if self.duration is None else self._duration
         return self.duration
 
     @property
@@ -12,8 +12,9 @@ logging.basicConfig(level=logging.INFO)
 class BaseCase(unittest.TestCase):
     lock_class = Lock
     factory_class = NativeLockFactory
+    lock_options = {}
 
     @classmethod
     def setUpClass(cls):
         cls.factory = cls.factory_class()
-        cls.lock_class = partial(cls.lock_class, block=False, lock_factory=cls.factory)
+        cls.lock_class = partial(cls.lock_class, block=False, lock_factory=cls.factory, **cls.lock_options)
@@ -0,0 +1,65 @@
+from tests.reporter.base import BaseCase
+
+import os
+
+from redis import StrictRedis
+
+from resource_locker.reporter import BackgroundReporter
+from resource_locker.reporter import Query
+from resource_locker.reporter import RedisReporter
+from resource_locker.reporter.background import Aggregator
+
+
+def scenario(reporter_class):
+    for model in ('k64f', 'k64f', 'nrf52'):
+        r = reporter_class(make='nxp', model=model)
+        r.lock_requested()
+        r.lock_success(wait=0.5)
+        r.lock_released(wait=25)
+        r.lock_failed()
+        r.lock_queued(wait=1.5, need=2)
+
+
+def snapshot():
+    q = Query()
+    return {
+        (tag, value): (q.all_aspects(tag, value), q.percentiles(tag, value, 'lock_queue_wait'))
+        for tag in q.all_tags() for value in q.all_values(tag)
+    }
+
+
+class Test(BaseCase):
+    def setUp(self):
+        RedisReporter()._clear_all()
+
+    def test_equivalent_after_flush(self):
+        scenario(RedisReporter)
+        expected = snapshot()
+        RedisReporter()._clear_all()
+
+        scenario(BackgroundReporter)
+        BackgroundReporter().flush()
+        self.assertEqual(expected, snapshot())
+
+    def test_full_queue_drops(self):
+        aggregator = Aggregator(StrictRedis(db=1), queue_size=2)
+        for i in range(3):
+            aggregator.put({'key': 'a'}, {'lock_request_count': 1}, {})
+        self.assertEqual(1, aggregator.dropped)
+        aggregator.flush()
+        self.assertEqual(2, Query().aspect('key', 'a', 'lock_request_count'))
+        self.assertEqual(0, aggregator.dropped)
+
+    def test_fork(self):
+        if not hasattr(os, 'fork'):
+            self.skipTest('no fork')
+        parent = BackgroundReporter().aggregator
+        pid = os.fork()
+        if not pid:
+            reporter = BackgroundReporter()
+            reporter.lock_requested(key='forked')
+            alive = reporter.aggregator is not parent and reporter.aggregator._worker.is_alive()
+            os._exit(0 if alive and reporter.flush(timeout=5) else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+        self.assertEqual(['forked'], Query().all_values('key'))
@@ -0,0 +1,23 @@
+from tests.reporter.base import BaseCase
+from resource_locker.reporter import histogram
+
+
+class Test(BaseCase):
+    def test_buckets(self):
+        for seconds in (0.0005, 0.002, 0.75, 13, 3600):
+            with self.subTest(seconds=seconds):
+                index = histogram.bucket(seconds)
+                self.assertGreaterEqual(histogram.upper_bound(index), seconds)
+                self.assertLess(histogram.upper_bound(index - 1), max(seconds, 0.001))
+
+    def test_percentiles(self):
+        counts = {}
+        for i in range(1, 101):
+            index = histogram.bucket(i / 100)
+            counts[index] = counts.get(index, 0) + 1
+        result = histogram.percentiles(counts, 50, 99)
+        self.assertAlmostEqual(0.5, result[50], delta=0.5 * 0.2)
+        self.assertAlmostEqual(0.99, result[99], delta=0.99 * 0.2)
+
+    def test_empty(self):
+        self.assertEqual({50: None}, histogram.percentiles({}, 50))
@@ -0,0 +1,108 @@
+from tests.reporter.base import BaseCase
+
+import os
+import tempfile
+import threading
+import urllib.request
+
+from resource_locker import Lock
+from resource_locker import NativeLockFactory
+from resource_locker import P
+from resource_locker.reporter import MetricsReporter
+from resource_locker.reporter.metrics import Registry
+from resource_locker.reporter.metrics import content_type
+
+
+class Test(BaseCase):
+    def setUp(self):
+        self.registry = Registry(max_series=3, buckets=(0.1, 1, float('inf')))
+
+    def reporter(self, **tags):
+        return MetricsReporter(registry=self.registry, **tags)
+
+    def test_exposition(self):
+        r = self.reporter(model='k64f')
+        r.lock_requested()
+        r.lock_success(wait=0.05)
+        r.lock_success(wait=0.5)
+        r.lock_failed()
+        text = self.registry.expose()
+        for line in (
+            '# TYPE resource_locker_lock_request counter',
+            'resource_locker_lock_request_total{model="k64f"} 1',
+            'resource_locker_lock_acquire_total{model="k64f"} 2',
+            'resource_locker_lock_acquire_fail_total{model="k64f"} 1',
+            '# TYPE resource_locker_lock_acquire_wait_seconds histogram',
+            '# UNIT resource_locker_lock_acquire_wait_seconds seconds',
+            'resource_locker_lock_acquire_wait_seconds_bucket{model="k64f",le="0.1"} 1',
+            'resource_locker_lock_acquire_wait_seconds_bucket{model="k64f",le="1.0"} 2',
+            'resource_locker_lock_acquire_wait_seconds_bucket{model="k64f",le="+Inf"} 2',
+            'resource_locker_lock_acquire_wait_seconds_sum{model="k64f"} 0.55',
+            'resource_locker_lock_acquire_wait_seconds_count{model="k64f"} 2',
+        ):
+            self.assertIn(line, text.splitlines())
+        self.assertTrue(text.endswith('# EOF\n'))
+
+    def test_buckets(self):
+        registry = Registry(buckets=(1, 0.1))
+        self.assertTupleEqual((0.1, 1, float('inf')), registry.buckets)
+        MetricsReporter(registry=registry, model='k64f').lock_success(wait=5.0)
+        text = registry.expose()
+        self.assertIn('resource_locker_lock_acquire_wait_seconds_bucket{model="k64f",le="+Inf"} 1', text)
+        self.assertIn('resource_locker_lock_acquire_wait_seconds_sum{model="k64f"} 5.0', text)
+
+    def test_labels(self):
+        self.reporter(**{'make.model': 'a"b\\c', '2g': 'x'}).lock_requested()
+        self.assertIn('resource_locker_lock_request_total{_2g="x",make_model="a\\"b\\\\c"} 1', self.registry.expose())
+
+    def test_bounded(self):
+        for key in 'abcde':
+            self.reporter(key=key).lock_requested()
+        text = self.registry.expose()
+        self.assertIn('resource_locker_lock_request_total{key="c"} 1', text)
+        self.assertNotIn('key="d"', text)
+        self.assertIn('resource_locker_lock_request_total{overflow="true"} 2', text)
+        self.assertEqual(2, self.registry.overflowed)
+
+    def test_threads(self):
+        def report():
+            for _ in range(1000):
+                self.reporter(key='a').lock_requested()
+        threads = [threading.Thread(target=report) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIn('resource_locker_lock_request_total{key="a"} 8000', self.registry.expose())
+
+    def test_with_lock(self):
+        registry = self.registry
+
+        class Reporter(MetricsReporter):
+            def __init__(self, **tags):
+                super().__init__(registry=registry, **tags)
+        with Lock(P('a', model='T1000'), lock_factory=NativeLockFactory(), reporter_class=Reporter):
+            pass
+        text = registry.expose()
+        self.assertIn('resource_locker_lock_acquire_total{key="a",model="T1000"} 1', text)
+        self.assertIn('resource_locker_lock_release_wait_seconds_count{key="a",model="T1000"} 1', text)
+
+    def test_dump(self):
+        self.reporter(key='a').lock_requested()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'locks.prom')
+            self.registry.dump(path)
+            with open(path) as f:
+                self.assertEqual(self.registry.expose(), f.read())
+            self.assertListEqual(['locks.prom'], os.listdir(directory))
+
+    def test_serve(self):
+        self.reporter(key='a').lock_requested()
+        server = self.registry.serve(port=0, address='127.0.0.1')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.server_port}/metrics') as response:
+                self.assertEqual(content_type, response.headers['Content-Type'])
+                self.assertEqual(self.registry.expose(), response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,68 @@
+from tests.reporter.base import BaseCase
+
+from redis import StrictRedis
+
+from resource_locker import connections
+from resource_locker.reporter import Aspects
+from resource_locker.reporter import Query
+from resource_locker.reporter import RedisReporter
+
+
+class Test(BaseCase):
+    def setUp(self):
+        RedisReporter()._clear_all()
+        for model, acquired, wait, failed in (('k64f', 2, 3.0, 1), ('k66f', 1, 0.5, 4), ('nrf52', 0, 0, 2)):
+            r = RedisReporter(make='nxp', model=model)
+            for _ in range(acquired):
+                r.lock_success(wait=wait / acquired)
+            for _ in range(failed):
+                r.lock_failed()
+
+    def test_matrix(self):
+        q = Query()
+        matrix = q.matrix()
+        self.assertListEqual(['make', 'model'], sorted(matrix))
+        self.assertListEqual(['k64f', 'k66f', 'nrf52'], sorted(matrix['model']))
+        self.assertDictEqual(q.all_aspects('model', 'k64f'), matrix['model']['k64f'])
+        self.assertDictEqual({'nxp': q.all_aspects('make', 'nxp')}, matrix['make'])
+        self.assertListEqual(['model'], list(q.matrix(tags=['model'])))
+
+    def test_matrix_tag_names(self):
+        RedisReporter(board_type='K64F').lock_failed()
+        q = Query(ttl=0)
+        expected = {'k64f': q.all_aspects('board_type', 'K64F')}
+        self.assertDictEqual({'lock_acquire_fail_count': 1}, expected['k64f'])
+        self.assertDictEqual(expected, q.matrix()['board_type'])
+        self.assertDictEqual({'board_type': expected}, q.matrix(tags=['board_type']))
+
+    def test_top(self):
+        q = Query()
+        self.assertListEqual([('k66f', 4), ('nrf52', 2)], q.most_contended('model', n=2))
+        self.assertListEqual(
+            [('k64f', 2), ('k66f', 1), ('nrf52', 0)],
+            q.top('model', Aspects.lock_acquire_count, n=0),
+        )
+        with self.assertRaises(ValueError):
+            q.top('model', 'wrong')
+
+    def test_mean_wait(self):
+        q = Query()
+        # nrf52 was never acquired
+        self.assertDictEqual({'k64f': 1.5, 'k66f': 0.5}, q.mean_wait('model'))
+        self.assertEqual(1.5, q.mean_wait('model', 'k64f'))
+        self.assertIsNone(q.mean_wait('model', 'nrf52'))
+
+    def test_cache(self):
+        cached, fresh = Query(ttl=60), Query(ttl=0)
+        before = cached.most_contended('model')
+        RedisReporter(model='k64f').lock_failed()
+        RedisReporter(model='k64f').lock_failed()
+        self.assertListEqual(before, cached.most_contended('model'))
+        self.assertEqual(('k64f', 3), fresh.most_contended('model')[1])
+        cached.clear_cache()
+        self.assertEqual(('k64f', 3), cached.most_contended('model')[1])
+
+    def test_client(self):
+        client = StrictRedis(connection_pool=connections.get_pool('reports'))
+        self.assertIs(client, Query(client=client).client)
+        self.assertListEqual(['make', 'model'], Query(client=client).all_tags())
@@ -1,9 +1,14 @@
 from tests.reporter.base import BaseCase
 
+from resource_locker import Lock
+from resource_locker import NativeLockFactory
+from resource_locker import R
 from resource_locker.reporter import Query, Timer
 from resource_locker.reporter import RedisReporter
 from resource_locker.reporter import Aspects
+from resource_locker.reporter import BackgroundReporter
 from resource_locker.reporter import safe
+from resource_locker.reporter.reporter import key_value_template
 
 
 class Test(BaseCase):
@@ -36,6 +41,34 @@ class Test(BaseCase):
         }, q.all_aspects('model', 'k64f'))
         self.assertEqual(50, q.aspect('model', 'k64f', Aspects.lock_release_wait))
 
+    def test_without_wait(self):
+        for reporter_class in (RedisReporter, BackgroundReporter):
+            with self.subTest(reporter=reporter_class.__name__):
+                RedisReporter()._clear_all()
+                r = reporter_class(bombproof=False, model='k64f')
+                r.lock_success()
+                r.lock_released()
+                if reporter_class is BackgroundReporter:
+                    r.flush()
+                self.assertDictEqual(
+                    dict(lock_acquire_count=1, lock_release_count=1), Query().all_aspects('model', 'k64f'),
+                )
+
+    def test_wait_percentiles(self):
+        r = RedisReporter(model='k64f')
+        for i in range(1, 101):
+            r.lock_success(wait=i / 100)
+            r.lock_released(wait=i)
+        percentiles = Query().wait_percentiles('model', 'k64f')
+        self.assertAlmostEqual(0.5, percentiles[Aspects.lock_acquire_wait][50], delta=0.5 * 0.2)
+        self.assertAlmostEqual(0.99, percentiles[Aspects.lock_acquire_wait][99], delta=0.99 * 0.2)
+        self.assertAlmostEqual(90, percentiles[Aspects.lock_release_wait][90], delta=90 * 0.2)
+        self.assertEqual({50: None, 90: None, 99: None}, percentiles[Aspects.lock_queue_wait])
+        self.assertEqual(
+            percentiles[Aspects.lock_release_wait],
+            Query().percentiles('model', 'k64f', Aspects.lock_release_wait),
+        )
+
     def test_timer_useage(self):
         t = Timer().start()
         r = RedisReporter(x='y')
@@ -74,3 +107,49 @@ class Test(BaseCase):
         self.assertEqual(10, q.aspect('b', '2', Aspects.lock_request_count))
         self.assertEqual([safe(bad_string)], q.all_values('c'))
         self.assertEqual(sorted(['99', '1']), q.all_values('a'))
+
+    def test_batch(self):
+        r = RedisReporter()
+        with r.batch():
+            r.lock_requested(key='a')
+            with r.batch():
+                r.lock_requested(key='b')
+            self.assertEqual([], Query().all_tags())
+        q = Query()
+        self.assertEqual(['a', 'b'], q.all_values('key'))
+        self.assertEqual(1, q.aspect('key', 'b', Aspects.lock_request_count))
+
+    def test_unbatched_reporter(self):
+        reports = []
+
+        class Unbatched:
+            """Made per set of tags, without batch or lock_queued"""
+            def __init__(self, **tags):
+                self.tags = tags
+
+            def lock_requested(self):
+                reports.append(('requested', self.tags['key']))
+
+            def lock_failed(self):
+                reports.append(('failed', self.tags['key']))
+
+            def lock_success(self, wait=None):
+                reports.append(('success', self.tags['key']))
+
+            def lock_released(self, wait=None):
+                reports.append(('released', self.tags['key']))
+
+        lock = Lock(R('a', 'b', need=2), lock_factory=NativeLockFactory(), reporter_class=Unbatched, fair=True)
+        with lock:
+            pass
+        self.assertListEqual(
+            [(report, key) for report in ('requested', 'success', 'released') for key in ('a', 'b')],
+            # candidates may be tried in any order
+            sorted(reports, key=lambda report: (['requested', 'success', 'released'].index(report[0]), report[1])),
+        )
+
+    def test_batch_failure_muted(self):
+        r = RedisReporter(bombproof=True)
+        r.client.set(key_value_template.format(key='key', value='a'), 'not a hash')
+        with r.batch():
+            r.lock_requested(key='a')
@@ -0,0 +1,75 @@
+from tests.reporter.base import BaseCase
+
+import time
+
+from resource_locker import connections
+from resource_locker.reporter import Aspects
+from resource_locker.reporter import BackgroundReporter
+from resource_locker.reporter import Query
+from resource_locker.reporter import RedisReporter
+from resource_locker.reporter import series
+from resource_locker.reporter.reporter import Increments
+
+
+class Test(BaseCase):
+    def setUp(self):
+        RedisReporter()._clear_all()
+
+    def write(self, at, **aspects):
+        increments = Increments()
+        increments.add(dict(model='k64f'), aspects, series=((60, 86400), (3600, 86400)), at=at)
+        increments.write(connections.get_client('reports').pipeline(transaction=False)).execute()
+
+    def test_buckets(self):
+        # the start of the latest whole hour, so that neither resolution has expired
+        start = int(time.time()) // 3600 * 3600 - 3600
+        self.write(start + 5, lock_request_count=1, lock_release_wait=2.5)
+        self.write(start + 50, lock_request_count=2)
+        self.write(start + 130, lock_request_count=4, lock_release_wait=1.5)
+        q = Query()
+        with self.subTest(part='minutes'):
+            self.assertListEqual(
+                [(start, 3), (start + 60, 0), (start + 120, 4)],
+                q.series('model', 'k64f', Aspects.lock_request_count, start, start + 180),
+            )
+        with self.subTest(part='floats'):
+            self.assertListEqual(
+                [(start, 2.5), (start + 60, 0), (start + 120, 1.5)],
+                q.series('model', 'k64f', Aspects.lock_release_wait, start, start + 180),
+            )
+        with self.subTest(part='rolled up'):
+            self.assertListEqual(
+                [(start - 3600, 0), (start, 7)],
+                q.series('model', 'k64f', Aspects.lock_request_count, start - 3600, start + 180, width=3600),
+            )
+
+    def test_across_chunks(self):
+        start = int(time.time()) // (series.chunk * 60) * series.chunk * 60
+        self.write(start - 1, lock_request_count=1)
+        self.write(start, lock_request_count=2)
+        totals = Query().series('model', 'k64f', Aspects.lock_request_count, start - 60, start + 60)
+        self.assertListEqual([(start - 60, 1), (start, 2)], totals)
+
+    def test_expiry(self):
+        now = time.time()
+        self.write(now, lock_request_count=1)
+        client = connections.get_client('reports')
+        ttls = {key.decode(): client.ttl(key) for key in client.keys('*__series__*')}
+        self.assertEqual(2, len(ttls))
+        self.assertTrue(all(0 < ttl <= 86400 + series.chunk * 3600 for ttl in ttls.values()))
+
+    def test_reporters(self):
+        for reporter_class in (RedisReporter, BackgroundReporter):
+            with self.subTest(reporter=reporter_class.__name__):
+                RedisReporter()._clear_all()
+                reporter = reporter_class(series=True, model='k64f')
+                reporter.lock_requested()
+                reporter.lock_requested()
+                if reporter_class is BackgroundReporter:
+                    reporter.flush()
+                totals = Query().series('model', 'k64f', Aspects.lock_request_count, time.time() - 60)
+                self.assertEqual(2, sum(total for _, total in totals))
+
+    def test_off_by_default(self):
+        RedisReporter(model='k64f').lock_requested()
+        self.assertListEqual([], connections.get_client('reports').keys('*__series__*'))
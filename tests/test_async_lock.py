@@ -0,0 +1,183 @@
+from tests.base import BaseCase
+
+import asyncio
+
+from resource_locker import connections
+from resource_locker import AsyncLock
+from resource_locker import AsyncNativeLockFactory
+from resource_locker import AsyncRedisLockFactory
+from resource_locker import RequirementNotMet
+from resource_locker import R
+
+
+class Test(BaseCase):
+    factory_class = AsyncRedisLockFactory
+    lock_class = AsyncLock
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # the factory's connections belong to the loop they were made in
+        cls.loop = asyncio.new_event_loop()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_sync_use_refused(self):
+        with self.assertRaises(TypeError):
+            with self.lock_class('a'):
+                pass
+
+    def test_mutex_blocks(self):
+        async def scenario():
+            await self.factory.clear_all()
+            async with self.lock_class('a'):
+                self.assertIn('a', await self.factory.get_lock_list())
+                with self.assertRaises(RequirementNotMet):
+                    await self.lock_class('a').acquire()
+            self.assertNotIn('a', await self.factory.get_lock_list(keys=['a']))
+        self.run_async(scenario())
+
+    def test_lock_states(self):
+        async def scenario():
+            await self.factory.clear_all()
+            async with self.lock_class('a'):
+                self.assertListEqual(['a'], list(await self.factory.get_lock_states(['a', 'b'])))
+        self.run_async(scenario())
+
+    def test_ttl_aware(self):
+        if not isinstance(self.factory, AsyncRedisLockFactory):
+            self.skipTest('leases do not expire')
+
+        async def scenario():
+            await self.factory.clear_all()
+            await self.factory.new_lock('a', expire=1).acquire(blocking=False)
+            waiter = self.lock_class(
+                'a', block=True, wait_fixed=5000, wait_exponential_max=None, wait_exponential_multiplier=None,
+                ttl_aware_wait=True,
+            )
+            async with waiter:
+                pass
+            self.assertLess(waiter.acquire_timer.duration, 3)
+        self.run_async(scenario())
+
+    def test_failed_renewal_logged(self):
+        if not isinstance(self.factory, AsyncRedisLockFactory):
+            self.skipTest('leases do not expire')
+
+        async def scenario():
+            await self.factory.clear_all()
+            lock = self.factory.new_lock('renewed', expire=1, auto_renewal=True)
+            await lock.acquire(blocking=False)
+            await self.factory.client.delete('lock:renewed')
+            with self.assertLogs('resource_locker.factories.async_redis', 'ERROR'):
+                await asyncio.sleep(1)
+            self.assertTrue(lock._renewal.done())
+        self.run_async(scenario())
+
+    def test_two_reqs(self):
+        async def scenario():
+            r1 = R('a', 'x', 'y', 'z', need=2)
+            async with self.lock_class(r1, 'b') as obtained:
+                self.assertEqual(2, len(obtained[0]))
+                self.assertEqual('b', obtained[1][0])
+        self.run_async(scenario())
+
+    def test_many_waiters(self):
+        async def scenario():
+            await self.factory.clear_all()
+            pool = [f'async-{i}' for i in range(3)]
+            served = []
+
+            async def consumer(i):
+                lock = self.lock_class(
+                    R(*pool, need=2),
+                    block=True,
+                    wake_on_release=True,
+                    wait_fixed=1000,
+                    wait_exponential_max=None,
+                    wait_exponential_multiplier=None,
+                )
+                async with lock as obtained:
+                    held = set(obtained[0])
+                    self.assertFalse(any(held & other for other in served if other))
+                    served.append(held)
+                    await asyncio.sleep(0.01)
+                    served[served.index(held)] = None
+
+            await asyncio.gather(*[consumer(i) for i in range(20)])
+            self.assertEqual(20, len(served))
+        self.run_async(scenario())
+
+
+class TestNative(Test):
+    factory_class = AsyncNativeLockFactory
+
+    def test_non_blocking_behind_waiters(self):
+        async def scenario():
+            holder = self.factory.new_lock('queued')
+            await holder.acquire()
+            waiter = asyncio.ensure_future(self.factory.new_lock('queued').acquire())
+            await asyncio.sleep(0)
+            await holder.release()
+            # the lock is due to the waiter, which has yet to run; failing must not suspend until it has
+            acquire = self.factory.new_lock('queued').acquire(blocking=False)
+            with self.assertRaises(StopIteration) as done:
+                acquire.send(None)
+            self.assertIs(False, done.exception.value)
+            self.assertTrue(await waiter)
+        self.run_async(scenario())
+
+    def test_only_held_kept(self):
+        async def scenario():
+            await self.factory.clear_all()
+            holder = self.factory.new_lock('kept')
+            await holder.acquire()
+            waiter = self.factory.new_lock('kept')
+            self.assertFalse(await waiter.acquire(timeout=0.01))
+            waiting = asyncio.ensure_future(waiter.acquire())
+            await asyncio.sleep(0)
+            self.assertListEqual(['kept'], list(self.factory.all_locks))
+            await holder.release()
+            self.assertTrue(await waiting)
+            await waiter.release()
+            for key in range(100):
+                async with self.lock_class(key):
+                    pass
+            self.assertDictEqual({}, self.factory.all_locks)
+        self.run_async(scenario())
+
+
+class TestShared(BaseCase):
+    def tearDown(self):
+        connections.configure(max_connections=None)
+
+    def test_per_loop(self):
+        async def shared():
+            return AsyncRedisLockFactory.shared()
+        loop = asyncio.new_event_loop()
+        other = asyncio.new_event_loop()
+        try:
+            factory = loop.run_until_complete(shared())
+            self.assertIs(factory, loop.run_until_complete(shared()))
+            self.assertIsNot(factory, other.run_until_complete(shared()))
+        finally:
+            loop.close()
+            other.close()
+        with self.assertRaises(RuntimeError):
+            AsyncRedisLockFactory.shared()
+
+    def test_configured(self):
+        async def scenario():
+            connections.configure(max_connections=3)
+            factory = AsyncLock('a').lock_factory
+            self.assertIs(AsyncRedisLockFactory.shared(), factory)
+            self.assertEqual(3, factory.client.connection_pool.max_connections)
+            async with AsyncLock('a', lock_factory=factory):
+                pass
+            await factory.aclose()
+            self.assertIsNot(factory, AsyncRedisLockFactory.shared())
+            connections.configure(max_connections=None)
+            self.assertNotEqual(3, AsyncRedisLockFactory.shared().client.connection_pool.max_connections)
+            await AsyncRedisLockFactory.shared().aclose()
+        asyncio.run(scenario())
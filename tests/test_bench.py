@@ -0,0 +1,55 @@
+from tests.base import BaseCase
+
+import json
+import os
+import tempfile
+
+from resource_locker import bench
+from resource_locker.bench.bench import fairness
+from resource_locker.bench.bench import prioritisers
+from resource_locker.bench.bench import summary
+
+
+class Test(BaseCase):
+    def test_run(self):
+        for factory in ('native', 'redis'):
+            with self.subTest(factory=factory):
+                result = bench.run(bench.Scenario(pool=3, need=2, clients=2, acquisitions=3, hold=0, factory=factory))
+                self.assertEqual(6, result['acquisitions'])
+                self.assertGreater(result['acquisitions_per_second'], 0)
+                self.assertLessEqual(result['time_to_acquire']['p50'], result['time_to_acquire']['p99'])
+                self.assertEqual(factory == 'redis', result['commands_per_acquisition'] is not None)
+
+    def test_skew(self):
+        for prioritiser in prioritisers:
+            with self.subTest(prioritiser=prioritiser):
+                scenario = bench.Scenario(
+                    pool=4, need=2, clients=2, acquisitions=4, hold=0, factory='native', skew=1,
+                    prioritiser=prioritiser,
+                )
+                self.assertEqual(8, bench.run(scenario)['acquisitions'])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            bench.Scenario(factory='native', processes=True)
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'results.json')
+            bench.main([
+                '--factory', 'native', '--clients', '1,2', '--acquisitions', '2', '--hold', '0',
+                '--option', 'concurrency="ordered"', '--json', path,
+            ])
+            with open(path) as fh:
+                results = json.load(fh)
+        self.assertEqual([1, 2], [r['scenario']['clients'] for r in results])
+        self.assertEqual('ordered', results[0]['scenario']['lock_options']['concurrency'])
+
+    def test_fairness(self):
+        self.assertEqual(1, fairness([2, 2, 2]))
+        self.assertAlmostEqual(1 / 3, fairness([6, 0, 0]))
+
+    def test_summary(self):
+        result = bench.run(bench.Scenario(pool=2, need=1, clients=2, acquisitions=2, hold=0, factory='native'))
+        result.update(fairness=None)
+        self.assertIn('fairness n/a, commands/acquisition n/a', summary(result))
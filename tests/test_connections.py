@@ -0,0 +1,70 @@
+from tests.base import BaseCase
+
+import os
+
+import redis
+from redis import BlockingConnectionPool
+
+from resource_locker import connections
+from resource_locker import Lock
+from resource_locker import RedisLockFactory
+from resource_locker.reporter import BackgroundReporter
+from resource_locker.reporter import Query
+from resource_locker.reporter import RedisReporter
+
+
+class Test(BaseCase):
+    def tearDown(self):
+        connections.configure(max_connections=None, pool_timeout=20)
+
+    def test_shared(self):
+        with self.subTest(part='locks'):
+            self.assertIs(connections.get_pool('locks'), RedisLockFactory().client.connection_pool)
+            self.assertIs(RedisLockFactory.shared(), Lock('a').lock_factory)
+        with self.subTest(part='reports'):
+            self.assertIs(connections.get_pool('reports'), RedisReporter().client.connection_pool)
+            self.assertIs(connections.get_pool('reports'), Query().client.connection_pool)
+            self.assertEqual(1, Query().client.connection_pool.connection_kwargs['db'])
+
+    def test_configure(self):
+        before = connections.get_pool()
+        connections.configure(max_connections=3)
+        pool = connections.get_pool()
+        self.assertIsNot(before, pool)
+        self.assertEqual(3, pool.max_connections)
+        self.assertTrue(pool.connection_kwargs['socket_keepalive'])
+
+    def test_configure_after_use(self):
+        before = RedisLockFactory.shared()
+        reporter = BackgroundReporter()
+        connections.configure(max_connections=3)
+        with self.subTest(part='locks'):
+            self.assertIsNot(before, RedisLockFactory.shared())
+            self.assertIs(connections.get_pool('locks'), Lock('a').lock_factory.client.connection_pool)
+        with self.subTest(part='reports'):
+            self.assertIs(connections.get_pool('reports'), BackgroundReporter().aggregator.client.connection_pool)
+            self.assertIs(reporter.aggregator, BackgroundReporter().aggregator)
+
+    def test_capped(self):
+        connections.configure(max_connections=1, pool_timeout=0.1)
+        self.assertIsInstance(connections.get_pool(), BlockingConnectionPool)
+        client = connections.get_client()
+        pubsub = client.pubsub()
+        # a subscription keeps the only connection
+        pubsub.subscribe('capped')
+        try:
+            with self.assertRaises(redis.ConnectionError):
+                client.ping()
+        finally:
+            pubsub.close()
+        self.assertTrue(client.ping())
+
+    def test_fork(self):
+        if not hasattr(os, 'fork'):
+            self.skipTest('no fork')
+        parent = connections.get_pool()
+        pid = os.fork()
+        if not pid:
+            os._exit(0 if connections.get_pool() is not parent else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
@@ -0,0 +1,124 @@
+from tests.base import BaseCase
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+
+from resource_locker import AsyncLock
+from resource_locker import AsyncNativeLockFactory
+from resource_locker import Instrumentation
+from resource_locker import Lock
+from resource_locker import LoggingInstrumentation
+from resource_locker import R
+from resource_locker import RequirementNotMet
+from resource_locker import TraceInstrumentation
+
+
+class Recorder(Instrumentation):
+    def __init__(self):
+        self.started = []
+        self.ended = []
+
+    def span_started(self, span):
+        self.started.append(span)
+
+    def span_ended(self, span):
+        self.ended.append(span)
+
+    def named(self, name):
+        return [span for span in self.ended if span.name == name]
+
+
+class Test(BaseCase):
+    def setUp(self):
+        self.factory.clear_all()
+        self.recorder = Recorder()
+
+    def test_phases(self):
+        with self.lock_class(R('a', 'b', need=1), 'c', instrumentation=self.recorder):
+            pass
+        names = {span.name for span in self.recorder.ended}
+        self.assertSetEqual(
+            {'acquire', 'attempt', 'lock_of_locks', 'get_lock_list', 'acquire_one', 'report', 'release', 'release_all'},
+            names,
+        )
+        self.assertEqual(len(self.recorder.started), len(self.recorder.ended))
+        acquire, = self.recorder.named('acquire')
+        attempt, = self.recorder.named('attempt')
+        self.assertIs(acquire, attempt.parent)
+        self.assertEqual(1, acquire.attributes['attempts'])
+        self.assertTrue(all(span.parent is attempt for span in self.recorder.named('acquire_one')))
+        self.assertListEqual(['acquired', 'acquired'], [span.outcome for span in self.recorder.named('acquire_one')])
+        self.assertTrue(all(span.duration_ns >= 0 for span in self.recorder.ended))
+        self.assertGreaterEqual(acquire.duration_ns, attempt.duration_ns)
+
+    def test_retries(self):
+        holder = self.lock_class('a')
+        holder.acquire()
+        threading.Timer(0.2, holder.release).start()
+        with self.lock_class('a', block=True, wait_fixed=50, instrumentation=self.recorder):
+            pass
+        attempts = self.recorder.named('attempt')
+        waits = self.recorder.named('retry_wait')
+        self.assertGreater(len(attempts), 1)
+        self.assertEqual(len(attempts) - 1, len(waits))
+        self.assertListEqual(list(range(1, len(attempts) + 1)), [span.attributes['attempt'] for span in attempts])
+        self.assertListEqual(['RequirementNotMet'] * (len(attempts) - 1) + ['ok'], [s.outcome for s in attempts])
+        self.assertIn('failed', [span.outcome for span in self.recorder.named('acquire_one')])
+        # waits last until the next attempt
+        for wait, attempt in zip(waits, attempts[1:]):
+            self.assertLessEqual(wait.end_ns, attempt.start_ns)
+
+    def test_failure(self):
+        self.lock_class('a').acquire()
+        with self.assertRaises(RequirementNotMet):
+            self.lock_class('a', instrumentation=self.recorder).acquire()
+        acquire, = self.recorder.named('acquire')
+        self.assertEqual('RequirementNotMet', acquire.outcome)
+
+    def test_uninstrumented(self):
+        calls = []
+
+        class CountingLock(Lock):
+            def _guard_keys(self):
+                calls.append(self)
+                return super()._guard_keys()
+        with CountingLock('a', lock_factory=self.factory, block=False, concurrency='striped'):
+            pass
+        # span attributes are not worked out for no span
+        self.assertEqual(1, len(calls))
+
+    def test_logging(self):
+        with self.assertLogs('resource_locker.core.instrumentation', 'DEBUG') as logs:
+            with self.lock_class('a', instrumentation=LoggingInstrumentation()):
+                pass
+        record = next(record for record in logs.records if record.span['name'] == 'acquire_one')
+        self.assertEqual('acquired', record.span['outcome'])
+        self.assertEqual('attempt', record.span['parent'])
+        self.assertEqual('a', record.span['key'])
+
+    def test_trace(self):
+        trace = TraceInstrumentation()
+        with self.lock_class('a', instrumentation=trace):
+            pass
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.json')
+            trace.dump(path)
+            with open(path) as f:
+                events = json.load(f)['traceEvents']
+        self.assertIn('acquire', [event['name'] for event in events])
+        self.assertTrue(all(event['ph'] == 'X' and event['dur'] >= 0 for event in events))
+
+    def test_async(self):
+        factory = AsyncNativeLockFactory()
+
+        async def scenario():
+            async with AsyncLock('a', lock_factory=factory, block=False, instrumentation=self.recorder):
+                pass
+        asyncio.new_event_loop().run_until_complete(scenario())
+        names = {span.name for span in self.recorder.ended}
+        self.assertTrue({'acquire', 'attempt', 'acquire_one', 'release'} <= names)
+        attempt, = self.recorder.named('attempt')
+        self.assertIs(self.recorder.named('acquire')[0], attempt.parent)
@@ -42,9 +42,11 @@ class Test(BaseCase):
         Lock()
 
     def test_release_failure(self):
+        class Unfulfillable(P):
+            fulfill = None  # so that acquiring it fails
+
         a = P('a')
-        b = P('b')
-        b.fulfill = None  # so that acquiring it fails
+        b = Unfulfillable('b')
 
         lock = Lock(a, b, block=False, lock_factory=NativeLockFactory())
         lock._obtained.append('x')  # mess with internal state so that release also fails
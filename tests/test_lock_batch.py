@@ -0,0 +1,123 @@
+from tests.base import BaseCase
+
+from resource_locker import Lock
+from resource_locker import LockBatch
+from resource_locker import NativeLockFactory
+from resource_locker import R
+from resource_locker import RedisLockFactory
+
+
+def counting(factory_class):
+    class Counting(factory_class):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.calls = {}
+            self.stale = False
+
+        def _count(self, name):
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+        def get_lock_list(self, keys=None):
+            self._count('get_lock_list')
+            return [] if self.stale else super().get_lock_list(keys=keys)
+
+        def acquire_groups(self, groups, **params):
+            self._count('acquire_groups')
+            return super().acquire_groups(groups, **params)
+    return Counting
+
+
+class Test(BaseCase):
+    factory_class = counting(NativeLockFactory)
+
+    def setUp(self):
+        self.factory.clear_all()
+        self.factory.calls.clear()
+        self.factory.stale = False
+
+    def batch(self, **params):
+        return LockBatch(lock_factory=self.factory, **params)
+
+    def held(self):
+        return sorted(self.factory.get_lock_list())
+
+    def test_one_pass(self):
+        batch = self.batch()
+        for i in range(50):
+            batch.add(R(f'device-{i}'), R(f'host-{i % 10}', f'host-{i % 10 + 10}', need=1))
+        results = batch.acquire()
+        # twenty hosts for fifty requests
+        self.assertEqual(20, sum(result is not None for result in results))
+        self.assertDictEqual({'get_lock_list': 1, 'acquire_groups': 1}, self.factory.calls)
+        self.assertEqual(40, len(self.held()))
+        batch.release()
+        self.assertListEqual([], self.held())
+
+    def test_maximises_requests_met(self):
+        batch = self.batch()
+        batch.add(R('a', 'b', need=1))
+        batch.add(R('a'))
+        # 'b' is left to the first, as fewer requests want it
+        results = batch.acquire()
+        self.assertTrue(all(results))
+        self.assertEqual('b', results[0][0][0])
+
+    def test_smaller_requests_first(self):
+        batch = self.batch()
+        batch.add(R('a', 'b', need=2))
+        batch.add(R('a'))
+        batch.add(R('b'))
+        self.assertListEqual([False, True, True], [bool(result) for result in batch.acquire()])
+
+    def test_weights(self):
+        batch = self.batch()
+        batch.add(R('a'))
+        batch.add(R('a'), weight=5)
+        self.assertListEqual([False, True], [bool(result) for result in batch.acquire()])
+
+    def test_retry_pending(self):
+        other = Lock('a', lock_factory=self.factory, block=False)
+        other.acquire()
+        batch = self.batch()
+        waiting, ready = batch.add('a'), batch.add('b')
+        self.assertListEqual([None, ready._requirements], batch.acquire())
+        other.release()
+        self.assertTrue(all(batch.acquire()))
+        self.assertListEqual(['a', 'b'], self.held())
+        waiting.release()
+        self.assertListEqual(['b'], self.held())
+
+    def test_lost_race(self):
+        Lock('a', lock_factory=self.factory, block=False).acquire()
+        self.factory.stale = True
+        batch = self.batch()
+        batch.add('a', 'c')
+        batch.add('b')
+        self.assertListEqual([False, True], [bool(result) for result in batch.acquire()])
+        self.factory.stale = False
+        self.assertListEqual(['a', 'b'], self.held())
+
+    def test_context(self):
+        with self.batch() as batch:
+            batch.add('a')
+        self.assertListEqual([], self.held())
+        with self.batch() as batch:
+            pass
+        batch.add('a')
+        self.assertTrue(all(batch.acquire()))
+        batch.release()
+
+
+class TestRedis(Test):
+    factory_class = counting(RedisLockFactory)
+
+    def test_groups(self):
+        self.factory.new_lock('c').acquire()
+        results = self.factory.acquire_groups([['a', 'b'], ['b', 'c'], ['d'], []], expire=60)
+        self.assertListEqual([['a', 'b'], [], ['d'], []], [[key for key, _ in pairs] for pairs in results])
+        self.assertListEqual(['a', 'b', 'c', 'd'], self.held())
+        self.assertLessEqual(self.factory.get_lock_states(['a'])['a'].ttl, 60)
+        for pairs in results:
+            for _, lock in pairs:
+                lock.release()
+        self.assertListEqual(['c'], self.held())
@@ -0,0 +1,86 @@
+from tests.base import BaseCase
+from tests.test_lock_contention import Test as RedisContention
+
+import logging
+import threading
+import time
+
+from resource_locker import Lock
+from resource_locker import R
+from resource_locker import RedisLockFactory
+
+
+class Test(BaseCase):
+    def test_modes(self):
+        with self.assertRaises(ValueError):
+            Lock('a', concurrency='anarchy')
+
+    def test_global(self):
+        self.assertListEqual(['lock_of_locks'], Lock('a', 'b')._guard_keys())
+
+    def test_striped(self):
+        a = Lock(R('a', 'b'), 'c', concurrency='striped')
+        self.assertListEqual(a._guard_keys(), sorted(a._guard_keys()))
+        with self.subTest(part='overlapping key sets share a stripe'):
+            b = Lock('c', concurrency='striped')
+            self.assertTrue(set(a._guard_keys()) & set(b._guard_keys()))
+        with self.subTest(part='disjoint key sets need not'):
+            c = Lock('x', concurrency='striped', lock_of_locks_stripes=1 << 16)
+            self.assertFalse(set(a._guard_keys()) & set(c._guard_keys()))
+
+    def test_ordered(self):
+        self.assertListEqual([], Lock('a', concurrency='ordered')._guard_keys())
+
+
+class RemoteRedisLockFactory(RedisLockFactory):
+    """A lock server a network round trip away, so that time under the locks of locks is not negligible"""
+    latency = 0.05
+
+    def get_lock_list(self, keys=None):
+        time.sleep(self.latency)
+        return super().get_lock_list(keys=keys)
+
+
+class TestDisjoint(BaseCase):
+    factory_class = RemoteRedisLockFactory
+    clients = 8
+
+    def setUp(self):
+        self.factory.clear_all()
+
+    def elapsed(self, concurrency):
+        """Time for every client to lock and release its own key"""
+        go = threading.Event()
+
+        def client(key):
+            go.wait()
+            with self.lock_class(key, concurrency=concurrency, lock_of_locks_stripes=1 << 16):
+                pass
+        clients = [threading.Thread(target=client, args=(f'disjoint-{i}',)) for i in range(self.clients)]
+        for t in clients:
+            t.start()
+        start = time.time()
+        go.set()
+        for t in clients:
+            t.join()
+        return time.time() - start
+
+    def test_parallel(self):
+        elapsed = {mode: self.elapsed(mode) for mode in ('global', 'striped', 'ordered')}
+        logging.info('%s clients with disjoint keys served in %s', self.clients, elapsed)
+        # the global lock of locks serialises every attempt
+        self.assertGreaterEqual(elapsed['global'], self.clients * self.factory.latency)
+        self.assertLess(elapsed['striped'], elapsed['global'] / 2)
+        self.assertLess(elapsed['ordered'], elapsed['global'] / 2)
+
+
+class TestStripedContention(RedisContention):
+    lock_options = dict(concurrency='striped')
+
+
+class TestOrderedContention(RedisContention):
+    lock_options = dict(concurrency='ordered')
+
+
+# lets not run things twice
+del RedisContention
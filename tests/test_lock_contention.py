@@ -43,8 +43,10 @@ class Test(BaseCase):
             t.start()
             consumers.append(t)
 
+        start = time.time()
         go.set()
         [t.join() for t in consumers]
+        logging.info('%s consumers served in %.3fs', self.concurrency, time.time() - start)
 
         # we should have a total of need * concurrency across all the counters
         expected = self.concurrency * self.need
@@ -0,0 +1,104 @@
+from tests.base import BaseCase
+from tests.test_lock_contention import Test as RedisContention
+
+import threading
+import time
+
+from resource_locker import Lock
+from resource_locker import NativeLockFactory
+from resource_locker import RedisLockFactory
+from resource_locker import RequirementNotMet
+from resource_locker import R
+from resource_locker.reporter import Aspects
+from resource_locker.reporter import Query
+from resource_locker.reporter import RedisReporter
+
+
+class Test(BaseCase):
+    factory_class = RedisLockFactory
+    lock_options = dict(fair=True, fair_ttl=5)
+
+    def setUp(self):
+        self.factory.clear_all()
+        RedisReporter()._clear_all()
+
+    def test_unsupported(self):
+        class Unfair(NativeLockFactory):
+            supports_fair_queue = False
+        with self.assertRaises(ValueError):
+            Lock('a', fair=True, lock_factory=Unfair())
+
+    def test_first_come_first_served(self):
+        pool = ['a', 'b', 'c']
+        holder = self.lock_class(R(*pool, need=2))
+        holder.acquire()
+
+        big = self.lock_class(
+            R(*pool, need=2),
+            block=True,
+            wake_on_release=True,
+            reporter_class=RedisReporter,
+        )
+        waiting = threading.Thread(target=big.acquire)
+        waiting.start()
+        time.sleep(0.2)
+        with self.subTest(part='free resource reserved for earlier waiter'):
+            with self.assertRaises(RequirementNotMet):
+                self.lock_class(R(*pool, need=1)).acquire()
+
+        holder.release()
+        waiting.join()
+        with self.subTest(part='earlier waiter served'):
+            self.assertEqual(2, len(big._requirements[0]))
+        big.release()
+
+        with self.subTest(part='queue wait reported by requirement size'):
+            q = Query()
+            self.assertEqual(1, q.aspect('need', 2, Aspects.lock_queue_count))
+            p50 = q.percentiles('need', 2, Aspects.lock_queue_wait)[50]
+            self.assertGreater(p50, 0.2)
+
+    def test_lapsed_ticket(self):
+        self.factory.queued_ahead('pool', 'crashed', 0, 2, 0.001)
+        time.sleep(0.01)
+        self.assertEqual(0, self.factory.queued_ahead('pool', 'live', 1, 1, 1))
+        self.factory.dequeue('pool', 'live')
+
+    def test_needs_ahead_summed(self):
+        self.factory.queued_ahead('pool', 'first', 0, 2, 1)
+        self.factory.queued_ahead('pool', 'second', 1, 1, 1)
+        self.assertEqual(3, self.factory.queued_ahead('pool', 'third', 2, 1, 1))
+        self.assertEqual(0, self.factory.queued_ahead('pool', 'first', 0, 2, 1))
+        for ticket in ('first', 'second', 'third'):
+            self.factory.dequeue('pool', ticket)
+
+    def test_free_resources_not_queued(self):
+        pool = [f'free-{i}' for i in range(8)]
+        go = threading.Barrier(8)
+        served = []
+
+        def client():
+            go.wait()
+            with self.lock_class(R(*pool, need=1), block=True):
+                served.append(time.monotonic())
+                time.sleep(0.05)
+
+        clients = [threading.Thread(target=client) for _ in pool]
+        start = time.monotonic()
+        [t.start() for t in clients]
+        [t.join() for t in clients]
+        self.assertEqual(8, len(served))
+        # waiting behind earlier tickets for resources that are free would take a backoff of 100ms or more
+        self.assertLess(max(served) - start, 0.1)
+
+
+class TestNative(Test):
+    factory_class = NativeLockFactory
+
+
+class TestFairContention(RedisContention):
+    lock_options = dict(fair=True)
+
+
+# lets not run things twice
+del RedisContention
@@ -0,0 +1,72 @@
+from tests.base import BaseCase
+from tests.test_lock_redis_factory import Test as RedisTests
+from tests.test_lock_contention import Test as RedisContention
+
+import os
+import socket
+import tempfile
+import time
+
+from resource_locker import FileLockFactory
+from resource_locker import R
+
+
+class FileCase(BaseCase):
+    factory_class = FileLockFactory
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.factory_class = lambda: FileLockFactory(path=cls.tmp.name)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+
+class TestCommon(FileCase, RedisTests):
+    pass
+
+
+class TestContention(FileCase, RedisContention):
+    pass
+
+
+class Test(FileCase):
+    def setUp(self):
+        self.factory.clear_all()
+
+    def test_lock_list(self):
+        with self.lock_class(R('a', 'b', 'c', need=2)):
+            self.assertEqual(2, len(self.factory.get_lock_list()))
+        self.assertListEqual([], self.factory.get_lock_list())
+
+    def test_expired_lease(self):
+        self.factory.write('a', dict(id='x', host=socket.gethostname(), pid=os.getpid(), expires=time.time() - 1))
+        self.assertListEqual([], self.factory.get_lock_list())
+        with self.lock_class('a'):
+            pass
+
+    def test_dead_holder(self):
+        pid = os.fork()
+        if not pid:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.factory.write('a', dict(id='x', host=socket.gethostname(), pid=pid, expires=None))
+        self.assertListEqual([], self.factory.get_lock_list(keys=['a']))
+
+    def test_other_process(self):
+        lock = self.factory.new_lock('a', expire=10)
+        self.assertTrue(lock.acquire(blocking=False))
+        pid = os.fork()
+        if not pid:
+            os._exit(0 if not FileLockFactory(path=self.tmp.name).new_lock('a').acquire(blocking=False) else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+        lock.release()
+
+
+# lets not run things twice
+del RedisTests
+del RedisContention
@@ -0,0 +1,83 @@
+from tests.base import BaseCase
+from tests.test_lock_contention import Test as RedisContention
+
+import threading
+import time
+
+from resource_locker import NativeLockFactory
+from resource_locker import RequirementNotMet
+
+
+class CountingFactory(NativeLockFactory):
+    def __init__(self):
+        super().__init__()
+        self.attempts = {}
+
+    def new_lock(self, key, **params):
+        self.attempts[key] = self.attempts.get(key, 0) + 1
+        return super().new_lock(key, **params)
+
+
+class Test(BaseCase):
+    factory_class = CountingFactory
+    retry = dict(
+        block=True, hold_while_waiting=10, wait_fixed=50, wait_exponential_max=None, wait_exponential_multiplier=None,
+        wait_random_min=None, wait_random_max=None,
+    )
+
+    def setUp(self):
+        self.factory.clear_all()
+        self.factory.attempts.clear()
+
+    def is_free(self, key):
+        return key not in self.factory.get_lock_list(keys=[key])
+
+    def wait_for(self, holder, release_after):
+        """Holds `holder` for a while, then releases it, returning the keys seen free shortly before"""
+        holder.acquire()
+        seen = set()
+
+        def check_then_release():
+            # several looks, as the waiter takes and drops locks between its attempts
+            for _ in range(5):
+                seen.update(key for key in ('a', 'b', 'c', 'd') if self.is_free(key))
+                time.sleep(0.02)
+            holder.release()
+        threading.Timer(release_after, check_then_release).start()
+        return seen
+
+    def test_keeps_earlier_keys(self):
+        seen = self.wait_for(self.lock_class('c'), 0.3)
+        with self.lock_class('a', 'c', **self.retry):
+            self.assertNotIn('a', seen)
+            self.assertLessEqual(self.factory.attempts['a'], 1)
+            self.assertGreater(self.factory.attempts['c'], 2)
+
+    def test_releases_later_keys(self):
+        seen = self.wait_for(self.lock_class('a'), 0.3)
+        with self.lock_class('d', 'a', **self.retry):
+            self.assertIn('d', seen)
+
+    def test_budget(self):
+        seen = self.wait_for(self.lock_class('c'), 0.5)
+        with self.lock_class('a', 'c', **dict(self.retry, hold_while_waiting=0.1)):
+            self.assertIn('a', seen)
+
+    def test_released_when_given_up(self):
+        self.lock_class('c').acquire()
+        with self.assertRaises(RequirementNotMet):
+            self.lock_class('a', 'c', hold_while_waiting=10).acquire()
+        self.assertTrue(self.is_free('a'))
+
+    def test_default_releases_all(self):
+        seen = self.wait_for(self.lock_class('c'), 0.3)
+        with self.lock_class('a', 'c', **dict(self.retry, hold_while_waiting=0)):
+            self.assertIn('a', seen)
+
+
+class TestContention(RedisContention):
+    lock_options = dict(hold_while_waiting=5)
+
+
+# lets not run things twice
+del RedisContention
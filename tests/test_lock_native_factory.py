@@ -1,6 +1,12 @@
+from tests.base import BaseCase
 from tests.test_lock_redis_factory import Test as RedisTests
+from tests.test_lock_redis_factory import TestWake as RedisWake
+from tests.test_lock_redis_factory import TestTtlAware as RedisTtlAware
 from tests.test_lock_contention import Test as RedisContention
 from resource_locker import NativeLockFactory
+from resource_locker import R
+
+import time
 
 
 class TestCommon(RedisTests):
@@ -15,6 +21,77 @@ class TestContention(RedisContention):
     concurrency_delay = 0.001
 
 
+class TestWake(RedisWake):
+    factory_class = NativeLockFactory
+
+
+class TestTtlAware(RedisTtlAware):
+    factory_class = NativeLockFactory
+
+
+class TestLeases(BaseCase):
+    factory_class = NativeLockFactory
+
+    def setUp(self):
+        self.factory.clear_all()
+
+    def test_only_held_kept(self):
+        for key in range(100):
+            with self.lock_class(key):
+                pass
+        self.assertDictEqual({}, self.factory.held)
+        self.assertListEqual([], self.factory.get_lock_list())
+
+    def test_expire(self):
+        lock = self.factory.new_lock('a', expire=0.05)
+        self.assertTrue(lock.acquire(blocking=False))
+        self.assertListEqual(['a'], self.factory.get_lock_list())
+        self.assertFalse(self.factory.new_lock('a').acquire(blocking=False))
+        time.sleep(0.1)
+        self.assertListEqual([], self.factory.get_lock_list())
+        with self.assertRaises(RuntimeError):
+            lock.release()
+
+    def test_blocked_until_expiry(self):
+        self.factory.new_lock('a', expire=0.1).acquire()
+        start = time.monotonic()
+        self.assertTrue(self.factory.new_lock('a').acquire(timeout=5))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_renewed(self):
+        lock = self.factory.new_lock('a', expire=0.15, auto_renewal=True)
+        lock.acquire()
+        time.sleep(0.4)
+        self.assertListEqual(['a'], self.factory.get_lock_list())
+        lock.release()
+        self.assertListEqual([], self.factory.get_lock_list())
+
+
+class LegacyFactory(NativeLockFactory):
+    supports_keyed_lookup = False
+
+    def get_lock_list(self):
+        return super().get_lock_list()
+
+
+class TestLegacyLookup(BaseCase):
+    factory_class = LegacyFactory
+
+    def setUp(self):
+        self.factory.clear_all()
+
+    def test_acquire(self):
+        with self.factory.new_lock('a'):
+            with self.lock_class(R('a', 'b')) as fulfilled:
+                self.assertEqual('b', fulfilled[0][0])
+
+    def test_states(self):
+        with self.factory.new_lock('a'):
+            self.assertListEqual(['a'], list(self.factory.get_lock_states(['a', 'b'])))
+
+
 # lets not run things twice
 del RedisTests
+del RedisWake
+del RedisTtlAware
 del RedisContention
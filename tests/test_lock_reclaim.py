@@ -0,0 +1,122 @@
+from tests.base import BaseCase
+
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+from resource_locker import Lock
+from resource_locker import RedisLockFactory
+from resource_locker import RequirementNotMet
+from resource_locker.factories.holder import Holder
+
+
+class Test(BaseCase):
+    factory_class = RedisLockFactory
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.factory.heartbeat_interval = 0.1
+
+    def setUp(self):
+        self.factory.clear_all()
+
+    def tearDown(self):
+        # leaving no locks for the tests that follow
+        self.factory.clear_all()
+
+    def hold(self, key, holder, beat=True):
+        """Takes a lock as a holder elsewhere would"""
+        lock = self.factory.new_lock(key, expire=120, id=holder.lock_id())
+        lock.acquire(blocking=False)
+        if not beat:
+            self.factory.client.hdel(self.factory.heartbeat_key, key)
+        return lock
+
+    def test_identity(self):
+        with Lock('a', lock_factory=self.factory, block=False):
+            holder = Holder.parse(self.factory.client.get('lock:a'))
+        self.assertEqual(os.getpid(), holder.pid)
+        self.assertEqual(Holder.this_process().host, holder.host)
+        self.assertEqual(self.factory.heartbeat_interval, holder.beat)
+
+    def test_heartbeats(self):
+        with Lock('a', lock_factory=self.factory, block=False, expire=120):
+            time.sleep(0.35)
+            state = self.factory.get_lock_states(['a'])['a']
+        self.assertLess(state.heartbeat_age, 0.2)
+        # the lease was not extended
+        self.assertLess(state.ttl, 119.7)
+
+    def test_heartbeats_opt_in(self):
+        factory = RedisLockFactory()
+        self.assertIsNone(factory.heartbeat_interval)
+        with Lock('a', lock_factory=factory, block=False):
+            self.assertEqual(0, Holder.parse(self.factory.client.get('lock:a')).beat)
+
+    def test_running_holder_kept(self):
+        # this process, as a holder whose heartbeats have stalled
+        self.hold('a', Holder.this_process(0.1), beat=False)
+        self.factory.reclaim(['a'], missed=1)
+        time.sleep(0.15)
+        self.assertListEqual([], self.factory.reclaim(['a'], missed=1))
+
+    def test_healthy_holder_kept(self):
+        holder = Lock('a', lock_factory=self.factory, block=False)
+        holder.acquire()
+        deadline = time.monotonic() + 0.8
+        while time.monotonic() < deadline:
+            self.assertListEqual([], self.factory.reclaim(['a'], missed=2))
+            time.sleep(0.05)
+        holder.release()
+
+    def test_missed_heartbeats(self):
+        elsewhere = Holder('elsewhere', 1, 1, 0.1)
+        self.hold('a', elsewhere)
+        start = time.monotonic()
+        with Lock(
+            'a', lock_factory=self.factory, reclaim_after=3, wait_fixed=50,
+            wait_random_min=None, wait_random_max=None, wait_exponential_max=None, wait_exponential_multiplier=None,
+        ):
+            waited = time.monotonic() - start
+        self.assertGreaterEqual(waited, 0.3)
+        self.assertLess(waited, 2)
+
+    def test_without_heartbeat(self):
+        self.hold('a', Holder('elsewhere', 1, 1, 0), beat=False)
+        self.hold('b', Holder('elsewhere', 1, 1, 0.1), beat=False)
+        self.factory.reclaim(['a', 'b'], missed=1)
+        time.sleep(0.15)
+        # a holder that does not heartbeat is never judged by it; one that does has missed its first
+        self.assertListEqual(['b'], self.factory.reclaim(['a', 'b'], missed=1))
+
+    def test_not_unless_unchanged(self):
+        elsewhere = Holder('elsewhere', 1, 1, 0.1)
+        lock = self.hold('a', elsewhere)
+        self.factory.reclaim(['a'], missed=1)
+        time.sleep(0.15)
+        # the holder beat since it was judged; only its original heartbeat was seen
+        self.factory.beat_all([lock])
+        self.assertListEqual(['a'], self.factory.get_lock_list(keys=['a']))
+
+    def test_crashed_holder(self):
+        code = textwrap.dedent('''
+            import os
+            from resource_locker import Lock
+            Lock('a', block=False).acquire()
+            os._exit(0)
+        ''')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.run([sys.executable, '-c', code], check=True, env=env)
+        self.assertListEqual(['a'], self.factory.get_lock_list(keys=['a']))
+        with self.assertLogs('resource_locker.factories.redis', 'WARNING'):
+            Lock('a', lock_factory=self.factory, block=False, reclaim_after=3).acquire()
+
+    def test_off_by_default(self):
+        # beyond the largest pid linux allows
+        self.hold('a', Holder(Holder.this_process().host, 2 ** 22 + 1, 1, 0))
+        with self.assertRaises(RequirementNotMet):
+            Lock('a', lock_factory=self.factory, block=False).acquire()
+        self.assertEqual('a', Lock('a', lock_factory=self.factory, block=False, reclaim_after=3).acquire()[0][0])
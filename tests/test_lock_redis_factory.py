@@ -1,5 +1,7 @@
 from tests.base import BaseCase
 
+import threading
+
 from resource_locker import RedisLockFactory
 from resource_locker import RequirementNotMet
 
@@ -70,3 +72,118 @@ class Test(BaseCase):
             b = self.lock_class('a', timeout=1)
             with self.assertRaises(RequirementNotMet):
                 b.acquire()
+
+    def test_acquire_many(self):
+        if not self.factory.supports_acquire_many:
+            self.skipTest('factory acquires keys one at a time')
+        with self.lock_class('b'):
+            with self.subTest(part='first free keys, in order'):
+                obtained = self.factory.acquire_many(['a', 'b', 'c', 'd'], 2, expire=10)
+                self.assertListEqual(['a', 'c'], [k for k, _ in obtained])
+                [lock.release() for _, lock in obtained]
+
+            with self.subTest(part='all or nothing'):
+                self.assertListEqual([], self.factory.acquire_many(['a', 'b', 'c'], 3, expire=10))
+                self.assertNotIn('a', self.factory.get_lock_list())
+
+    def test_skips_locked(self):
+        a = P('a')
+        b = P('b')
+        c = P('c')
+        with self.lock_class('a'):
+            with self.lock_class(R(a, b, c, need=2)):
+                self.assertFalse(a.is_fulfilled)
+                self.assertTrue(b.is_fulfilled and c.is_fulfilled)
+
+    def test_lock_states(self):
+        self.factory.clear_all()
+        lock = self.factory.new_lock('a', expire=60)
+        lock.acquire(blocking=False)
+        try:
+            states = self.factory.get_lock_states(['a', 'b'])
+            self.assertListEqual(['a'], list(states))
+            self.assertLess(55, states['a'].ttl)
+            self.assertGreaterEqual(60, states['a'].ttl)
+            self.assertGreater(5, states['a'].heartbeat_age)
+        finally:
+            lock.release()
+        self.assertDictEqual({}, self.factory.get_lock_states(['a']))
+
+    def test_lock_list(self):
+        self.factory.clear_all()
+        with self.lock_class(R('a', 'b', need=2), 'c'):
+            with self.subTest(part='all'):
+                self.assertTrue({'a', 'b', 'c'} <= set(self.factory.get_lock_list()))
+            with self.subTest(part='candidates'):
+                self.assertListEqual(['b', 'c'], self.factory.get_lock_list(keys=['x', 'b', 'c']))
+        with self.subTest(part='released'):
+            self.assertListEqual([], self.factory.get_lock_list(keys=['a', 'b', 'c']))
+
+
+class TestIndex(BaseCase):
+    factory_class = RedisLockFactory
+
+    def test_release_unindexes(self):
+        self.factory.clear_all()
+        with self.lock_class('a'):
+            self.assertListEqual(['a'], self.factory.get_lock_list())
+        self.assertListEqual([], self.factory.get_lock_list())
+
+    def test_stale_pruned(self):
+        self.factory.clear_all()
+        self.factory.client.zadd(self.factory.index_key, {'crashed': 1})
+        self.factory.client.hset(self.factory.heartbeat_key, 'crashed', 1)
+        with self.subTest(part='candidates'):
+            self.assertListEqual([], self.factory.get_lock_list(keys=['crashed']))
+            self.assertEqual(0, self.factory.client.zcard(self.factory.index_key))
+            self.assertEqual(0, self.factory.client.hlen(self.factory.heartbeat_key))
+        self.factory.client.zadd(self.factory.index_key, {'crashed': 1})
+        with self.subTest(part='all'):
+            self.assertListEqual([], self.factory.get_lock_list())
+            self.assertEqual(0, self.factory.client.zcard(self.factory.index_key))
+
+    def test_without_expiry(self):
+        self.factory.clear_all()
+        with self.factory.new_lock('forever', expire=None):
+            self.assertListEqual(['forever'], self.factory.get_lock_list(keys=['forever']))
+
+
+class TestWake(BaseCase):
+    factory_class = RedisLockFactory
+    backoff = dict(block=True, wait_fixed=5000, wait_exponential_max=None, wait_exponential_multiplier=None)
+
+    def time_to_acquire(self, **options):
+        holder = self.lock_class('a')
+        holder.acquire()
+        threading.Timer(0.2, holder.release).start()
+        waiter = self.lock_class('a', **self.backoff, **options)
+        with waiter:
+            pass
+        return waiter.acquire_timer.duration
+
+    def test_woken_by_release(self):
+        self.factory.clear_all()
+        self.assertLess(self.time_to_acquire(wake_on_release=True), 2)
+
+    def test_backoff_without(self):
+        self.factory.clear_all()
+        self.assertGreater(self.time_to_acquire(), 4)
+
+
+class TestTtlAware(BaseCase):
+    factory_class = RedisLockFactory
+    backoff = TestWake.backoff
+
+    def time_to_acquire(self, **options):
+        self.factory.clear_all()
+        self.factory.new_lock('a', expire=1).acquire(blocking=False)
+        waiter = self.lock_class('a', **self.backoff, **options)
+        with waiter:
+            pass
+        return waiter.acquire_timer.duration
+
+    def test_until_lapse(self):
+        self.assertLess(self.time_to_acquire(ttl_aware_wait=True), 3)
+
+    def test_backoff_without(self):
+        self.assertGreater(self.time_to_acquire(), 4)
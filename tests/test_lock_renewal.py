@@ -0,0 +1,33 @@
+from tests.base import BaseCase
+
+import threading
+import time
+
+from resource_locker import R
+from resource_locker import RedisLockFactory
+
+
+class Test(BaseCase):
+    factory_class = RedisLockFactory
+    lock_options = dict(expire=1, auto_renewal=True)
+
+    def setUp(self):
+        self.factory.clear_all()
+
+    def test_renewed_by_one_thread(self):
+        with self.lock_class(R('a', 'b', need=2)):
+            threads = threading.active_count()
+            with self.lock_class('c'), self.lock_class('d'):
+                self.assertEqual(threads, threading.active_count())
+                time.sleep(2.5)
+                self.assertListEqual(['a', 'b', 'c', 'd'], sorted(self.factory.get_lock_list(keys='abcd')))
+        self.assertListEqual([], self.factory.get_lock_list(keys='abcd'))
+        self.assertEqual(0, len(self.factory.renewer.locks))
+
+    def test_lost(self):
+        lock = self.lock_class('a')
+        lock.acquire()
+        self.factory.client.delete('lock:a')
+        with self.assertLogs('resource_locker.factories.renewal', 'WARNING'):
+            self.factory.renewer.renew(list(self.factory.renewer.locks.values()))
+        self.assertEqual(0, len(self.factory.renewer.locks))
@@ -0,0 +1,129 @@
+from tests.base import BaseCase
+from tests.test_lock_redis_factory import Test as RedisTests
+from tests.test_lock_redis_factory import TestWake as RedisWake
+from tests.test_lock_redis_factory import TestTtlAware as RedisTtlAware
+from tests.test_lock_contention import Test as RedisContention
+
+import os
+import unittest
+
+from resource_locker import QuorumRedisLockFactory
+from resource_locker import R
+from resource_locker import ShardedRedisLockFactory
+from resource_locker.factories.sharded import HashRing
+
+# separate redis servers may be given, e.g. redis://localhost:6380,redis://localhost:6381,redis://localhost:6382
+# otherwise, databases of the local server stand in for them
+servers = os.environ.get('RESOURCE_LOCKER_SHARDS', 'redis://localhost/2,redis://localhost/3,redis://localhost/4')
+servers = servers.split(',')
+
+
+def sharded():
+    return ShardedRedisLockFactory(servers)
+
+
+def quorum():
+    return QuorumRedisLockFactory(servers)
+
+
+class TestCommon(RedisTests):
+    factory_class = staticmethod(sharded)
+
+
+class TestContention(RedisContention):
+    factory_class = staticmethod(sharded)
+
+
+class TestWake(RedisWake):
+    factory_class = staticmethod(sharded)
+
+
+class TestTtlAware(RedisTtlAware):
+    factory_class = staticmethod(sharded)
+
+
+class TestSharding(BaseCase):
+    factory_class = staticmethod(sharded)
+
+    def test_spread(self):
+        self.factory.clear_all()
+        keys = [f'spread-{i}' for i in range(30)]
+        with self.lock_class(R(*keys, need=30)):
+            held = [len(shard.get_lock_list()) for shard in self.factory.shards.values()]
+            self.assertEqual(30, sum(held))
+            self.assertTrue(all(held))
+            self.assertEqual(30, len(self.factory.get_lock_list()))
+
+    def test_acquire_many_across_shards(self):
+        self.factory.clear_all()
+        keys = [f'many-{i}' for i in range(12)]
+        self.assertGreater(len(self.factory.ring.group(keys)), 1)
+        obtained = self.factory.acquire_many(keys, 5, expire=10)
+        try:
+            self.assertListEqual(keys[:5], [key for key, _ in obtained])
+            with self.subTest(part='surplus released'):
+                self.assertListEqual(keys[:5], self.factory.get_lock_list(keys=keys))
+        finally:
+            for _, lock in obtained:
+                lock.release()
+        with self.subTest(part='all or nothing'):
+            self.assertListEqual([], self.factory.acquire_many(keys, 13, expire=10))
+            self.assertListEqual([], self.factory.get_lock_list(keys=keys))
+
+
+class TestRing(unittest.TestCase):
+    def test_balanced(self):
+        ring = HashRing(['a', 'b', 'c'])
+        counts = [len(keys) for keys in ring.group(range(30000)).values()]
+        self.assertGreater(min(counts), 7000)
+
+    def test_adding_moves_few(self):
+        keys = range(10000)
+        ring = HashRing(['a', 'b', 'c'])
+        before = {key: ring.node(key) for key in keys}
+        ring.add('d')
+        moved = [key for key in keys if ring.node(key) != before[key]]
+        self.assertLess(len(moved), 3500)
+        self.assertTrue(all(ring.node(key) == 'd' for key in moved))
+
+
+class TestQuorumCommon(RedisTests):
+    factory_class = staticmethod(quorum)
+
+
+class TestQuorumContention(RedisContention):
+    factory_class = staticmethod(quorum)
+
+
+class TestQuorum(BaseCase):
+    factory_class = staticmethod(quorum)
+
+    def test_majority(self):
+        self.factory.clear_all()
+        lock = self.factory.new_lock('a', expire=10)
+        self.assertTrue(lock.acquire(blocking=False))
+        try:
+            # a minority of servers taken by someone else does not stop the lock
+            self.factory.nodes[0].new_lock('b', expire=10).acquire(blocking=False)
+            self.assertTrue(self.factory.new_lock('b', expire=10).acquire(blocking=False))
+            with self.subTest(part='majority taken'):
+                self.assertFalse(self.factory.new_lock('a', expire=10).acquire(blocking=False))
+            with self.subTest(part='listed'):
+                self.assertListEqual(['a', 'b'], self.factory.get_lock_list())
+            with self.subTest(part='states'):
+                self.assertLess(9, self.factory.get_lock_states(['a'])['a'].ttl)
+        finally:
+            lock.release()
+
+    def test_server_down(self):
+        factory = QuorumRedisLockFactory(servers[:2] + ['redis://localhost:1'])
+        factory.clear_all()
+        with self.lock_class('a', lock_factory=factory):
+            self.assertListEqual(['a'], factory.get_lock_list())
+
+
+# lets not run things twice
+del RedisTests
+del RedisWake
+del RedisTtlAware
+del RedisContention
@@ -0,0 +1,64 @@
+from tests.base import BaseCase
+
+from resource_locker import HistoryPrioritiser
+from resource_locker import Lock
+from resource_locker import NativeLockFactory
+from resource_locker import R
+from resource_locker.reporter import Query
+from resource_locker.reporter import RedisReporter
+
+
+class Test(BaseCase):
+    def setUp(self):
+        RedisReporter()._clear_all()
+
+    def report(self, key, requests, fails, hold):
+        reporter = RedisReporter(key=key)
+        with reporter.batch():
+            for i in range(requests):
+                reporter.lock_requested()
+                if i < fails:
+                    reporter.lock_failed()
+                else:
+                    reporter.lock_released(hold)
+
+    def keys(self, prioritiser, r, known_locked=()):
+        return [p.key for p in r.prioritised_potentials(known_locked, prioritiser)]
+
+    def test_prefers_history_of_free(self):
+        self.report('a', requests=10, fails=8, hold=5)
+        self.report('b', requests=10, fails=2, hold=5)
+        self.report('c', requests=10, fails=0, hold=5)
+        prioritiser = HistoryPrioritiser()
+        with self.subTest(part='scored'):
+            self.assertListEqual(['c', 'b', 'a'], self.keys(prioritiser, R('a', 'b', 'c')))
+        with self.subTest(part='known locked last'):
+            self.assertListEqual(['b', 'a', 'c'], self.keys(prioritiser, R('a', 'b', 'c'), ['c']))
+
+    def test_cached(self):
+        prioritiser = HistoryPrioritiser(ttl=60)
+        self.keys(prioritiser, R('a', 'b'))
+        self.report('a', requests=10, fails=8, hold=5)
+        self.keys(prioritiser, R('a', 'b'))
+        self.assertEqual((0, 0), prioritiser.score('a'))
+
+    def test_recent_weighs_more(self):
+        prioritiser = HistoryPrioritiser(ttl=0, decay=0.1)
+        self.report('a', requests=10, fails=10, hold=1)
+        self.report('b', requests=10, fails=0, hold=1)
+        self.keys(prioritiser, R('a', 'b'))
+        self.report('a', requests=10, fails=0, hold=1)
+        self.report('b', requests=10, fails=10, hold=1)
+        self.assertListEqual(['a', 'b'], self.keys(prioritiser, R('a', 'b')))
+
+    def test_history_unavailable(self):
+        class Broken(Query):
+            def all_aspects_of(self, tag, values):
+                raise ConnectionError()
+        prioritiser = HistoryPrioritiser(query=Broken())
+        self.assertListEqual(['a'], self.keys(prioritiser, R('a', 'b'), ['b'])[:1])
+
+    def test_lock_option(self):
+        self.report('a', requests=10, fails=10, hold=1)
+        with Lock(R('a', 'b'), lock_factory=NativeLockFactory(), prioritiser=HistoryPrioritiser()) as r:
+            self.assertListEqual(['b'], list(r[0]))
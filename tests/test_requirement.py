@@ -1,5 +1,8 @@
 from tests.base import BaseCase
 
+import gc
+import weakref
+
 from resource_locker import RequirementNotMet
 
 from resource_locker import R
@@ -45,6 +48,27 @@ class Test(BaseCase):
         with self.subTest(part='zero'):
             R(a, b, c, need=0).validate()
 
+    def test_counts(self):
+        a, b, c = P('a'), P('b').fulfill(), P('c')
+        r1 = R(a, b, c)
+        r2 = R(c, a)
+        with self.subTest(part='added'):
+            self.assertEqual((1, 0), r1.count())
+        c.fulfill()
+        a.reject()
+        with self.subTest(part='shared potentials'):
+            self.assertEqual((2, 1), r1.count())
+            self.assertEqual((1, 1), r2.count())
+            self.assertListEqual(['b', 'c'], list(r1))
+        a.fulfill()
+        with self.subTest(part='in order'):
+            self.assertListEqual(['a', 'b', 'c'], list(r1))
+            self.assertListEqual(['a', 'c'], r1[::2])
+        r1.reset()
+        with self.subTest(part='reset'):
+            self.assertEqual((0, 0), r1.count())
+            self.assertEqual((0, 0), r2.count())
+
     def test_prioritisation(self):
         r = R('a', 'b', 'c', 'd')
         prioritised = [p.key for p in r.prioritised_potentials(['c', 'b'])]
@@ -53,6 +77,18 @@ class Test(BaseCase):
         self.assertIn('d', prioritised[0:2])
         self.assertListEqual(prioritised[2:], ['b', 'c'])
 
+    def test_shared_potential_owners(self):
+        a = P('a')
+        discarded = weakref.ref(R(a))
+        gc.collect()
+        with self.subTest(part='requirements are not kept alive'):
+            self.assertIsNone(discarded())
+        r = R(a)
+        a.fulfill()
+        with self.subTest(part='only live requirements are kept informed'):
+            self.assertEqual(1, len(a._owners))
+            self.assertEqual((1, 0), r.count())
+
     def test_iter(self):
         ids = ['a', 'b', 'c']
         r = R(*ids)